@@ -0,0 +1,252 @@
+# Alert engine throughput with many rules: the indexed AlertEngine against
+# one that checks every rule on every reading, over the same stream of
+# random-walk readings. Both must raise the same events. Then delivery:
+# the events in batches to a local webhook, and to a command.
+#
+#   python benchmarks/bench_alerts.py [rules] [stations] [minutes] [checked]
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.alerts import (DERIVED_FIELDS, AlertDispatcher, AlertEngine, CommandSink, Rule, WebhookSink,
+                                _derived, parse_rule)
+from pm2aqi_core.aqi import CATEGORIES
+
+# field -> (start, step, low, high) of the random walk
+WALKS = {
+    'pm25': (12.0, 3.0, 0.0, 250.0),
+    'windgustmph': (10.0, 4.0, 0.0, 70.0),
+    'tempf': (60.0, 1.5, 10.0, 110.0),
+    'humidity': (50, 3, 5, 100),
+    'tempinf': (68.0, 0.5, 30.0, 90.0),
+    'uv': (2, 1, 0, 11),
+}
+RULE_FIELDS = tuple(WALKS) + ('aqi', 'aqi_category')
+# Fields alerted on when low as well as high; the rest only when high
+BOTH_WAYS = ('tempf', 'humidity', 'tempinf')
+
+
+class NaiveEngine(AlertEngine):
+    # Every rule for the station, on every reading
+    def _reading(self, mac, ts, reading, events):
+        values = self.values.setdefault(mac, {})
+        derived = None
+        for field in self.fields:
+            if field in DERIVED_FIELDS:
+                if derived is None:
+                    derived = _derived(reading.get('pm25'))
+                value = derived[field]
+            else:
+                value = reading.get(field)
+            if value is not None:
+                values[field] = value
+        for rid, rule in enumerate(self.rules):
+            if rule.mac is None or rule.mac == mac:
+                self._evaluate(rid, mac, ts, reading, values, events)
+
+
+def make_macs(count):
+    return [f"00:0E:C6:00:{i // 256:02X}:{i % 256:02X}" for i in range(count)]
+
+
+def make_rules(count, macs, rng):
+    rules = []
+    for n in range(count):
+        field = rng.choice(RULE_FIELDS)
+        op = rng.choice(('>', '>=', '<', '<=') if field in BOTH_WAYS else ('>', '>='))
+        up = op in ('>', '>=')
+        # Alert levels sit away from the usual values, as real ones do
+        if field == 'aqi_category':
+            threshold = rng.randrange(2, len(CATEGORIES))
+            clear = threshold - 1
+        else:
+            start, _, low, high = (57, 0, 0, 300) if field == 'aqi' else WALKS[field]
+            if up:
+                threshold = round(rng.uniform(start + (high - start) * 0.25, high), 1)
+            else:
+                threshold = round(rng.uniform(low, start - (start - low) * 0.25), 1)
+            clear = threshold - rng.uniform(1, 5) if up else threshold + rng.uniform(1, 5)
+        duration = rng.choice((0, 0, 5, 10, 30)) * 60_000
+        rules.append(Rule(f"rule-{n}", field, op, threshold, duration,
+                          clear if rng.random() < 0.5 else None,
+                          rng.choice(macs) if rng.random() < 0.2 else None))
+    return rules
+
+
+def make_stream(macs, minutes, rng):
+    # One reading per station per minute, values on a random walk that
+    # drifts back toward its start
+    state = {mac: {f: start for f, (start, _, _, _) in WALKS.items()} for mac in macs}
+    start = 1_750_000_000_000
+    readings = []
+    for minute in range(minutes):
+        for mac in macs:
+            values = state[mac]
+            for field, (begin, step, low, high) in WALKS.items():
+                value = values[field] + (begin - values[field]) * 0.05 + rng.uniform(-step, step)
+                value = min(max(value, low), high)
+                values[field] = round(value) if isinstance(step, int) else round(value, 1)
+            readings.append(dict(values, mac=mac, name=mac[-5:], dateutc=start + minute * 60_000))
+    return readings
+
+
+def run(engine, readings, stations):
+    # The first reading from a station checks every rule on it; after that
+    # only crossed and due ones. Returns the events and (seconds, rule
+    # checks) for the first readings and for the rest.
+    timings = []
+    events = []
+    for part in (readings[:stations], readings[stations:]):
+        evaluated = engine.evaluated
+        started = time.perf_counter()
+        events += engine.process([dict(r) for r in part])
+        timings.append((time.perf_counter() - started, engine.evaluated - evaluated))
+    return events, timings
+
+
+def check_rules():
+    gusts = parse_rule('gusts: windgustmph > 40 clear 35')
+    usg = parse_rule('usg @ 00:0e:c6:00:00:01: aqi_category >= "Unhealthy for Sensitive Groups" for 10m')
+    assert (gusts.field, gusts.threshold, gusts.clear, gusts.mac) == ('windgustmph', 40, 35, None)
+    assert (usg.field, usg.threshold, usg.duration_ms, usg.mac) == ('aqi_category', 2, 600_000, '00:0E:C6:00:00:01')
+    for bad in ('pm25 >> 3', 'nosuchfield > 3', 'tempf > 40 clear 45', 'pm25 > "Good"'):
+        try:
+            parse_rule(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"parsed {bad!r}")
+    engine = AlertEngine([gusts, usg])
+    mac = usg.mac
+    gust_values = (30, 41, 38, 36, 34, 45)
+    events = []
+    for minute, gust in enumerate(gust_values):
+        events += engine.process([{'mac': mac, 'dateutc': minute * 60_000, 'windgustmph': gust, 'pm25': 5}])
+    # Fires past 40, holds down to 35, fires again
+    assert [(e['state'], e['value']) for e in events] == [('firing', 41), ('resolved', 34), ('firing', 45)], events
+    events = []
+    for minute in range(20):
+        pm25 = 40 if minute < 15 else 5
+        events += engine.process([{'mac': mac, 'dateutc': (10 + minute) * 60_000, 'pm25': pm25}])
+    # Fires only once it has held for 10 minutes
+    assert [(e['rule'], e['state'], e['ts'] - e['since']) for e in events] == [
+        ('usg', 'firing', 600_000), ('usg', 'resolved', 300_000)], events
+    assert events[0]['value'] == 'Unhealthy for Sensitive Groups', events[0]
+
+
+class Receiver:
+    # Minimal HTTP server counting POSTed batches
+    def __init__(self):
+        self.batches = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/alerts"
+
+    async def _handle(self, reader, writer):
+        import json
+
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.decode('latin-1').split('\r\n'):
+                    if line.lower().startswith('content-length:'):
+                        length = int(line.split(':', 1)[1])
+                self.batches.append(json.loads(await reader.readexactly(length)))
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+async def deliver(events, max_batch):
+    receiver = Receiver()
+    url = await receiver.start()
+    dispatcher = AlertDispatcher(WebhookSink(url), max_batch=max_batch, max_delay=0.05)
+    started = time.perf_counter()
+    # As a poll loop would: a few at a time
+    for i in range(0, len(events), 7):
+        dispatcher.submit(events[i:i + 7])
+        await asyncio.sleep(0)
+    await dispatcher.close()
+    webhook = time.perf_counter() - started
+    receiver.close()
+    received = [event for batch in receiver.batches for event in batch]
+    assert received == events, (len(received), len(events))
+    assert all(len(batch) <= max_batch for batch in receiver.batches)
+    assert dispatcher.failed == 0, dispatcher.error
+
+    # A lone event waits at most max_delay
+    late = AlertDispatcher(CommandSink('cat > /dev/null'), max_delay=0.1)
+    started = time.perf_counter()
+    late.submit(events[:1])
+    while not late.delivered:
+        await asyncio.sleep(0.01)
+    waited = time.perf_counter() - started
+    command = AlertDispatcher(CommandSink('cat > /dev/null'), max_batch=max_batch, max_delay=0.05)
+    command.submit(events[:max_batch * 20])
+    await command.close()
+    await late.close()
+    failing = AlertDispatcher(CommandSink('exit 3'), max_delay=0)
+    failing.submit(events[:5])
+    await failing.close()
+    assert command.delivered == min(len(events), max_batch * 20), command.delivered
+    assert failing.failed == 5 and 'exited with 3' in failing.error, failing.error
+    return receiver.batches, webhook, waited, command
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    stations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    minutes = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+    checked = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+    # Whole minutes, so the naive engine sees every reading the events it
+    # is compared on came from
+    checked = max(checked // stations, 2) * stations
+    check_rules()
+    rng = random.Random(24)
+    macs = make_macs(stations)
+    rules = make_rules(count, macs, rng)
+    readings = make_stream(macs, minutes, rng)
+    steady = len(readings) - stations
+
+    naive = NaiveEngine(rules)
+    naive_events, ((_, _), (naive_time, _)) = run(naive, readings[:checked], stations)
+    engine = AlertEngine(rules)
+    events, ((first_time, first_checks), (steady_time, steady_checks)) = run(engine, readings, stations)
+    sample = [e for e in events if e['ts'] <= readings[checked - 1]['dateutc']]
+    # The naive engine is slow, so it only sees the first readings
+    assert len(sample) == len(naive_events) and sample == naive_events, "indexed and naive engines disagree"
+    assert naive_events, "no alerts raised"
+    naive_each = naive_time / (checked - stations)
+    indexed_each = steady_time / steady
+    per_reading = steady_checks / steady
+    print(f"rules   : {count:,} ({sum(r.mac is not None for r in rules):,} on one station, "
+          f"{sum(r.duration_ms > 0 for r in rules):,} with a duration) over {len(RULE_FIELDS)} fields")
+    print(f"first   : {stations} stations' first readings in {first_time * 1e3:.0f} ms, "
+          f"{first_checks / stations:,.0f} rule checks each")
+    print(f"naive   : {1 / naive_each:>8,.0f} readings/s, {naive_each * 1e6:>6,.0f} µs each, "
+          f"{naive.evaluated / checked:,.0f} rule checks per reading")
+    print(f"indexed : {1 / indexed_each:>8,.0f} readings/s, {indexed_each * 1e6:>6,.0f} µs each, "
+          f"{per_reading:,.1f} rule checks per reading ({naive_each / indexed_each:.0f}x)")
+    print(f"events  : {len(events):,} from {len(readings):,} readings, the first {len(sample):,} identical to "
+          f"the naive engine's; {len(engine.active()):,} firing at the end")
+
+    batches, webhook, waited, command = asyncio.run(deliver(events, 100))
+    print(f"webhook : {len(events):,} events in {len(batches)} POSTs in {webhook * 1e3:.0f} ms")
+    print(f"command : {command.delivered:,} events in {command.batches} runs; a lone event waited {waited * 1e3:.0f} ms")
+    assert indexed_each * 10 < naive_each, (indexed_each, naive_each)
+    assert per_reading < count / 100, per_reading
+    assert waited < 1.0, waited
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Compare the per-value if/elif AQI chain, the bisect engine that replaced
+# it and the lookup tables, one value at a time and vectorized. All of them
+# must agree on the pre-2024 table, and every entry of every standard's
+# tables must match an exact reference computed from the breakpoints.
+# Timings are the median of several runs and are only reported: one value
+# at a time, the table is a modest constant factor ahead of the chain.
+#
+#   python benchmarks/bench_aqi.py [N] [repeats]
+import math
+import os
+import statistics
+import sys
+import time
+from bisect import bisect_left
+from fractions import Fraction
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.aqi import (OUT_OF_RANGE, aqi_array, aqi_from_concentration, aqi_from_pm25, aqi_from_pm25_array,
+                             overall_aqi, pollutants)
+from pm2aqi_core.standards import STANDARDS
+
+
+def legacy_aqi_from_pm25(pm_value):
+    # The if/elif chain formerly copied into PM2AQIApp and Dashboard
+    if 0 <= pm_value <= 12:
+        aqi = int((50/12) * pm_value)
+        return aqi, "Good", "#43a047"
+    elif 12 < pm_value <= 35.4:
+        aqi = int(((100-51)/(35.4-12.1)) * (pm_value-12.1) + 51)
+        return aqi, "Moderate", "#fbc02d"
+    elif 35.4 < pm_value <= 55.4:
+        aqi = int(((150-101)/(55.4-35.5)) * (pm_value-35.5) + 101)
+        return aqi, "Unhealthy for Sensitive Groups", "#fb8c00"
+    elif 55.4 < pm_value <= 150.4:
+        aqi = int(((200-151)/(150.4-55.5)) * (pm_value-55.5) + 151)
+        return aqi, "Unhealthy", "#e53935"
+    elif 150.4 < pm_value <= 250.4:
+        aqi = int(((300-201)/(250.4-150.5)) * (pm_value-150.5) + 201)
+        return aqi, "Very Unhealthy", "#8e24aa"
+    elif 250.4 < pm_value <= 350.4:
+        aqi = int(((400-301)/(350.4-250.5)) * (pm_value-250.5) + 301)
+        return aqi, "Hazardous", "#6d4c41"
+    elif 350.4 < pm_value <= 500.4:
+        aqi = int(((500-401)/(500.4-350.5)) * (pm_value-350.5) + 401)
+        return aqi, "Beyond AQI", "#212121"
+    else:
+        return "--", "Out of Range", "#e57373"
+
+
+_, _, _CATEGORIES_2012, _COLORS_2012, _, _TABLES_2012 = STANDARDS['us-2012']
+_BANDS_2012 = _TABLES_2012['pm25'][2]
+_UPPER_2012 = tuple(band[1] for band in _BANDS_2012)
+
+
+def bisect_aqi_from_pm25(pm_value):
+    # The breakpoint-table engine before the lookup tables: a bisect over
+    # the band tops, then the interpolation
+    if not 0 <= pm_value <= _UPPER_2012[-1]:
+        return OUT_OF_RANGE
+    idx = bisect_left(_UPPER_2012, pm_value)
+    c_lo, c_hi, i_lo, i_hi, category = _BANDS_2012[idx]
+    aqi = int(((i_hi - i_lo) / (c_hi - c_lo)) * (pm_value - c_lo) + i_lo)
+    return aqi, _CATEGORIES_2012[category], _COLORS_2012[category]
+
+
+def reference(k, standard, pollutant):
+    # AQI of k resolution steps, from the breakpoints in exact arithmetic
+    _, rounding, _, _, _, tables = STANDARDS[standard]
+    _, decimals, bands = tables[pollutant]
+    c = Fraction(k, 10 ** decimals)
+    for c_lo, c_hi, i_lo, i_hi, category in bands:
+        lo, hi = Fraction(str(c_lo)), Fraction(str(c_hi))
+        if lo <= c <= hi:
+            x = i_lo + (i_hi - i_lo) * (c - lo) / (hi - lo)
+            if rounding == 'round':
+                return math.floor(x + Fraction(1, 2)), category
+            return (math.ceil(x) if rounding == 'ceil' else math.floor(x)), category
+    return None
+
+
+def check_tables():
+    # Every step of every table, plus a value just below each step, which
+    # must truncate to the step below it
+    entries = 0
+    for standard in STANDARDS:
+        for pollutant in pollutants(standard):
+            _, decimals, bands = STANDARDS[standard][5][pollutant]
+            scale = 10 ** decimals
+            top = round(bands[-1][1] * scale)
+            steps = np.arange(top + 1)
+            aqi, idx, _ = aqi_array(steps / scale, pollutant, standard)
+            for k in range(top + 1):
+                expected = reference(k, standard, pollutant)
+                assert expected == (aqi[k], idx[k]), (standard, pollutant, k, expected, aqi[k], idx[k])
+                value = k / scale
+                assert aqi_from_concentration(value, pollutant, standard)[0] == expected[0], (standard, pollutant, k)
+                if k:
+                    below = aqi_from_concentration((k - 0.5) / scale, pollutant, standard)[0]
+                    assert below == reference(k - 1, standard, pollutant)[0], (standard, pollutant, k)
+            over = (top + 1) / scale
+            assert aqi_from_concentration(over, pollutant, standard) == OUT_OF_RANGE, (standard, pollutant)
+            entries += top + 1
+    # 2024 EPA: "Good" ends at 9.0, and 12.05 is Moderate rather than in a gap
+    assert aqi_from_pm25(9.0)[:2] == (50, "Good") and aqi_from_pm25(9.1)[:2] == (51, "Moderate")
+    assert aqi_from_pm25(12.05) == aqi_from_pm25(12.0)
+    assert aqi_from_pm25(325.4)[0] == 500 and aqi_from_pm25(325.5) == OUT_OF_RANGE
+    assert overall_aqi({'pm25': 12.0, 'pm10': 160, 'o3': 0.05})[3] == 'pm10'
+    assert overall_aqi({'pm25': 12.0, 'o3': 0.3}) == OUT_OF_RANGE + ('o3',)
+    return entries
+
+
+def timed(func, *args, repeats=1):
+    # (result, median seconds over the repeats)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    entries = check_tables()
+    rng = np.random.default_rng(42)
+    values = np.round(rng.gamma(2.0, 15.0, n), 1)
+    values[::997] = 600.0  # sprinkle some out-of-range readings
+    as_list = values.tolist()
+
+    legacy, t_legacy = timed(lambda: [legacy_aqi_from_pm25(v) for v in as_list], repeats=repeats)
+    bisected, t_bisect = timed(lambda: [bisect_aqi_from_pm25(v) for v in as_list], repeats=repeats)
+    table, t_table = timed(lambda: [aqi_from_pm25(v, 'us-2012') for v in as_list], repeats=repeats)
+    (aqi, idx, colors), t_batch = timed(aqi_from_pm25_array, values, 'us-2012', repeats=repeats)
+
+    # Every engine must agree with the legacy chain value for value
+    assert bisected == legacy, "bisect engine differs from legacy path"
+    assert table == legacy, "lookup table differs from legacy path"
+    expected = np.array([-1 if a == "--" else a for a, _, _ in legacy])
+    assert np.array_equal(expected, aqi), "batch AQI differs from legacy path"
+    assert [c for _, _, c in legacy] == colors.tolist(), "batch colors differ"
+
+    print(f"{entries:,} table entries over {len(STANDARDS)} standards match the exact reference")
+    print(f"{n:,} readings, pre-2024 US table, median of {repeats} runs")
+    print(f"if/elif chain    : {t_legacy:8.3f} s  ({n / t_legacy:,.0f}/s)")
+    print(f"bisect + formula : {t_bisect:8.3f} s  ({n / t_bisect:,.0f}/s)")
+    print(f"lookup table     : {t_table:8.3f} s  ({n / t_table:,.0f}/s, {t_legacy / t_table:.2f}x the chain)")
+    print(f"vectorized batch : {t_batch:8.3f} s  ({n / t_batch:,.0f}/s, {t_legacy / t_batch:.1f}x the chain)")
+    print("lookup table per standard and pollutant, values spread over each table:")
+    for standard in STANDARDS:
+        for pollutant in pollutants(standard):
+            top = STANDARDS[standard][5][pollutant][2][-1][1]
+            spread = (values / 600.0 * top * 1.05).tolist()
+            _, t = timed(lambda: [aqi_from_concentration(v, pollutant, standard) for v in spread])
+            print(f"  {standard:8} {pollutant:5} {n / t:>12,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
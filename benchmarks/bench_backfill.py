@@ -0,0 +1,118 @@
+# Backfill several stations from the stub's synthetic history pages under a
+# per-key rate limit, then run again to show it resumes from storage. Then
+# cut a backfill short after its newest pages, as closing the app would,
+# and check the next run fills the rest of the gap. Last, overrun a server
+# that gives Retry-After as an HTTP-date and check the backfill backs off.
+#
+#   python benchmarks/bench_backfill.py [devices] [days] [rate]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.backfill import Backfiller
+from pm2aqi_core.history import HistoryStore, HistoryWriter
+from pm2aqi_core.http import AsyncHTTPClient
+from stub_server import StubAmbientServer, sample_device
+
+
+async def backfill(server, path, devices, rate, stop_after=None, errors=None):
+    # stop_after: cancel once that many pages have been requested; errors:
+    # a list to append the backfiller's error count to
+    http = AsyncHTTPClient()
+    writer = HistoryWriter(path)
+    store = HistoryStore(path)
+    backfiller = Backfiller(http, 'key', 'app', writer, store, api_url=server.url,
+                            rate=rate, horizon_days=30)
+    start = time.perf_counter()
+    task = asyncio.ensure_future(backfiller.run(devices))
+    while stop_after is not None and not task.done() and backfiller.requests < stop_after:
+        await asyncio.sleep(0.01)
+    if not task.done() and stop_after is not None:
+        await asyncio.sleep(0.05)  # let the last page land
+        task.cancel()
+    try:
+        written = await task
+    except asyncio.CancelledError:
+        written = None
+    elapsed = time.perf_counter() - start
+    writer.flush()
+    writer.close()
+    store.close()
+    http.close()
+    if errors is not None:
+        errors.append(backfiller.errors)
+    return written, backfiller.requests, backfiller.rate_limited, elapsed
+
+
+def main():
+    n_devices = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    days = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    devices = [(d['macAddress'], d['info']['name']) for d in map(sample_device, range(n_devices))]
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubAmbientServer(history_days=days, rate_limit=rate) as server:
+        path = os.path.join(tmp, 'history.db')
+        tracemalloc.start()
+        written, requests, limited, elapsed = asyncio.run(backfill(server, path, devices, rate))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"initial: {written:,} readings for {n_devices} devices in {elapsed:.2f} s, "
+              f"{requests} requests ({requests / elapsed:.1f}/s, limit {rate:g}/s), "
+              f"{limited} rate-limited, peak Python memory {peak / 1e6:.1f} MB")
+        assert limited == 0, "token bucket exceeded the per-key rate limit"
+
+        written, requests, limited, elapsed = asyncio.run(backfill(server, path, devices, rate))
+        print(f"resume : {written:,} new readings, {requests} requests "
+              f"({limited} rate-limited) in {elapsed:.2f} s")
+        assert requests - limited == n_devices, "resume should need one page per device"
+
+        store = HistoryStore(path)
+        rows = sum(len(store.query(mac, fields=('pm25',))) for mac, _ in devices)
+        store.close()
+        print(f"stored : {rows:,} rows")
+
+        # Interrupted after about one page per device: the newest readings
+        # are stored, the older part of the gap is not
+        path = os.path.join(tmp, 'interrupted.db')
+        asyncio.run(backfill(server, path, devices, rate, stop_after=n_devices + 1))
+        cut = stored_rows(path, devices)
+        written, requests, limited, elapsed = asyncio.run(backfill(server, path, devices, rate))
+        full = stored_rows(path, devices)
+        print(f"cut    : {sum(cut):,} rows stored before the interruption; the next run added {written:,} "
+              f"in {requests - limited} requests -> {sum(full):,} rows")
+        assert sum(cut) < rows, "the backfill finished before it was interrupted"
+        assert abs(sum(full) - rows) <= n_devices, (sum(full), rows)
+        for mac, _ in devices:
+            store = HistoryStore(path)
+            ts = [row[0] for row in store.query(mac, fields=('pm25',))]
+            pending = store.pending_backfill(mac)
+            store.close()
+            gaps = [b - a for a, b in zip(ts, ts[1:]) if b - a != server.history_interval_ms]
+            assert not gaps and not pending, (mac, gaps[:5], pending)
+
+    # Requests faster than the server allows, answered with an HTTP-date
+    with tempfile.TemporaryDirectory() as tmp, StubAmbientServer(history_days=1, rate_limit=2) as server:
+        server.retry_after_date = True
+        errors = []
+        written, requests, limited, elapsed = asyncio.run(
+            backfill(server, os.path.join(tmp, 'dated.db'), devices, 20.0, errors=errors))
+        print(f"dated  : {limited} of {requests} requests answered 429 with an HTTP-date Retry-After; "
+              f"{written:,} readings in {elapsed:.2f} s")
+        assert limited and errors == [0], (limited, errors)
+        assert min(stored_rows(os.path.join(tmp, 'dated.db'), devices)) >= 288, "the day was not backfilled"
+
+
+def stored_rows(path, devices):
+    store = HistoryStore(path)
+    rows = [len(store.query(mac, fields=('pm25',))) for mac, _ in devices]
+    store.close()
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Bulk CSV conversion: rows/s for one file, peak memory at two file sizes
+# (it must not grow with the file), and a multi-file run through the
+# process pool. Spot-checks the AQI columns against aqi_from_pm25, that
+# short rows keep the AQI in its own column, and that a file failing part
+# way through leaves no output behind.
+#
+#   python benchmarks/bench_convert.py [rows]
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.aqi import OUT_OF_RANGE, aqi_from_pm25
+from pm2aqi_core.convert import convert_file, convert_files, output_path
+
+START_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+
+
+def write_export(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['dateutc', 'mac', 'pm25', 'tempf', 'humidity'])
+        for i in range(rows):
+            r = random.random()
+            if r < 0.01:
+                pm25 = ''
+            elif r < 0.012:
+                pm25 = '600.0'
+            else:
+                pm25 = f"{random.lognormvariate(2.3, 0.8):.1f}"
+            writer.writerow([START_MS + i * 60_000, '00:0E:C6:00:00:01', pm25, '70.1', '48'])
+
+
+def check(path, sample=2000):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        assert header[-2:] == ['aqi', 'aqi_category']
+        for i, row in enumerate(reader):
+            if i >= sample:
+                break
+            pm25, aqi, category = row[2], row[-2], row[-1]
+            if not pm25:
+                assert aqi == '' and category == ''
+                continue
+            expected, expected_category, _ = aqi_from_pm25(float(pm25))
+            if expected == OUT_OF_RANGE[0]:
+                assert aqi == '' and category == OUT_OF_RANGE[1]
+            else:
+                assert (int(aqi), category) == (expected, expected_category), row
+
+
+def check_edge_cases(tmp):
+    # Short and long rows are fitted to the header before the AQI columns
+    ragged = os.path.join(tmp, 'ragged.csv')
+    with open(ragged, 'w', newline='') as f:
+        f.write('ts,pm25,x\n7,12.0\n8,40.0,a,extra\n9\n')
+    rows, error = convert_file(ragged, output_path(ragged), chunk_rows=2)
+    assert (rows, error) == (3, None), error
+    with open(output_path(ragged), newline='') as f:
+        out = list(csv.reader(f))
+    expected = [['ts', 'pm25', 'x', 'aqi', 'aqi_category'],
+                ['7', '12.0', '', str(aqi_from_pm25(12.0)[0]), aqi_from_pm25(12.0)[1]],
+                ['8', '40.0', 'a', str(aqi_from_pm25(40.0)[0]), aqi_from_pm25(40.0)[1]],
+                ['9', '', '', '', '']]
+    assert out == expected, out
+
+    # Undecodable bytes a few chunks in: an error, and nothing written
+    broken = os.path.join(tmp, 'broken.csv')
+    write_export(broken, 1000)
+    with open(broken, 'ab') as f:
+        f.write(b'\xff\xfe,1.0\n')
+    rows, error = convert_file(broken, output_path(broken), chunk_rows=100)
+    assert error is not None and rows == 0, (rows, error)
+    leftovers = [name for name in os.listdir(tmp) if name.startswith(('broken.aqi', '.part-'))]
+    assert not leftovers, leftovers
+    print(f"edge cases     ragged rows aligned; a failed file left no output ({error.split(': ', 1)[1][:40]}...)")
+
+
+def peak_memory(src, dst, chunk_rows):
+    tracemalloc.start()
+    rows, error = convert_file(src, dst, chunk_rows=chunk_rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert error is None, error
+    return peak
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    random.seed(1)
+    tmp = tempfile.mkdtemp()
+    big = os.path.join(tmp, 'big.csv')
+    small = os.path.join(tmp, 'small.csv')
+    write_export(big, rows)
+    write_export(small, rows // 4)
+
+    start = time.perf_counter()
+    converted, error = convert_file(big, output_path(big))
+    elapsed = time.perf_counter() - start
+    assert error is None, error
+    assert converted == rows
+    check(output_path(big))
+    print(f"one file       {rows:,} rows in {elapsed:.2f} s ({rows / elapsed:,.0f} rows/s)")
+
+    check_edge_cases(tmp)
+
+    # Several chunks even in the small file, whatever the row count, or the
+    # two runs would not compare like for like
+    chunk_rows = max(rows // 20, 1)
+    small_peak = peak_memory(small, output_path(small), chunk_rows)
+    big_peak = peak_memory(big, output_path(big), chunk_rows)
+    print(f"peak memory    {rows // 4:,} rows {small_peak / 1e6:.1f} MB | {rows:,} rows {big_peak / 1e6:.1f} MB "
+          f"({chunk_rows:,}-row chunks)")
+    assert big_peak < small_peak * 1.5, "memory grew with the file size"
+
+    files = []
+    for i in range(4):
+        path = os.path.join(tmp, f"station{i}.csv")
+        write_export(path, rows // 4)
+        files.append((path, output_path(path)))
+    timings = {}
+    cpus = os.cpu_count() or 1
+    for jobs in (1, max(2, min(4, cpus))):
+        start = time.perf_counter()
+        results = list(convert_files(files, jobs=jobs))
+        timings[jobs] = time.perf_counter() - start
+        assert all(error is None for *_, error in results)
+        assert sum(r[2] for r in results) == rows
+    for jobs, seconds in timings.items():
+        print(f"4 files, {jobs} job{'s' if jobs > 1 else ' '} {rows:,} rows in {seconds:.2f} s ({rows / seconds:,.0f} rows/s)")
+    # Only a machine with spare cores can show the pool winning
+    if cpus > 1:
+        assert timings[max(timings)] < timings[1], "the process pool was no faster"
+    check(files[-1][1])
+
+
+if __name__ == "__main__":
+    main()
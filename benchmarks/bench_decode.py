@@ -0,0 +1,74 @@
+# /v1/devices body -> readings: json.loads + readings_from_devices (the
+# old path) against each installed decode.py backend, on payloads shaped
+# like the real API, with the battery, rain, timezone and location keys
+# readings never use. Checks every backend returns the same readings.
+#
+#   python benchmarks/bench_decode.py [devices ...]
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.decode import available_backends, decode_devices, default_backend, readings_from_decoded
+from pm2aqi_core.reading import readings_from_devices
+from stub_server import sample_device
+
+# lastData and info keys the API sends that no reading keeps
+EXTRA_LAST_DATA = {
+    'tz': 'America/Los_Angeles', 'battout': 1, 'batt1': 1, 'batt_25': 1, 'batt_25in': 1, 'batt_co2': 1,
+    'eventrainin': 0.0, 'totalrainin': 21.4, 'lastRain': '2024-03-01T10:05:00.000Z',
+    'pm25_24h': 8.4, 'temp1f': 70.3, 'humidity1': 44, 'feelsLike1': 70.3, 'dewPoint1': 47.2,
+    'co2_in_aqin': 612, 'co2_in_24h_aqin': 590, 'pm_in_temp_aqin': 71.2, 'pm_in_humidity_aqin': 41,
+}
+EXTRA_INFO = {
+    'coords': {
+        'coords': {'lat': 37.7749, 'lon': -122.4194},
+        'address': '1 Example St, San Francisco, CA 94100, USA',
+        'location': 'San Francisco',
+        'elevation': 16.2,
+        'geo': {'type': 'Point', 'coordinates': [-122.4194, 37.7749]},
+    },
+}
+
+
+def payload(count):
+    devices = []
+    for i in range(count):
+        device = sample_device(i)
+        device['lastData'].update(EXTRA_LAST_DATA)
+        device['info'].update(EXTRA_INFO)
+        devices.append(device)
+    return json.dumps(devices).encode()
+
+
+def best(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main():
+    counts = [int(a) for a in sys.argv[1:]] or [20, 200, 2000]
+    backends = available_backends()
+    print(f"backends: {', '.join(backends)} (default {default_backend()})")
+    for count in counts:
+        body = payload(count)
+        number = max(1, 20_000 // count)
+        expected = readings_from_devices(json.loads(body))
+        for backend in backends:
+            assert readings_from_decoded(decode_devices(body, backend)) == expected, backend
+        base = best(lambda: readings_from_devices(json.loads(body)), number)
+        print(f"\n{count} devices, {len(body) / 1024:,.0f} KiB")
+        print(f"  {'json.loads + readings_from_devices':<36}{base * 1e3:8.3f} ms")
+        times = {}
+        for backend in backends:
+            times[backend] = best(lambda: readings_from_decoded(decode_devices(body, backend)), number)
+            print(f"  {'decode.py ' + backend:<36}{times[backend] * 1e3:8.3f} ms  {base / times[backend]:5.2f}x")
+        # The stdlib backend is the old path; the others must beat it
+        assert times['json'] < base * 1.2, "stdlib backend slower than the old path"
+        fastest = backends[0]
+        if fastest != 'json':
+            assert times[fastest] < base, f"{fastest} is not faster than json.loads"
+
+
+if __name__ == "__main__":
+    main()
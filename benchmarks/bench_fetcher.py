@@ -0,0 +1,61 @@
+# Deadline, cancellation and single-flight checks against a slow stub.
+#
+#   python benchmarks/bench_fetcher.py
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.client import AmbientClient
+from pm2aqi_core.fetcher import Fetcher
+from stub_server import StubAmbientServer
+
+
+async def check_deadline(server):
+    server.delay = 2.0
+    client = AmbientClient('key', 'app', api_url=server.url, timeout=0.2)
+    start = time.perf_counter()
+    devices, error = await client.fetch_devices()
+    elapsed = time.perf_counter() - start
+    client.close()
+    assert devices is None and 'timed out' in error, error
+    assert elapsed < 0.5, f"deadline overran: {elapsed:.2f} s"
+    return f"deadline: slow request abandoned after {elapsed * 1e3:.0f} ms ({error})"
+
+
+async def check_coalescing(server, callers=10):
+    server.delay = 0.3
+    before = server.requests
+    client = AmbientClient('key', 'app', api_url=server.url)
+    fetcher = Fetcher(client.fetch_reading)
+    results = await asyncio.gather(*(fetcher.fetch() for _ in range(callers)))
+    client.close()
+    upstream = server.requests - before
+    assert upstream == 1, f"{callers} callers made {upstream} requests"
+    assert all(r == results[0] and r[1] is None for r in results)
+    return f"coalescing: {callers} concurrent callers -> {upstream} upstream request"
+
+
+async def check_cancellation(server):
+    server.delay = 0.3
+    client = AmbientClient('key', 'app', api_url=server.url)
+    fetcher = Fetcher(client.fetch_reading)
+    stale = asyncio.ensure_future(fetcher.fetch())
+    await asyncio.sleep(0.05)
+    fetcher.cancel()
+    fresh = await fetcher.fetch()
+    client.close()
+    assert await stale is None, "cancelled request reached the caller"
+    assert fresh is not None and fresh[1] is None
+    return "cancellation: stale request dropped, newest result delivered"
+
+
+async def main():
+    with StubAmbientServer() as server:
+        for check in (check_deadline, check_coalescing, check_cancellation):
+            print(await check(server))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+# Parse + format cost of one reading: the hand-written extractor, details
+# table and tile strings the front-ends used before, against the ones the
+# field registry compiles once. Checks both render the same text.
+#
+#   python benchmarks/bench_fields.py [readings]
+import os
+import sys
+import time
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.fields import compile_formatter
+from pm2aqi_core.formatting import TZ_NAME, display, format_columns, format_date, format_weather, zone
+from pm2aqi_core.reading import WEATHER_FIELDS, current_conditions, reading_from_device
+from stub_server import sample_device
+import dashboard  # only for TILE_FORMATTERS; no QApplication is created
+
+
+def old_reading(device):
+    last_data = device.get('lastData', {})
+    reading = {key: last_data.get(key) for key in WEATHER_FIELDS}
+    reading['mac'] = device.get('macAddress')
+    reading['name'] = (device.get('info') or {}).get('name') or reading['mac'] or 'Station'
+    pm25 = last_data.get('pm25')
+    if pm25 is None:
+        pm25 = last_data.get('pm25_out')
+    reading['pm25'] = pm25
+    reading['weather'] = current_conditions(last_data)
+    return reading
+
+
+def old_date(date_str):
+    # format_date before it was cached
+    if not date_str or date_str == 'N/A':
+        return 'N/A'
+    try:
+        dt_utc = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        return dt_utc.astimezone(zone(TZ_NAME)).strftime('%Y-%m-%d %I:%M %p')
+    except Exception:
+        return date_str
+
+
+def old_weather(data):
+    items = [
+        ("Date", old_date(data.get('date', 'N/A'))),
+        ("Outdoor Temp", f"{data.get('tempf', 'N/A')} °F"),
+        ("Outdoor Humidity", f"{data.get('humidity', 'N/A')}%"),
+        ("Barometer (rel)", f"{data.get('baromrelin', 'N/A')} inHg"),
+        ("Barometer (abs)", f"{data.get('baromabsin', 'N/A')} inHg"),
+        ("Wind Speed", f"{data.get('windspeedmph', 'N/A')} mph"),
+        ("Wind Gust", f"{data.get('windgustmph', 'N/A')} mph"),
+        ("Wind Dir", f"{data.get('winddir', 'N/A')}°"),
+        ("Max Daily Gust", f"{data.get('maxdailygust', 'N/A')} mph"),
+        ("Rain (hour)", f"{data.get('hourlyrainin', 'N/A')} in"),
+        ("Rain (day)", f"{data.get('dailyrainin', 'N/A')} in"),
+        ("Rain (week)", f"{data.get('weeklyrainin', 'N/A')} in"),
+        ("Rain (month)", f"{data.get('monthlyrainin', 'N/A')} in"),
+        ("Rain (year)", f"{data.get('yearlyrainin', 'N/A')} in"),
+        # Rounded, as the dashboard tile always showed it
+        ("Solar Radiation", f"{int(round(data.get('solarradiation')))} W/m²"),
+        ("UV Index", f"{data.get('uv', 'N/A')}"),
+        ("Indoor Temp", f"{data.get('tempinf', 'N/A')} °F"),
+        ("Indoor Humidity", f"{data.get('humidityin', 'N/A')}%"),
+        ("Outdoor PM2.5 NowCast", f"{display(data.get('pm25_nowcast'), 'N/A')} μg/m³"),
+        ("Outdoor PM2.5 (24h avg)", f"{display(data.get('pm25_avg24'), 'N/A')} μg/m³"),
+        ("Indoor PM2.5", f"{data.get('pm25_in', 'N/A')} μg/m³"),
+        ("Indoor PM2.5 (24h avg)", f"{data.get('pm25_in_24h', 'N/A')} μg/m³"),
+        ("Outdoor Feels Like", f"{data.get('feelsLike', 'N/A')} °F"),
+        ("Outdoor Dew Point", f"{data.get('dewPoint', 'N/A')} °F"),
+        ("Indoor Feels Like", f"{data.get('feelsLikein', 'N/A')} °F"),
+        ("Indoor Dew Point", f"{data.get('dewPointin', 'N/A')} °F"),
+    ]
+    return format_columns(items)
+
+
+def old_tiles(data):
+    return [
+        str(display(data['windspeedmph'])),
+        f"{display(data['dailyrainin'])} in",
+        f"{display(data['tempf'])} °F",
+        f"{display(data['humidity'])}%",
+        f"{display(data['tempinf'])} °F",
+        f"{display(data['humidityin'])}%",
+        str(display(data['baromabsin'])),
+        str(int(round(data['solarradiation']))),
+        str(display(data['uv'])),
+        f"PM2.5: {display(data['pm25'])} μg/m³",
+    ]
+
+
+def new_tiles(data):
+    return [text(data) for _, text in dashboard.TILE_FORMATTERS]
+
+
+def timed(devices, parse, weather, tiles):
+    start = time.perf_counter()
+    for device in devices:
+        data = parse(device)
+        weather(data)
+        tiles(data)
+    return (time.perf_counter() - start) / len(devices) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    devices = [sample_device(i % 50) for i in range(count)]
+
+    for device in devices[:50]:
+        old, new = old_reading(device), reading_from_device(device)
+        assert all(old[k] == new[k] for k in old), "registry parsed a different reading"
+        assert old_weather(old) == format_weather(new), "details table text differs"
+        assert old_tiles(old) == new_tiles(new), "tile text differs"
+    # A field the station did not send is "N/A", not "None"
+    sparse = reading_from_device({'lastData': {'tempf': None}})
+    assert "None" not in format_weather(sparse)
+    assert compile_formatter('tempf')(sparse) == "-- °F"
+
+    # Best of several interleaved runs, so neither side gets the warm cache
+    before = after = float('inf')
+    for _ in range(5):
+        before = min(before, timed(devices, old_reading, old_weather, old_tiles))
+        after = min(after, timed(devices, reading_from_device, format_weather, new_tiles))
+    print(f"parse + format per reading: hand-written {before:5.1f} µs | registry {after:5.1f} µs")
+    # The registry keeps the field list in one place; it must not cost
+    # anything per reading (the margin is for timer noise)
+    assert after < before * 1.3, "the registry formatted slower than the hand-written code"
+
+    date = devices[0]['lastData']['date']
+    uncached = min(timeit.repeat(lambda: old_date(date), number=2000, repeat=5))
+    cached = min(timeit.repeat(lambda: format_date(date), number=2000, repeat=5))
+    print(f"date to {TZ_NAME}: per call {uncached / 2e-3:5.2f} µs | cached {cached / 2e-3:5.2f} µs")
+    assert cached < uncached / 5, "format_date is not cached"
+
+
+if __name__ == "__main__":
+    main()
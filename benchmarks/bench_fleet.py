@@ -0,0 +1,160 @@
+# Stress test for the headless fleet monitor: many accounts against a local
+# stub that gives each API key its own stations, reports new readings once
+# per interval and answers 429 past one request per second per API key.
+# Every two app keys share an API key, so the per-key limit is exercised.
+# Readings go to a HistoryWriter. The stub runs in a child process, so the
+# CPU figure is the monitor's alone (the history writer thread included).
+#
+#   python benchmarks/bench_fleet.py [keys] [devices_per_key] [seconds] [interval] [concurrency]
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.aqi import OUT_OF_RANGE, aqi_from_pm25
+from pm2aqi_core.fleet import FleetMonitor, JSONLinesSink
+from pm2aqi_core.history import HistoryStore, HistoryWriter
+from stub_server import StubAmbientServer, sample_device
+
+# App keys per API key
+SHARE = 2
+
+
+class FleetStub(StubAmbientServer):
+    def __init__(self, keys, devices_per_key, interval, **kwargs):
+        super().__init__(**kwargs)
+        self.interval_ms = int(interval * 1000)
+        self.accounts = {}
+        for n, (_, app_key, _) in enumerate(keys):
+            self.accounts[app_key] = [sample_device(n * devices_per_key + i) for i in range(devices_per_key)]
+            for i, device in enumerate(self.accounts[app_key]):
+                # Spread over the AQI categories instead of climbing past them
+                index = n * devices_per_key + i
+                device['lastData'].update(pm25=round(index % 600 * 0.5, 1), tempf=round(50 + index % 40, 1))
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def respond(self, path, query):
+        if self.rate_limit and self._over_limit(query.get('apiKey', [''])[0]):
+            self.rate_limited += 1
+            return 429, {'error': 'above-user-rate-limit'}, {'Retry-After': '1'}
+        devices = self.accounts.get(query.get('applicationKey', [''])[0])
+        if devices is None:
+            return 401, {'error': 'unauthorized'}, {}
+        # Each station reports once per interval
+        now = int(time.time() * 1000)
+        for device in devices:
+            device['lastData']['dateutc'] = now - now % self.interval_ms
+        return 200, devices, {}
+
+    async def _handle(self, reader, writer):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await super()._handle(reader, writer)
+        finally:
+            self.in_flight -= 1
+
+
+def serve(conn, keys, per_key, interval):
+    # Runs the stub until asked to stop, then sends back its counters
+    with FleetStub(keys, per_key, interval, rate_limit=1, delay=0.02) as server:
+        conn.send(server.url)
+        conn.recv()
+        conn.send((server.requests, server.rate_limited, server.max_in_flight))
+
+
+def make_keys(count):
+    return [(f"api{i // SHARE:04d}", f"app{i:04d}", f"account-{i}") for i in range(count)]
+
+
+async def stress(url, keys, sink, seconds, interval, concurrency):
+    # CPU and readings at the start and after the first interval, when
+    # every station has been seen once and its tables exist
+    marks = [(time.process_time(), 0)]
+    monitor = FleetMonitor(keys, sink, interval, concurrency, api_url=url)
+    asyncio.get_running_loop().call_later(
+        interval * 1.5, lambda: marks.append((time.process_time(), monitor.metrics.counters['devices'])))
+    try:
+        await monitor.run(seconds)
+    finally:
+        monitor.close()
+    marks.append((time.process_time(), monitor.metrics.counters['devices']))
+    return monitor, marks
+
+
+def check_output(url, keys, per_key):
+    # JSON lines carry the parsed reading plus aqi and account
+    out = io.StringIO()
+    monitor = FleetMonitor(keys, JSONLinesSink(out), interval=60, api_url=url)
+
+    async def once():
+        await asyncio.gather(monitor.poll(0), monitor.poll(1))
+        monitor.close()
+
+    asyncio.run(once())
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) == 2 * per_key, len(lines)
+    first = lines[0]
+    assert {'mac', 'pm25', 'tempf', 'aqi', 'aqi_category', 'account'} <= set(first), sorted(first)
+    aqi, category, _ = aqi_from_pm25(first['pm25'])
+    assert (first['aqi'], first['aqi_category']) == (None if aqi == OUT_OF_RANGE[0] else aqi, category), first
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    per_key = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 30.0
+    interval = float(sys.argv[4]) if len(sys.argv) > 4 else 10.0
+    concurrency = int(sys.argv[5]) if len(sys.argv) > 5 else 32
+    # Two more keys, on an API key of their own, for the output check
+    keys = make_keys(count + SHARE)
+    conn, child_conn = multiprocessing.Pipe()
+    stub = multiprocessing.Process(target=serve, args=(child_conn, keys, per_key, interval), daemon=True)
+    stub.start()
+    url = conn.recv()
+    check_output(url, keys[count:], per_key)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        writer = HistoryWriter(path)
+        monitor, marks = asyncio.run(stress(url, keys[:count], writer, seconds, interval, concurrency))
+        writer.flush()
+        writer.close()
+        store = HistoryStore(path)
+        stored = sum(len(store.query(mac, fields=('pm25',))) for mac, _ in store.devices())
+        store.close()
+    conn.send('stop')
+    requests, rate_limited, max_in_flight = conn.recv()
+    stub.join()
+
+    counters = monitor.metrics.counters
+    (cpu0, _), (cpu1, devices1), (cpu2, devices2) = marks
+    cpu = cpu2 - cpu0
+    steady = (cpu2 - cpu1) / max(devices2 - devices1, 1)
+    devices = counters['devices']
+    per_minute = monitor.devices_per_minute()
+    fetch, queue = monitor.metrics.stages['fetch'], monitor.metrics.stages['queue']
+    print(f"fleet  : {count} keys on {count // SHARE} API keys x {per_key} devices, {interval:g} s interval, "
+          f"concurrency {concurrency}, {seconds:g} s")
+    print(f"polls  : {counters['fetches']:,} ok, {counters['skipped_polls']:,} with nothing new, "
+          f"{counters['fetch_errors']:,} errors; the stub answered {requests:,} requests, {rate_limited} with 429")
+    print(f"fetch  : p50 {fetch.quantile(0.5) * 1e3:.1f} ms, p90 {fetch.quantile(0.9) * 1e3:.1f} ms; "
+          f"queued p90 {queue.quantile(0.9) * 1e3:.1f} ms; at most {max_in_flight} connections in use")
+    print(f"output : {devices:,} readings ({per_minute:,.0f}/min), {stored:,} stored; "
+          f"monitor CPU {cpu:.2f} s ({cpu / seconds:.0%} of one core)")
+    print(f"cpu    : {cpu / max(devices, 1) * 1e6:.0f} µs per reading overall, {steady * 1e6:.0f} µs once every "
+          f"station is known -> {60 / steady:,.0f} readings/min per core")
+    assert rate_limited == 0, f"{rate_limited} requests over the per-key limit"
+    assert max_in_flight <= concurrency, max_in_flight
+    assert counters['fetch_errors'] == 0, monitor.errors
+    assert stored == devices, (stored, devices)
+    assert per_minute >= 1000, f"{per_minute:.0f} readings/min"
+
+
+if __name__ == "__main__":
+    main()
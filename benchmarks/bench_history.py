@@ -0,0 +1,78 @@
+# Ingest rate and range-query latency of the SQLite history store over a
+# year of 1-minute readings for one station.
+#
+#   python benchmarks/bench_history.py [days]
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.history import HISTORY_FIELDS, HistoryStore, HistoryWriter
+
+MINUTE_MS = 60_000
+DAY_MS = 1440 * MINUTE_MS
+START_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+
+
+def synthetic_readings(minutes, mac='00:0E:C6:00:00:00'):
+    base = {f: round(random.random() * 10, 2) for f in HISTORY_FIELDS}
+    base.update(mac=mac, name='Station 1')
+    for i in range(minutes):
+        day_phase = math.sin(2 * math.pi * (i % 1440) / 1440)
+        yield dict(
+            base,
+            dateutc=START_MS + i * MINUTE_MS,
+            tempf=round(60 + 15 * day_phase, 1),
+            pm25=round(max(0.0, 12 + 8 * day_phase + random.gauss(0, 2)), 1),
+        )
+
+
+def bench_ingest(path, minutes, batch):
+    writer = HistoryWriter(path)
+    start = time.perf_counter()
+    pending = []
+    for reading in synthetic_readings(minutes):
+        pending.append(reading)
+        if len(pending) == batch:
+            writer.submit(pending)
+            pending = []
+    writer.submit(pending)
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return writer.written, elapsed
+
+
+def bench_query(path, span_ms, minutes, repeats=20):
+    store = HistoryStore(path)
+    latencies, rows = [], 0
+    for _ in range(repeats):
+        lo = START_MS + random.randrange(max(1, minutes * MINUTE_MS - span_ms))
+        start = time.perf_counter()
+        rows = len(store.query('00:0E:C6:00:00:00', lo, lo + span_ms, fields=('pm25', 'tempf')))
+        latencies.append(time.perf_counter() - start)
+    store.close()
+    return statistics.median(latencies), rows
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    minutes = days * 1440
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        written, elapsed = bench_ingest(path, minutes, batch=1440)
+        print(f"ingest: {written:,} readings in {elapsed:.2f} s ({written / elapsed:,.0f}/s), "
+              f"{os.path.getsize(path) / 1e6:.1f} MB")
+        for label, span in (("1 hour", DAY_MS // 24), ("1 day", DAY_MS), ("1 week", 7 * DAY_MS),
+                            ("30 days", 30 * DAY_MS), (f"{days} days", minutes * MINUTE_MS)):
+            latency, rows = bench_query(path, span, minutes, repeats=5 if span > 30 * DAY_MS else 20)
+            print(f"query {label:<9}: {latency * 1e3:8.2f} ms median ({rows:,} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Per-poll latency and CPU: requests.get in an executor thread (the old
+# path) vs the pooled asyncio AmbientClient, against the local stub server.
+# First, against a scripted server: bodiless responses on a kept-alive
+# connection, and a dropped pooled connection retried for GET but not POST.
+#
+#   python benchmarks/bench_http.py [polls] [devices]
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.ambient import devices_url
+from pm2aqi_core.client import AmbientClient
+from pm2aqi_core.http import AsyncHTTPClient
+from stub_server import StubAmbientServer, sample_device
+
+
+async def poll_requests(url, polls):
+    import requests
+
+    loop = asyncio.get_running_loop()
+    latencies = []
+    for _ in range(polls):
+        start = time.perf_counter()
+        response = await loop.run_in_executor(None, lambda: requests.get(url))
+        response.json()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def poll_client(server, polls):
+    client = AmbientClient('key', 'app', api_url=server.url)
+    latencies = []
+    for _ in range(polls):
+        start = time.perf_counter()
+        devices, error = await client.fetch_devices()
+        assert error is None, error
+        latencies.append(time.perf_counter() - start)
+    client.close()
+    return latencies, client.http.connections_opened
+
+
+class ScriptedServer:
+    # Answers each request with the next scripted reply (raw bytes), or
+    # closes the connection without answering for None; 200 when unscripted
+    def __init__(self):
+        self.replies = []
+        self.methods = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.decode('latin-1').split('\r\n'):
+                    if line.lower().startswith('content-length:'):
+                        length = int(line.split(':', 1)[1])
+                await reader.readexactly(length)
+                self.methods.append(head.split(b' ', 1)[0].decode())
+                reply = self.replies.pop(0) if self.replies else b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+                if reply is None:
+                    break
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+async def check_edge_cases():
+    server = ScriptedServer()
+    url = await server.start()
+    client = AsyncHTTPClient()
+
+    # No body after 204, 304, HEAD or an interim 103, and the connection is
+    # reused rather than read until the server closes it
+    server.replies = [b'HTTP/1.1 204 No Content\r\n\r\n',
+                      b'HTTP/1.1 304 Not Modified\r\nETag: "x"\r\n\r\n',
+                      b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\n',
+                      b'HTTP/1.1 103 Early Hints\r\nLink: </a>\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok']
+    for method, status, body in (('GET', 204, b''), ('GET', 304, b''), ('HEAD', 200, b''), ('GET', 200, b'ok')):
+        response = await asyncio.wait_for(client.request(method, url), 2)
+        assert (response.status, response.body) == (status, body), (method, response.status, response.body)
+    assert client.connections_opened == 1, client.connections_opened
+
+    # The pooled connection drops after the request is sent: the GET is
+    # retried on a fresh connection, the POST fails rather than repeat
+    server.methods.clear()
+    server.replies = [None]
+    assert (await client.get(url)).body == b'ok'
+    server.replies = [None]
+    try:
+        await client.post(url, b'[]')
+        raise AssertionError("POST was retried")
+    except ConnectionError:
+        pass
+    assert server.methods == ['GET', 'GET', 'POST'], server.methods
+    client.close()
+    server.close()
+    print("keep-alive: 204/304/HEAD/103 read without a body on one connection, "
+          "a dropped GET retried once, a dropped POST sent once")
+
+
+def measure(coro):
+    cpu = time.process_time()
+    result = asyncio.run(coro)
+    return result, time.process_time() - cpu
+
+
+def report(name, latencies, cpu, connections):
+    polls = len(latencies)
+    print(f"{name:<22} median {statistics.median(latencies) * 1e3:7.2f} ms   "
+          f"p99 {sorted(latencies)[int(polls * 0.99) - 1] * 1e3:7.2f} ms   "
+          f"CPU/poll {cpu / polls * 1e3:6.2f} ms   connections {connections}")
+
+
+def main():
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_devices = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    devices = [sample_device(i) for i in range(n_devices)]
+    asyncio.run(check_edge_cases())
+
+    with StubAmbientServer(devices=devices) as server:
+        url = devices_url('key', 'app', server.url)
+        latencies, cpu = measure(poll_requests(url, polls))
+        report("requests + executor", latencies, cpu, server.connections)
+
+    with StubAmbientServer(devices=devices) as server:
+        (latencies, opened), cpu = measure(poll_client(server, polls))
+        report("pooled AmbientClient", latencies, cpu, opened)
+    print(f"{polls} polls, {n_devices} devices per payload (plain HTTP; "
+          f"TLS handshakes saved in production are not included)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Guard the import cost of the headless core with `python -X importtime`.
+#
+#   python benchmarks/bench_import.py [budget_ms]
+#
+# Exits non-zero if importing pm2aqi_core exceeds the budget or pulls in
+# any GUI or heavy third-party module.
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN = ('PyQt6', 'qasync', 'matplotlib', 'numpy', 'requests')
+RUNS = 5
+
+
+def import_profile(statement):
+    # Returns {module: cumulative_us} from one fresh interpreter
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def best_of(statement, module):
+    profiles = [import_profile(statement) for _ in range(RUNS)]
+    return min(p[module] for p in profiles) / 1000, profiles[0]
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    core_ms, core_modules = best_of('import pm2aqi_core', 'pm2aqi_core')
+    leaked = sorted(m for m in core_modules if m.split('.')[0] in FORBIDDEN)
+    gui_ms, _ = best_of('import pm2aqi', 'pm2aqi')
+
+    print(f"pm2aqi_core : {core_ms:8.1f} ms  (budget {budget_ms:.0f} ms)")
+    print(f"pm2aqi (GUI): {gui_ms:8.1f} ms")
+    failed = False
+    if leaked:
+        print(f"FAIL: core imported {', '.join(leaked)}")
+        failed = True
+    if core_ms > budget_ms:
+        print("FAIL: core import over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
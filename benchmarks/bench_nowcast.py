@@ -0,0 +1,67 @@
+# Incremental NowCast (one add() per poll) against the vectorized
+# recomputation over stored history, checking that both agree hour by hour.
+#
+#   python benchmarks/bench_nowcast.py [days]
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.nowcast import HOUR_MS, NowCast, nowcast_series
+
+MINUTE_MS = 60_000
+START_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+
+
+def synthetic_history(days):
+    ts, pm25 = [], []
+    for i in range(days * 1440):
+        # Smoke events every few days plus a daily cycle; skip some minutes
+        # and a few whole hours to exercise the missing-hour rules
+        if random.random() < 0.05 or (i // 60) % 37 == 0:
+            continue
+        smoke = 80 * max(0.0, math.sin(2 * math.pi * i / (4 * 1440))) ** 8
+        daily = 6 * math.sin(2 * math.pi * (i % 1440) / 1440)
+        ts.append(START_MS + i * MINUTE_MS)
+        pm25.append(round(max(0.0, 10 + daily + smoke + random.gauss(0, 2)), 1))
+    return ts, pm25
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    random.seed(1)
+    ts, pm25 = synthetic_history(days)
+
+    engine = NowCast()
+    incremental = {}
+    start = time.perf_counter()
+    for t, v in zip(ts, pm25):
+        engine.add(t, v)
+        # The value at the last poll of each hour is that hour's NowCast
+        incremental[t // HOUR_MS * HOUR_MS] = engine.nowcast()
+    elapsed = time.perf_counter() - start
+    print(f"incremental: {len(ts):,} polls in {elapsed * 1e3:.1f} ms "
+          f"({elapsed / len(ts) * 1e6:.2f} µs/poll)")
+
+    start = time.perf_counter()
+    hours, _, series = nowcast_series(np.array(ts), np.array(pm25))
+    elapsed = time.perf_counter() - start
+    print(f"vectorized : {len(hours):,} hours from {len(ts):,} readings in {elapsed * 1e3:.1f} ms")
+
+    mismatches = 0
+    for hour, value in zip(hours.tolist(), series.tolist()):
+        if hour not in incremental:
+            continue
+        expected = incremental[hour]
+        if (expected is None) != math.isnan(value) or (expected is not None and abs(expected - value) > 1e-9):
+            mismatches += 1
+    print(f"agreement  : {mismatches} mismatched hours of {len(incremental):,}")
+    assert mismatches == 0, "incremental and vectorized NowCast disagree"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# N subscribers on one shared poller cost one upstream request per interval.
+# Also checks that simultaneous refresh requests from every subscriber
+# coalesce into one fetch, that a window with other keys is refused, and
+# that the stations are backfilled and recorded once, by the daemon.
+#
+#   python benchmarks/bench_poller.py [subscribers] [intervals]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.history import HistoryStore
+from pm2aqi_core.poller import PollerDaemon, PollerSubscriber, key_id
+from stub_server import StubAmbientServer, sample_device
+
+INTERVAL = 0.5
+
+
+async def collect(subscriber, received):
+    async for readings, error in subscriber:
+        assert error is None and len(readings) == 3, error
+        received.append(readings)
+
+
+def live(server):
+    # Upstream /devices polls, leaving out backfill pages
+    return server.requests - server.history_requests
+
+
+async def run(server, address, history, n_subscribers, intervals):
+    daemon = PollerDaemon('key', 'app', address, INTERVAL, api_url=server.url, history=history)
+    await daemon.start()
+    key = key_id('key', 'app')
+
+    subscribers = [PollerSubscriber(address) for _ in range(n_subscribers)]
+    assert all(await asyncio.gather(*(s.connect(key) for s in subscribers)))
+    other = PollerSubscriber(address)
+    assert not await other.connect(key_id('other', 'keys')), "subscriber with other keys was accepted"
+
+    received = [[] for _ in subscribers]
+    tasks = [asyncio.ensure_future(collect(s, r)) for s, r in zip(subscribers, received)]
+    before = live(server)
+    start = time.perf_counter()
+    await poll_loop(daemon, intervals)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.1)
+    upstream = live(server) - before
+    print(f"polling : {n_subscribers} subscribers, {daemon.polls} polls in {elapsed:.1f} s -> "
+          f"{upstream} upstream requests")
+    assert upstream == daemon.polls == intervals, f"{upstream} requests for {intervals} intervals"
+    assert all(len(r) == intervals for r in received), [len(r) for r in received]
+
+    # Every subscriber presses refresh at once
+    server.delay = 0.2
+    before = live(server)
+    for s in subscribers:
+        s.refresh()
+    await asyncio.sleep(0.6)
+    upstream = live(server) - before
+    print(f"refresh : {n_subscribers} simultaneous refreshes -> {upstream} upstream request, "
+          f"{daemon.fetcher.coalesced} coalesced")
+    assert upstream == 1, f"refreshes made {upstream} requests"
+    assert all(len(r) == intervals + 1 for r in received), [len(r) for r in received]
+
+    # One backfill per station however many windows subscribe: the first
+    # poll started it in the daemon, paced by its one token bucket
+    while daemon.backfill._tasks:
+        await asyncio.sleep(0.05)
+    daemon.history.flush()
+    store = HistoryStore(history)
+    stored = {mac: len(store.query(mac)) for mac, _ in store.devices()}
+    store.close()
+    print(f"history : {server.history_requests} backfill requests for {len(stored)} stations, "
+          f"{sum(stored.values())} polled readings recorded once")
+    assert server.history_requests == len(received[0][0]) == len(stored), server.history_requests
+    assert all(rows == 1 for rows in stored.values()), stored
+
+    for s in subscribers:
+        s.close()
+    await asyncio.gather(*tasks)
+    await daemon.close()
+
+
+async def poll_loop(daemon, intervals):
+    # PollerDaemon.run() for a fixed number of intervals
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    for i in range(intervals):
+        await daemon.poll()
+        deadline += INTERVAL
+        if i < intervals - 1:
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+
+def main():
+    n_subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    intervals = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    devices = [sample_device(i) for i in range(3)]
+    with tempfile.TemporaryDirectory() as tmp, StubAmbientServer(devices=devices) as server:
+        asyncio.run(run(server, os.path.join(tmp, 'poller.sock'), os.path.join(tmp, 'history.db'),
+                        n_subscribers, intervals))
+
+
+if __name__ == "__main__":
+    main()
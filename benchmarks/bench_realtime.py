@@ -0,0 +1,114 @@
+# Realtime stream against the local Socket.IO stand-in: end-to-end latency
+# from the server writing an update to the parsed reading reaching the
+# callback, then reconnect after a dropped connection, a failing callback
+# and a malformed packet.
+#
+#   python benchmarks/bench_realtime.py [updates]
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.realtime import RealtimeStream
+from stub_realtime import StubRealtimeServer
+from stub_server import sample_device
+
+POLL_INTERVAL = 60.0
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise AssertionError("timed out waiting for the stream")
+        await asyncio.sleep(0.002)
+
+
+async def run(server, n_updates):
+    received = {}
+    states = []
+    failing = set()
+
+    def on_readings(readings):
+        now = time.perf_counter()
+        for reading in readings:
+            if reading['dateutc'] in failing:
+                raise RuntimeError(f"callback bug at {reading['dateutc']}")
+            received[reading['dateutc']] = now
+
+    stream = RealtimeStream('key', 'app', on_readings, states.append, url=server.url,
+                            backoff_min=0.05, backoff_max=0.4)
+    stream.start()
+    await wait_for(lambda: stream.connected)
+
+    loop = asyncio.get_running_loop()
+    sent = {}
+    base = 1_800_000_000_000
+    for i in range(n_updates):
+        ts = base + i * 1000
+        sent[ts] = await loop.run_in_executor(None, server.emit, i % len(server.devices), {'dateutc': ts, 'pm25': 10 + i % 7})
+        await asyncio.sleep(0.002)
+    await wait_for(lambda: all(ts in received for ts in sent))
+    latencies = sorted((received[ts] - sent[ts]) * 1e3 for ts in sent)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"latency  : {n_updates} pushed updates, median {statistics.median(latencies):.2f} ms, "
+          f"p95 {p95:.2f} ms, max {latencies[-1]:.2f} ms")
+    print(f"polling  : a {POLL_INTERVAL:g} s poll leaves readings {POLL_INTERVAL / 2:g} s stale on average "
+          f"and refetches every device")
+    assert stream.updates == n_updates
+
+    # Connection drops: the stream reports it, backs off and resubscribes
+    start = time.perf_counter()
+    server.drop()
+    await wait_for(lambda: states[-1] is False)
+    await wait_for(lambda: stream.connected)
+    print(f"reconnect: back after {(time.perf_counter() - start) * 1e3:.0f} ms "
+          f"({server.connections} connections, {server.subscribes} subscribes)")
+    ts = base + n_updates * 1000
+    await loop.run_in_executor(None, server.emit, 0, {'dateutc': ts})
+    await wait_for(lambda: ts in received)
+
+    # Server refuses connections: the stream stays down and keeps retrying
+    server.accepting = False
+    server.drop()
+    await wait_for(lambda: not stream.connected)
+    await asyncio.sleep(1.0)
+    assert not stream.connected and stream.last_error, "stream claimed to be up"
+    print(f"outage   : down, retrying with backoff (last error: {stream.last_error})")
+    server.accepting = True
+    await wait_for(lambda: stream.connected, timeout=2.0)
+    print(f"recovered: states {['up' if s else 'down' for s in states]}")
+
+    # The callback raises: logged and skipped, the session stays up
+    connects = stream.connects
+    ts += 1000
+    failing.add(ts)
+    await loop.run_in_executor(None, server.emit, 0, {'dateutc': ts})
+    await wait_for(lambda: stream.callback_errors == 1)
+    await loop.run_in_executor(None, server.emit, 0, {'dateutc': ts + 1000})
+    await wait_for(lambda: ts + 1000 in received)
+    assert stream.connected and stream.connects == connects, "a callback error dropped the stream"
+    print(f"callback : error logged, stream stayed up ({stream.last_error})")
+
+    # A packet that does not parse as an event: the session ends and the
+    # stream reconnects instead of the task dying
+    server.send_raw('425')
+    await wait_for(lambda: stream.connects == connects + 1)
+    ts += 2000
+    await loop.run_in_executor(None, server.emit, 0, {'dateutc': ts})
+    await wait_for(lambda: ts in received)
+    assert not stream._task.done()
+    print(f"malformed: reconnected ({stream.last_error})")
+    stream.cancel()
+
+
+def main():
+    n_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with StubRealtimeServer(devices=[sample_device(i) for i in range(3)]) as server:
+        asyncio.run(run(server, n_updates))
+
+
+if __name__ == "__main__":
+    main()
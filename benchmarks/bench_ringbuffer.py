@@ -0,0 +1,87 @@
+# Recent readings in memory: a list of reading dicts against RingBuffer
+# columns. Reports bytes per device-day, append cost, and the cost of a
+# 24-hour window mean, and checks windows are views, not copies.
+#
+#   python benchmarks/bench_ringbuffer.py [days]
+import json
+import math
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.decode import decode_devices, readings_from_decoded
+from pm2aqi_core.ringbuffer import DAY_MS, RingBuffer, bytes_per_device_day
+from pm2aqi_core.rolling import DEFAULT_FIELDS, MIN_INTERVAL_MS
+from stub_server import sample_device
+
+START_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+
+
+def readings(minutes):
+    # Parsed the way a poll parses them, with the values varying
+    body = json.dumps([sample_device(0)]).encode()
+    for i in range(minutes):
+        reading = readings_from_decoded(decode_devices(body, 'json'))[0]
+        reading['pm25'] = round(10 + 5 * math.sin(i / 240), 1)
+        reading['tempf'] = round(60 + 10 * math.sin(i / 720), 1)
+        yield START_MS + i * MIN_INTERVAL_MS, reading
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    minutes = days * 1440
+    capacity = days * DAY_MS // MIN_INTERVAL_MS
+
+    tracemalloc.start()
+    kept = list(readings(minutes))
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    buffer = RingBuffer(DEFAULT_FIELDS, capacity)
+    start = time.perf_counter()
+    for ts, reading in kept:
+        buffer.append(ts, reading)
+    append = (time.perf_counter() - start) / minutes
+    per_day = dict_bytes / days
+    print(f"{days} days of 1-minute readings, {len(DEFAULT_FIELDS)} numeric fields")
+    print(f"reading dicts : {per_day / 1e3:9,.0f} KB per device-day")
+    print(f"RingBuffer    : {buffer.nbytes / days / 1e3:9,.0f} KB per device-day (with slack; "
+          f"{bytes_per_device_day(DEFAULT_FIELDS, slack=0) / 1e3:,.0f} KB without)")
+    print(f"append        : {append * 1e6:9.2f} µs per reading")
+    assert buffer.nbytes / days < per_day / 10, "RingBuffer is not an order of magnitude smaller"
+
+    now = kept[-1][0]
+    day_start = now - DAY_MS + 1
+
+    def dict_mean():
+        values = [r['pm25'] for ts, r in kept if ts >= day_start and r['pm25'] is not None]
+        return sum(values) / len(values)
+
+    def ring_mean():
+        ts, values = buffer.window(day_start)
+        return float(np.nanmean(values[:, buffer.index['pm25']]))
+
+    assert abs(dict_mean() - ring_mean()) < 1e-9
+    ts, values = buffer.window(day_start)
+    assert np.shares_memory(values, buffer.values) and np.shares_memory(ts, buffer.ts), "window copied"
+    assert len(ts) == 1440
+    for name, fn in (("dict scan", dict_mean), ("RingBuffer", ring_mean)):
+        best = min(timeit.repeat(fn, number=20, repeat=5)) / 20
+        print(f"24 h PM2.5 mean, {name:<10}: {best * 1e6:9.1f} µs")
+
+    # Appending past capacity keeps the newest samples and the byte count
+    nbytes = buffer.nbytes
+    for ts, reading in kept[:1440]:
+        buffer.append(now + ts - START_MS + MIN_INTERVAL_MS, reading)
+    assert len(buffer) == capacity and buffer.nbytes == nbytes
+    assert buffer.timestamps()[0] == START_MS + 1440 * MIN_INTERVAL_MS
+    print("capacity: oldest day dropped after one more day, memory unchanged")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Rolling 1 h / 24 h / 7 d statistics: per-reading cost of the streaming
+# deques against rescanning the window, checking both agree and that
+# memory stays at one week of samples.
+#
+#   python benchmarks/bench_rolling.py [days]
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.rolling import DEFAULT_FIELDS, MIN_INTERVAL_MS, WINDOWS, RollingStats
+
+START_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+
+
+def synthetic_readings(minutes):
+    for i in range(minutes):
+        phase = math.sin(2 * math.pi * (i % 1440) / 1440)
+        reading = {f: round(10 + 5 * phase + random.gauss(0, 1), 1) for f in DEFAULT_FIELDS}
+        if random.random() < 0.02:
+            reading['pm25'] = None
+        yield START_MS + i * MIN_INTERVAL_MS, reading
+
+
+def rescan(samples, now, field, span):
+    values = [r[field] for ts, r in samples if ts > now - span and r[field] is not None]
+    if not values:
+        return None
+    return min(values), max(values), round(sum(values) / len(values), 2)
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 14
+    random.seed(1)
+    readings = list(synthetic_readings(days * 1440))
+
+    stats = RollingStats()
+    start = time.perf_counter()
+    for ts, reading in readings:
+        stats.add(ts, reading)
+        stats.stats()
+    elapsed = time.perf_counter() - start
+    # Second pass for memory; tracing would distort the timing
+    tracemalloc.start()
+    traced = RollingStats()
+    for ts, reading in readings:
+        traced.add(ts, reading)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"streaming: {len(readings):,} readings x {len(DEFAULT_FIELDS)} fields in {elapsed:.2f} s "
+          f"({elapsed / len(readings) * 1e6:.1f} µs/reading), {len(stats):,} samples held, "
+          f"{current / 1e6:.1f} MB")
+    assert len(stats) <= WINDOWS[-1][1] // MIN_INTERVAL_MS, "samples outside the longest window were kept"
+
+    # Rescanning is far slower, so time it over the last few readings only
+    tail = 50
+    samples = readings[-(WINDOWS[-1][1] // MIN_INTERVAL_MS) - tail:]
+    start = time.perf_counter()
+    for k in range(tail):
+        now = samples[-tail + k][0]
+        window = samples[:len(samples) - tail + k + 1]
+        for field in DEFAULT_FIELDS:
+            for _, span in WINDOWS:
+                rescan(window, now, field, span)
+    elapsed = time.perf_counter() - start
+    print(f"rescan   : {elapsed / tail * 1e6:,.0f} µs/reading")
+
+    now = readings[-1][0]
+    result = stats.stats()
+    for field in DEFAULT_FIELDS:
+        for label, span in WINDOWS:
+            expected = rescan(samples, now, field, span)
+            got = result[field][label]
+            assert got[:2] == expected[:2] and abs(got[2] - expected[2]) < 0.011, (field, label, got, expected)
+    print("agreement: streaming and rescan results match")
+
+
+if __name__ == "__main__":
+    main()
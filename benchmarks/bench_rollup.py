@@ -0,0 +1,173 @@
+# Year-long history queries with and without the rollup tables: reading
+# every row with HistoryStore.query against HistoryStore.series, which
+# reads the finest rollup level that fits the point budget. Also times a
+# live poll's write (one reading plus its rollup buckets), the trend chart
+# and NowCast seeds a window reads for a new station, and checks the
+# rollups against the readings and that stores opened at once on a new
+# database all get the rollup tables.
+#
+#   python benchmarks/bench_rollup.py [days] [max_points]
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_history import DAY_MS, MINUTE_MS, START_MS, bench_ingest, synthetic_readings
+from pm2aqi_core.aqi import OUT_OF_RANGE, aqi_from_pm25
+from pm2aqi_core.history import HistoryStore
+from pm2aqi_core.nowcast import HOUR_MS, NowCast, NowCastTracker
+from pm2aqi_core.rollup import pick_level
+from pm2aqi_core.standards import STANDARDS
+from pm2aqi_core.trends import DEFAULT_DAYS, TREND_FIELDS, TrendTracker
+
+MAC = '00:0E:C6:00:00:00'
+
+
+def timed(fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies), result
+
+
+def check_rollups(store, days):
+    # Daily min, max and mean from the rollups match the readings
+    raw = np.array(store.query(MAC, START_MS, START_MS + days * DAY_MS, fields=('pm25', 'tempf')))
+    day = (raw[:, 0] - START_MS) // DAY_MS
+    level, rows = store.series(MAC, START_MS, START_MS + days * DAY_MS, ('pm25', 'tempf', 'aqi'), days)
+    assert level == '1d', level
+    assert len(rows) == days, len(rows)
+    day_pm25 = {row[0]: row[2:5] for row in rows}
+    for i, row in enumerate(rows):
+        pm25, tempf = raw[day == i, 1], raw[day == i, 2]
+        assert row[0] == START_MS + i * DAY_MS and row[1] == len(pm25)
+        assert row[2:4] == (pm25.min(), pm25.max()) and abs(row[4] - pm25.mean()) < 1e-9
+        assert row[5:7] == (tempf.min(), tempf.max()) and abs(row[7] - tempf.mean()) < 1e-9
+        assert row[10] == aqi_from_pm25(row[4])[0]
+    # The AQI columns follow the standard asked for
+    for standard in STANDARDS:
+        _, rows = store.series(MAC, START_MS, START_MS + days * DAY_MS, ('aqi',), days, standard=standard)
+        for row in rows:
+            for aqi, pm25 in zip(row[2:5], day_pm25[row[0]]):
+                expected = aqi_from_pm25(pm25, standard)[0]
+                assert aqi == (None if expected == OUT_OF_RANGE[0] else expected), (standard, row)
+
+
+def bench_seeds(store, end):
+    # Trend chart: reading every sample of the last 30 days, as it used to
+    # be seeded, against the whole seed from a day of readings and the
+    # rollups
+    span = DEFAULT_DAYS * DAY_MS
+    before, rows = timed(lambda: store.query(MAC, end - span, end, fields=TREND_FIELDS), 5)
+    after, buffer = timed(lambda: TrendTracker(store).buffer(MAC, end), 5)
+    print(f"trend seed: query of all readings {before * 1e3:6.2f} ms ({len(rows):,} rows)  "
+          f"whole seed {after * 1e3:6.2f} ms ({len(buffer):,} samples)  {before / after:6.1f}x")
+
+    # NowCast: a day of readings against hourly rollups plus this hour's
+    # readings; both must give the same values
+    def from_readings():
+        engine = NowCast()
+        for ts, pm25 in store.query(MAC, end - 24 * HOUR_MS, end, ('pm25',)):
+            engine.add(ts, pm25)
+        engine.add(end, 10.0)
+        return engine.nowcast(), engine.avg24()
+
+    def from_rollups():
+        reading = {'mac': MAC, 'dateutc': end, 'pm25': 10.0}
+        NowCastTracker(store).update([reading])
+        return reading['pm25_nowcast'], reading['pm25_avg24']
+
+    before, expected = timed(from_readings, 20)
+    after, result = timed(from_rollups, 20)
+    print(f"NowCast seed: readings {before * 1e3:6.2f} ms  rollups {after * 1e3:6.2f} ms  {before / after:6.1f}x")
+    assert result == expected, (result, expected)
+
+
+def check_concurrent_open(tmp, rounds=20, stores=3):
+    # A window, its writer thread and the poller open the same new database
+    # together; every one of them must come up
+    errors = []
+
+    def open_store(path):
+        try:
+            HistoryStore(path).close()
+        except Exception as e:
+            errors.append(e)
+
+    for i in range(rounds):
+        path = os.path.join(tmp, f'fresh-{i}.db')
+        threads = [threading.Thread(target=open_store, args=(path,)) for _ in range(stores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert not errors, errors[0]
+    print(f"concurrent open: {rounds} new databases, {stores} stores each, no schema race")
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    max_points = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    minutes = days * 1440
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        written, elapsed = bench_ingest(path, minutes, batch=1440)
+        print(f"ingest with rollups: {written:,} readings in {elapsed:.2f} s ({written / elapsed:,.0f}/s), "
+              f"{os.path.getsize(path) / 1e6:.1f} MB")
+
+        store = HistoryStore(path)
+        end = START_MS + minutes * MINUTE_MS
+        # A live poll: the next minute's reading, one at a time
+        live = synthetic_readings(minutes + 200)
+        for _ in range(minutes):
+            next(live)
+        latencies = []
+        for reading in live:
+            start = time.perf_counter()
+            store.write([reading])
+            latencies.append(time.perf_counter() - start)
+        print(f"live write: {statistics.median(latencies) * 1e3:.3f} ms median per reading, rollups included")
+
+        for label, span in (("1 day", DAY_MS), ("1 week", 7 * DAY_MS), ("30 days", 30 * DAY_MS),
+                            (f"{days} days", minutes * MINUTE_MS)):
+            lo = end - span
+            repeats = 5 if span > 30 * DAY_MS else 20
+            before, rows = timed(lambda: store.query(MAC, lo, end, fields=('pm25', 'tempf')), repeats)
+            after, (level, points) = timed(
+                lambda: store.series(MAC, lo, end, ('pm25', 'tempf', 'aqi'), max_points), repeats)
+            print(f"{label:<9}: all readings {before * 1e3:8.2f} ms ({len(rows):,} rows)  "
+                  f"series {after * 1e3:6.2f} ms ({len(points):,} {level} rows)  {before / after:6.1f}x")
+
+        if days >= DEFAULT_DAYS:
+            bench_seeds(store, end)
+
+        # The finest level with at most max_points rows
+        for span, expected in ((DAY_MS // 2, 'raw'), (DAY_MS, '5m'), (3 * DAY_MS, '5m'), (7 * DAY_MS, '1h'),
+                               (30 * DAY_MS, '1h'), (365 * DAY_MS, '1d')):
+            assert pick_level(0, span, 1000)[0] == expected, (span, pick_level(0, span, 1000))
+
+        check_rollups(store, min(days, 60))
+        # Replacing readings replaces their buckets' aggregates
+        replaced = list(synthetic_readings(60))
+        for reading in replaced:
+            reading['pm25'] = 500.0
+        store.write(replaced)
+        level, rows = store.series(MAC, START_MS, START_MS + DAY_MS, ('pm25',), 1)
+        assert rows[0][1] == 1440 and rows[0][3] == 500.0, rows
+        check_rollups(store, min(days, 60))
+        store.close()
+        check_concurrent_open(tmp)
+    print("rollups match the readings")
+
+
+if __name__ == "__main__":
+    main()
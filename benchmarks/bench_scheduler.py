@@ -0,0 +1,120 @@
+# Adaptive refresh scheduling against a fixed 60 s timer, on a simulated
+# clock: upstream requests, polls that found nothing new, and how long each
+# reading waits between appearing in the API and reaching the window.
+# Also checks the backoff during a run of 429s and the hidden-window rate.
+#
+#   python benchmarks/bench_scheduler.py [hours]
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.scheduler import RefreshScheduler
+
+START = 1_704_067_200.0  # 2024-01-01T00:00:00Z
+INTERVAL = 60.0
+PHASES = (0.0, 12.0, 24.0, 36.0, 48.0)
+
+
+class Station:
+    # Reports every cadence seconds; each reading shows up in the API lag
+    # seconds (plus jitter) later. skew is the station clock's error.
+    def __init__(self, mac, cadence, lag, skew=0.0, jitter=3.0):
+        self.mac = mac
+        self.cadence = cadence
+        self.skew = skew
+        self.published = []  # (dateutc, seconds it becomes visible)
+        t = START - cadence
+        while t < START + 48 * 3600:
+            self.published.append((t, t + lag + random.uniform(0, jitter)))
+            t += cadence
+
+    def newest(self, now):
+        reading = None
+        for ts, visible in self.published:
+            if visible > now:
+                break
+            reading = ts
+        return {'mac': self.mac, 'dateutc': int((reading + self.skew) * 1000)}
+
+
+def simulate(stations, hours, adaptive, outage=None, visible=True, phase=0.0):
+    scheduler = RefreshScheduler(INTERVAL)
+    end = START + hours * 3600
+    now = START + phase
+    shown = {}
+    waits = []
+    polls = unchanged = outage_polls = 0
+    while now < end:
+        polls += 1
+        if outage and outage[0] <= now < outage[1]:
+            outage_polls += 1
+            readings, error = None, "API error: 429 Too Many Requests"
+        else:
+            readings, error = [s.newest(now) for s in stations], None
+            new = False
+            for station, reading in zip(stations, readings):
+                if shown.get(station.mac) != reading['dateutc']:
+                    new = True
+                    shown[station.mac] = reading['dateutc']
+                    # Every reading this poll is the first to show
+                    for ts, at in station.published:
+                        if at <= now and ts + station.skew == reading['dateutc'] / 1000:
+                            waits.append(now - at)
+            unchanged += not new
+        scheduler.observe(readings, error, now=now)
+        now += scheduler.next_delay(now=now, visible=visible) if adaptive else INTERVAL
+    return polls, unchanged, waits, outage_polls
+
+
+def run(stations, hours, adaptive, **kwargs):
+    # Summed over timers started at several points in the minute
+    polls = unchanged = outage_polls = 0
+    waits = []
+    for phase in PHASES:
+        result = simulate(stations, hours, adaptive, phase=phase, **kwargs)
+        polls += result[0]
+        unchanged += result[1]
+        waits += result[2]
+        outage_polls += result[3]
+    n = len(PHASES)
+    return polls / n, unchanged / n, sum(waits) / len(waits), outage_polls / n
+
+
+def report(name, stations, hours, **kwargs):
+    fixed = run(stations, hours, False, **kwargs)
+    adaptive = run(stations, hours, True, **kwargs)
+    print(f"{name:<26} fixed {fixed[0]:4.0f} polls, {fixed[1]:4.0f} unchanged, {fixed[2]:5.1f} s wait | "
+          f"adaptive {adaptive[0]:4.0f} polls, {adaptive[1]:4.0f} unchanged, {adaptive[2]:5.1f} s wait")
+    return fixed, adaptive
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 6
+    random.seed(1)
+    fixed, adaptive = report("60 s station", [Station('a', 60, 8)], hours)
+    assert adaptive[0] <= fixed[0] * 1.05, "adaptive polled more than the fixed timer"
+    assert adaptive[2] < fixed[2] / 3, "readings did not reach the window sooner"
+
+    fixed, adaptive = report("60 s, clock 30 s behind", [Station('a', 60, 3, skew=-30)], hours)
+    assert adaptive[0] <= fixed[0] * 1.05 and adaptive[2] < fixed[2] / 3
+
+    fixed, adaptive = report("5 min station", [Station('a', 300, 10)], hours)
+    assert adaptive[0] < fixed[0] / 3, "slow station still polled every minute"
+    assert adaptive[1] < fixed[1] / 10
+
+    fixed, adaptive = report("two stations, 25 s apart", [Station('a', 60, 8), Station('b', 60, 33)], hours)
+    assert adaptive[0] <= fixed[0] * 1.05
+
+    stations = [Station('a', 60, 8)]
+    fixed, adaptive = report("30 min of 429s", stations, hours, outage=(START + 3600, START + 5400))
+    print(f"{'':<26} polls during the outage: fixed {fixed[3]:.0f}, adaptive {adaptive[3]:.0f}")
+    assert adaptive[3] <= fixed[3] / 3, "did not back off on 429"
+
+    hidden = run(stations, hours, True, visible=False)
+    print(f"{'minimized window':<26} {hidden[0] / hours:.0f} polls/hour")
+    assert hidden[0] / hours <= 3600 / 300 + 1
+
+
+if __name__ == "__main__":
+    main()
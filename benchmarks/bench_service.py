@@ -0,0 +1,128 @@
+# Load test for the local HTTP service: concurrent keep-alive clients on
+# localhost, p50/p99 latency and requests/s per route. The service polls a
+# stub Ambient server; every request must be answered from memory, so
+# upstream requests stay at the poll count however many clients there are.
+#
+#   python benchmarks/bench_service.py [clients] [requests per client]
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pm2aqi_core.aqi import aqi_from_concentration, aqi_from_pm25
+from pm2aqi_core.service import AQIService
+from stub_server import StubAmbientServer, sample_device
+
+BATCH = [round(i * 0.7, 1) for i in range(100)]
+
+
+def routes(mac):
+    # (name, method, path, body)
+    return (
+        ("GET /aqi", 'GET', "/aqi?pm25=35.9", None),
+        ("POST /aqi x100", 'POST', "/aqi", json.dumps(BATCH).encode()),
+        ("GET /aqi/details", 'GET', "/aqi/details?pm25=80", None),
+        ("GET /readings", 'GET', "/readings", None),
+        ("GET /readings/<mac>", 'GET', f"/readings/{mac}", None),
+    )
+
+
+async def request(reader, writer, method, path, body=None):
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    writer.write((head + "\r\n").encode('latin-1') + (body or b''))
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(port, method, path, body, count, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            assert status == 200, (path, status)
+    finally:
+        writer.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def check(port, mac):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    status, body = await request(reader, writer, 'GET', "/aqi?pm25=35.9")
+    assert status == 200 and json.loads(body)['aqi'] == aqi_from_pm25(35.9)[0]
+    status, body = await request(reader, writer, 'POST', "/aqi", json.dumps(BATCH + [600]).encode())
+    results = json.loads(body)
+    assert [r['aqi'] for r in results[:-1]] == [aqi_from_pm25(v)[0] for v in BATCH]
+    assert results[-1]['aqi'] is None and results[-1]['category'] == "Out of Range"
+    status, body = await request(reader, writer, 'GET', "/aqi?pm25=35.9&standard=in")
+    assert json.loads(body)['aqi'] == aqi_from_pm25(35.9, 'in')[0]
+    status, body = await request(reader, writer, 'GET', "/aqi?pm25=12&pm10=160")
+    result = json.loads(body)
+    assert (result['aqi'], result['pollutant']) == (aqi_from_concentration(160, 'pm10')[0], 'pm10'), result
+    status, body = await request(reader, writer, 'POST', "/aqi?standard=cn&pollutant=o3", b'[90, 900]')
+    assert [r['aqi'] for r in json.loads(body)] == [aqi_from_concentration(90, 'o3', 'cn')[0], None]
+    status, body = await request(reader, writer, 'GET', f"/readings/{mac}")
+    assert status == 200 and json.loads(body)['mac'] == mac
+    status, body = await request(reader, writer, 'GET', "/aqi/details?pm25=80")
+    assert json.loads(body)['text'].startswith("Category: Unhealthy\n")
+    status, body = await request(reader, writer, 'GET', "/metrics")
+    assert status == 200 and b'pm2aqi_fetches_total 1' in body and b'stage="http"' in body
+    for method, path, body in (('GET', "/aqi?pm25=abc", None), ('POST', "/aqi", b'[1, "x"]'),
+                               ('GET', "/aqi?pm25=1&standard=xx", None), ('POST', "/aqi?pollutant=no2", b'1'),
+                               ('GET', "/readings/nope", None), ('DELETE', "/readings", None)):
+        status, _ = await request(reader, writer, method, path, body)
+        assert status in (400, 404, 405), (path, status)
+    writer.close()
+
+
+async def run(server, clients, count):
+    service = AQIService('key', 'app', port=0, api_url=server.url,
+                         poller_address=os.path.join(tempfile.mkdtemp(), 'none.sock'))
+    await service.start()
+    while not service.readings:
+        await asyncio.sleep(0.01)
+    mac = next(iter(service.readings))
+    await check(service.port, mac)
+
+    before = server.requests
+    print(f"{clients} keep-alive clients x {count} requests per route")
+    for name, method, path, body in routes(mac):
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(service.port, method, path, body, count, latencies) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} p50 {percentile(latencies, 0.5) * 1e3:6.2f} ms  p99 {percentile(latencies, 0.99) * 1e3:6.2f} ms  "
+              f"{len(latencies) / elapsed:8,.0f} req/s")
+    upstream = server.requests - before
+    print(f"upstream requests during the test: {upstream} (source: {service.source})")
+    assert upstream <= 1, "requests reached the Ambient API"
+    await service.close()
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with StubAmbientServer(devices=[sample_device(i) for i in range(3)]) as server:
+        asyncio.run(run(server, clients, count))
+
+
+if __name__ == "__main__":
+    main()
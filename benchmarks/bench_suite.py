@@ -0,0 +1,303 @@
+# Benchmark suite for the hot paths, with results saved as JSON so runs
+# on different commits can be compared:
+#
+#   aqi_scalar           aqi_from_pm25, per value
+#   aqi_batch_100k       aqi_from_pm25_array on 100,000 values
+#   format_weather       the "Show More" table for one reading
+#   parse_devices_20     devices_from_response + all_readings on a 20-station payload
+#   decode_readings_20   the same through decode.py, as AmbientClient.fetch_readings does
+#   cycle_calculator     PM2AQIApp.async_fetch -> widgets updated, against the stub server
+#   cycle_dashboard      Dashboard.async_fetch -> tiles updated, against the stub server
+#   startup_calculator   fresh interpreter to the first shown pm2aqi.py window
+#   startup_dashboard    the same for dashboard.py
+#
+# The Qt cases use the offscreen platform. Each case reports the best and
+# median seconds per call over several rounds.
+#
+#   python benchmarks/bench_suite.py [-k NAME] [--output FILE]
+#   python benchmarks/bench_suite.py --compare benchmarks/results/<old>.json [--threshold 1.25]
+#
+# Results go to benchmarks/results/<commit>.json by default. With
+# --compare, exits non-zero if any case is slower than the baseline by
+# more than the threshold.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from stub_server import StubAmbientServer, sample_device
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+ROUNDS = 5
+# Each timed round runs the case at least this long
+MIN_ROUND = 0.05
+
+
+def timed(fn, rounds=ROUNDS):
+    # Best and median seconds per call of fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= MIN_ROUND:
+            break
+        number *= 2
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return summarize(samples, number)
+
+
+def summarize(samples, number=1):
+    samples = sorted(samples)
+    return {'best': samples[0], 'median': samples[len(samples) // 2], 'rounds': len(samples), 'number': number}
+
+
+def case_aqi_scalar():
+    from pm2aqi_core.aqi import aqi_from_pm25
+
+    values = [random.uniform(0, 500) for _ in range(1000)]
+
+    def run():
+        for v in values:
+            aqi_from_pm25(v)
+    result = timed(run)
+    # Reported per value
+    return {k: v / len(values) if k in ('best', 'median') else v for k, v in result.items()}
+
+
+def case_aqi_batch_100k():
+    import numpy as np
+    from pm2aqi_core.aqi import aqi_from_pm25_array
+
+    values = np.random.default_rng(1).uniform(0, 500, 100_000)
+    return timed(lambda: aqi_from_pm25_array(values))
+
+
+def case_format_weather():
+    from pm2aqi_core.formatting import format_weather
+    from pm2aqi_core.reading import reading_from_device
+
+    reading = reading_from_device(sample_device(0))
+    reading['pm25_nowcast'] = 12.3
+    reading['pm25_avg24'] = 11.9
+    return timed(lambda: format_weather(reading))
+
+
+def case_parse_devices_20():
+    from pm2aqi_core.ambient import all_readings, devices_from_response
+    from pm2aqi_core.http import Response
+
+    body = json.dumps([sample_device(i) for i in range(20)]).encode()
+    return timed(lambda: all_readings(*devices_from_response(Response(200, {}, body))))
+
+
+def case_decode_readings_20():
+    from pm2aqi_core.ambient import decode_response, decoded_readings
+    from pm2aqi_core.http import Response
+
+    body = json.dumps([sample_device(i) for i in range(20)]).encode()
+    return timed(lambda: decoded_readings(*decode_response(Response(200, {}, body))))
+
+
+class QtCycles:
+    # One QApplication and stub server for the UI cases
+    def __init__(self):
+        self.app = None
+        self.loop = None
+        self.server = None
+
+    def setup(self):
+        if self.app is not None:
+            return
+        self.server = StubAmbientServer(devices=[sample_device(i) for i in range(3)])
+        self.server.start()
+        os.environ['AMBIENT_API_URL'] = self.server.url
+        os.environ['AMBIENT_API_KEY'] = 'key'
+        os.environ['AMBIENT_APP_KEY'] = 'app'
+        os.environ['PM2AQI_HISTORY'] = os.path.join(tempfile.mkdtemp(), 'history.db')
+        os.environ['PM2AQI_POLLER'] = os.path.join(tempfile.mkdtemp(), 'none.sock')
+        from PyQt6.QtWidgets import QApplication
+        from qasync import QEventLoop
+
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self.loop = QEventLoop(self.app)
+        asyncio.set_event_loop(self.loop)
+
+    def cycle(self, window, cycles=30):
+        # Every fetch returns a new reading, so each one reaches the widgets
+        def one(step):
+            devices = [sample_device(i) for i in range(3)]
+            for device in devices:
+                device['lastData']['dateutc'] += step * 60_000
+                device['lastData']['pm25'] = round(5 + step % 40 * 1.7, 1)
+            self.server.devices = devices
+            start = time.perf_counter()
+            self.loop.run_until_complete(window.async_fetch())
+            # Paint outside the task, as the event loop would
+            self.app.processEvents()
+            return time.perf_counter() - start
+
+        for step in range(3):
+            one(step)  # first poll, backfill, layout
+        polls = window.scheduler.polls
+        samples = [one(step) for step in range(3, 3 + cycles)]
+        assert window.scheduler.polls - polls == cycles and window.scheduler.unchanged == 0
+        window.close()
+        return summarize(samples)
+
+    def close(self):
+        if self.server is not None:
+            self.server.stop()
+
+
+QT = QtCycles()
+
+
+def case_cycle_calculator():
+    QT.setup()
+    import pm2aqi
+
+    window = pm2aqi.PM2AQIApp()
+    window.show()
+    return QT.cycle(window)
+
+
+def case_cycle_dashboard():
+    QT.setup()
+    import dashboard
+
+    window = dashboard.Dashboard()
+    window.show()
+    return QT.cycle(window)
+
+
+STARTUP = """
+import os, sys
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+import {module}
+window = {module}.{window}()
+window.show()
+app.processEvents()
+os._exit(0)
+"""
+
+
+def startup(module, window, rounds=3):
+    # Wall time from launching the interpreter to the first processed show
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', AMBIENT_API_KEY='', AMBIENT_APP_KEY='',
+               PM2AQI_HISTORY=os.path.join(tempfile.mkdtemp(), 'history.db'))
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', STARTUP.format(module=module, window=window)],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def case_startup_calculator():
+    return startup('pm2aqi', 'PM2AQIApp')
+
+
+def case_startup_dashboard():
+    return startup('dashboard', 'Dashboard')
+
+
+CASES = {name[len('case_'):]: fn for name, fn in globals().items() if name.startswith('case_')}
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(base, results, threshold):
+    # Prints best-time ratios against base; returns the slower cases
+    slower = []
+    print(f"\n{'case':<22}{'baseline':>12}{'now':>12}{'ratio':>8}   (baseline {base.get('commit', '?')})")
+    for name, result in results.items():
+        old = base['results'].get(name)
+        if old is None:
+            print(f"{name:<22}{'--':>12}{format_time(result['best']):>12}")
+            continue
+        ratio = result['best'] / old['best']
+        flag = '  SLOWER' if ratio > threshold else ''
+        print(f"{name:<22}{format_time(old['best']):>12}{format_time(result['best']):>12}{ratio:>8.2f}{flag}")
+        if ratio > threshold:
+            slower.append(name)
+    return slower
+
+
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the PM2AQI benchmark suite.")
+    parser.add_argument('-k', dest='select', default=None, help="only cases whose name contains this")
+    parser.add_argument('--output', default=None, help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', default=None, help="baseline results file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio that fails --compare")
+    args = parser.parse_args()
+    random.seed(1)
+
+    results = {}
+    try:
+        for name, case in CASES.items():
+            if args.select and args.select not in name:
+                continue
+            results[name] = case()
+            print(f"{name:<22} best {format_time(results[name]['best']):>10}   median {format_time(results[name]['median']):>10}")
+    finally:
+        QT.close()
+
+    sha = commit()
+    report = {
+        'commit': sha,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{sha}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {os.path.relpath(output)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(json.load(f), results, args.threshold)
+        if slower:
+            print(f"FAIL: slower than the baseline by more than {args.threshold:g}x: {', '.join(slower)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
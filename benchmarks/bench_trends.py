@@ -0,0 +1,130 @@
+# Trend chart render time per refresh under the offscreen Qt platform, on
+# a 30-day series of one-minute samples:
+#   full redraw   every sample as one polyline, the way a plot redraws
+#   matplotlib    Agg redraw of the same series, if matplotlib is installed
+#   rebuild       LTTB to two points per pixel, then one polyline
+#   append        one new sample drawn onto the cached pixmap
+#
+#   python benchmarks/bench_trends.py [days]
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QColor, QPainter, QPen, QPixmap, QPolygonF
+from PyQt6.QtWidgets import QApplication
+
+from pm2aqi_core.downsample import lttb
+from pm2aqi_core.ringbuffer import DAY_MS
+from pm2aqi_core.rolling import MIN_INTERVAL_MS
+from pm2aqi_core.trends import TrendTracker
+from trend_chart import LINE_WIDTH, TrendChart
+
+START_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+WIDTH, HEIGHT = 800, 240
+# One frame at 60 Hz
+FRAME = 1 / 60
+
+
+def reading(i):
+    pm25 = 12 + 8 * math.sin(i / 300) + 6 * math.sin(i / 37) + (40 if i % 5000 == 0 else 0)
+    return {'mac': 'm', 'dateutc': START_MS + i * MIN_INTERVAL_MS, 'pm25': round(pm25, 1),
+            'tempf': round(60 + 12 * math.sin(i * 2 * math.pi / 1440), 1)}
+
+
+def best(fn, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def full_redraw(ts, values):
+    # Every sample mapped and drawn, no cache
+    pixmap = QPixmap(WIDTH, HEIGHT)
+    pixmap.fill(QColor("#fff"))
+    x = (ts - ts[0]) * (WIDTH / (ts[-1] - ts[0]))
+    y = HEIGHT - (values - values.min()) * (HEIGHT / np.ptp(values))
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setPen(QPen(QColor("#1976d2"), LINE_WIDTH))
+    painter.drawPolyline(QPolygonF([QPointF(a, b) for a, b in zip(x.tolist(), y.tolist())]))
+    painter.end()
+
+
+def matplotlib_redraw(ts, values):
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+    except ImportError:
+        return None
+    figure = Figure(figsize=(WIDTH / 100, HEIGHT / 100), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.plot(ts, values)
+    return best(canvas.draw)
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    app = QApplication.instance() or QApplication(sys.argv)
+    minutes = days * 1440
+    tracker = TrendTracker(days=days)
+    tracker.update([reading(i) for i in range(minutes)])
+    buffer = tracker.buffer('m')
+    ts, values = buffer.window()
+    pm25 = values[:, buffer.index['pm25']]
+    print(f"{len(ts):,} samples ({days} days at one a minute), chart {WIDTH}x{HEIGHT}")
+
+    x = ts.astype(np.float64)
+    keep = lttb(x, pm25, WIDTH * 2)
+    assert len(keep) == WIDTH * 2 and np.all(np.diff(keep) > 0)
+    # The spikes survive downsampling
+    assert pm25[keep].max() == pm25.max(), "LTTB dropped the peak"
+
+    full = best(lambda: full_redraw(ts, pm25))
+    mpl = matplotlib_redraw(ts, pm25)
+    chart = TrendChart()
+    chart.resize(WIDTH, HEIGHT)
+    chart.show()
+    chart.set_source(buffer, 'pm25', days * DAY_MS)
+    app.processEvents()
+
+    def rebuild():
+        chart.invalidate()
+        chart.repaint()
+    downsample = best(lambda: lttb(x, pm25, WIDTH * 2))
+    rebuilt = best(rebuild)
+
+    # Later samples inside the axes are appended, not redrawn
+    rebuilds = chart.rebuilds
+    samples = []
+    for i in range(minutes, minutes + 200):
+        tracker.update([reading(i)])
+        start = time.perf_counter()
+        chart.refresh()
+        chart.repaint()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    append = samples[len(samples) // 2]
+    assert chart.rebuilds == rebuilds and chart.appends == 200, (chart.rebuilds - rebuilds, chart.appends)
+
+    print(f"full redraw, all samples : {full * 1e3:8.2f} ms")
+    if mpl is not None:
+        print(f"matplotlib Agg redraw    : {mpl * 1e3:8.2f} ms")
+    print(f"LTTB to {WIDTH * 2} points       : {downsample * 1e3:8.2f} ms")
+    print(f"rebuild (LTTB + paint)   : {rebuilt * 1e3:8.2f} ms")
+    print(f"append one sample        : {append * 1e3:8.2f} ms (median of 200)")
+    assert append < FRAME, "appending a sample takes longer than a 60 Hz frame"
+    assert rebuilt < full, "rebuild is slower than drawing every sample"
+    chart.close()
+
+
+if __name__ == "__main__":
+    main()
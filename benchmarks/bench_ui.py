@@ -0,0 +1,128 @@
+# Offscreen-Qt cost of one refresh, before and after the view-model.
+# "before" makes the view-model forget what it rendered, so every setter
+# runs, and wraps the update in setUpdatesEnabled(False/True) as the
+# windows used to. "after" is the normal diffed path. Counts widget setter
+# calls and paint events per refresh.
+#
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_ui.py [refreshes]
+import copy
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ['AMBIENT_API_KEY'] = ''
+os.environ['AMBIENT_APP_KEY'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyQt6.QtCore import QEvent, QObject
+from PyQt6.QtWidgets import QApplication
+from pm2aqi_core.reading import reading_from_device
+from stub_server import sample_device
+
+
+class PaintCounter(QObject):
+    def __init__(self):
+        super().__init__()
+        self.paints = 0
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            self.paints += 1
+        return False
+
+
+def scenarios(stations):
+    base = [reading_from_device(sample_device(i)) for i in range(stations)]
+    unchanged = [copy.deepcopy(base) for _ in range(2)]
+    one_field = []
+    for i in range(2):
+        readings = copy.deepcopy(base)
+        readings[0]['tempf'] = 70.0 + i
+        one_field.append(readings)
+    category = []
+    for pm25 in (8.0, 40.0):
+        readings = copy.deepcopy(base)
+        for r in readings:
+            r['pm25'] = pm25
+        category.append(readings)
+    return {"no change": unchanged, "one field": one_field, "AQI category": category}
+
+
+def measure(app, counter, root, view_models, update, sequence, refreshes, diffed):
+    for readings in sequence:
+        update(readings)
+    app.processEvents()
+    applied = sum(vm.applied for vm in view_models())
+    counter.paints = 0
+    start = time.perf_counter()
+    for i in range(refreshes):
+        if diffed:
+            update(sequence[i % len(sequence)])
+        else:
+            for vm in view_models():
+                vm.reset()
+            root.setUpdatesEnabled(False)
+            update(sequence[i % len(sequence)])
+            root.setUpdatesEnabled(True)
+        app.processEvents()
+    elapsed = time.perf_counter() - start
+    setters = sum(vm.applied for vm in view_models()) - applied
+    return elapsed / refreshes * 1e6, setters / refreshes, counter.paints / refreshes
+
+
+def run(app, counter, name, root, view_models, update, stations, refreshes):
+    results = {}
+    for scenario, sequence in scenarios(stations).items():
+        before = measure(app, counter, root, view_models, update, sequence, refreshes, False)
+        after = measure(app, counter, root, view_models, update, sequence, refreshes, True)
+        results[scenario] = before, after
+        print(f"{name:<10} {scenario:<13} before {before[0]:6.0f} µs, {before[1]:4.1f} setters, "
+              f"{before[2]:5.1f} paints | after {after[0]:6.0f} µs, {after[1]:4.1f} setters, {after[2]:5.1f} paints")
+    return results
+
+
+def main():
+    refreshes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tmp = tempfile.mkdtemp()
+    os.environ['PM2AQI_HISTORY'] = os.path.join(tmp, 'history.db')
+    app = QApplication(sys.argv)
+    counter = PaintCounter()
+    app.installEventFilter(counter)
+
+    import dashboard
+    import pm2aqi
+
+    tiles = dashboard.StationTiles()
+    tiles.resize(900, 400)
+    tiles.show()
+    tile_results = run(app, counter, "tiles", tiles, lambda: [tiles.view_model],
+                       lambda readings: tiles.update_reading(readings[0], basis='instant'), 1, refreshes)
+
+    window = pm2aqi.PM2AQIApp()
+    window.resize(600, 900)
+    window.show()
+
+    def update(readings):
+        # PM2AQIApp.show_readings without the history and tracker work
+        window.readings = readings
+        window.update_stations(readings)
+        window.show_selected_station(window.station_select.currentIndex())
+
+    window_results = run(app, counter, "calculator", window,
+                         lambda: [window.view_model] + [row[-1] for row in window.station_rows],
+                         update, 3, refreshes)
+    window.close()
+
+    for results in (tile_results, window_results):
+        before, after = results["no change"]
+        assert after[1] == 0 and after[2] == 0, "an unchanged reading still set or repainted widgets"
+        before, after = results["one field"]
+        assert after[1] < before[1] / 3, "one changed field set most of the widgets"
+        assert after[2] < before[2], "one changed field repainted as much as before"
+        for before, after in results.values():
+            assert after[2] <= before[2], "the view-model repainted more"
+
+
+if __name__ == "__main__":
+    main()
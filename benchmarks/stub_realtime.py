@@ -0,0 +1,166 @@
+# Local stand-in for Ambient's realtime Socket.IO feed, used by the
+# benchmarks. Speaks just enough WebSocket and Engine.IO v4 for
+# RealtimeStream: open packet, "40" join, the subscribe/subscribed
+# exchange, "data" pushes and pings. Updates are pushed with emit(), from
+# any thread, and drop() cuts every connection to exercise reconnects.
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+
+from stub_server import sample_device
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class StubRealtimeServer:
+    def __init__(self, devices=None, ping_interval=25000, ping_timeout=20000):
+        self.devices = devices if devices is not None else [sample_device(0)]
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.connections = 0
+        self.subscribes = 0
+        self.sent = 0
+        self.accepting = True
+        self.host = '127.0.0.1'
+        self.port = None
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._clients = set()  # writers that have subscribed
+        self._handlers = set()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, 0))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        async def shutdown():
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join()
+        self._loop.close()
+
+    def emit(self, index, changes):
+        # Push an update for devices[index] to every subscriber; returns the
+        # perf_counter() time it was written to the sockets
+        device = self.devices[index]
+        device['lastData'] = dict(device['lastData'], **changes)
+        payload = dict(device['lastData'], macAddress=device['macAddress'])
+        return asyncio.run_coroutine_threadsafe(
+            self._broadcast(_frame('42' + json.dumps(['data', payload]))), self._loop).result()
+
+    def send_raw(self, packet):
+        # Write one Socket.IO packet as-is, malformed or not
+        asyncio.run_coroutine_threadsafe(self._broadcast(_frame(packet)), self._loop).result()
+
+    def drop(self):
+        # Cut every connection, as a network blip would
+        async def cut():
+            for task in list(self._handlers):
+                task.cancel()
+        asyncio.run_coroutine_threadsafe(cut(), self._loop).result()
+
+    async def _broadcast(self, frame):
+        sent_at = time.perf_counter()
+        for writer in list(self._clients):
+            writer.write(frame)
+            self.sent += 1
+        return sent_at
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            headers = {}
+            await reader.readline()
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if not self.accepting:
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                return
+            self.connections += 1
+            accept = base64.b64encode(hashlib.sha1(headers['sec-websocket-key'].encode() + _GUID).digest())
+            writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                         b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+            opened = {'sid': str(self.connections), 'upgrades': [],
+                      'pingInterval': self.ping_interval, 'pingTimeout': self.ping_timeout}
+            writer.write(_frame('0' + json.dumps(opened)))
+            while True:
+                message = await _read_message(reader)
+                if message is None:
+                    break
+                if message == '40':
+                    writer.write(_frame('40' + json.dumps({'sid': 'socket'})))
+                elif message.startswith('42'):
+                    event, *args = json.loads(message[2:])
+                    if event == 'subscribe':
+                        self.subscribes += 1
+                        self._clients.add(writer)
+                        reply = ['subscribed', {'devices': self.devices, 'method': 'subscribe'}]
+                        writer.write(_frame('42' + json.dumps(reply)))
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError, KeyError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._handlers.discard(task)
+            writer.close()
+
+
+def _frame(text, opcode=0x1):
+    payload = text.encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        return struct.pack('!BB', 0x80 | opcode, length) + payload
+    if length < 1 << 16:
+        return struct.pack('!BBH', 0x80 | opcode, 126, length) + payload
+    return struct.pack('!BBQ', 0x80 | opcode, 127, length) + payload
+
+
+async def _read_message(reader):
+    head = await reader.readexactly(2)
+    opcode, length = head[0] & 0x0F, head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if head[1] & 0x80 else b'\0\0\0\0'
+    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+    if opcode == 0x8:
+        return None
+    return payload.decode('utf-8')
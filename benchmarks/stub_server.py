@@ -0,0 +1,207 @@
+# Local stand-in for the Ambient Weather REST API, used by the benchmarks.
+#
+# Serves /v1/devices from memory over HTTP/1.1 with keep-alive and gzip,
+# on its own event loop thread so both blocking (requests) and asyncio
+# clients can talk to it. With history_days set it also serves synthetic
+# pages from the per-device data endpoint, optionally enforcing a per-key
+# rate limit with 429 responses.
+import asyncio
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from email.utils import formatdate
+from urllib.parse import parse_qs, unquote, urlsplit
+
+SAMPLE_LAST_DATA = {
+    'dateutc': 1747947420000,
+    'date': '2025-05-22T20:57:00.000Z',
+    'tempf': 78.5,
+    'humidity': 58,
+    'baromrelin': 29.91,
+    'baromabsin': 29.62,
+    'windspeedmph': 7.8,
+    'windgustmph': 11.4,
+    'winddir': 247,
+    'maxdailygust': 17.2,
+    'hourlyrainin': 0.0,
+    'dailyrainin': 0.56,
+    'weeklyrainin': 0.56,
+    'monthlyrainin': 1.2,
+    'yearlyrainin': 9.87,
+    'solarradiation': 286.4,
+    'uv': 1,
+    'tempinf': 79.8,
+    'humidityin': 52,
+    'pm25': 14.2,
+    'pm25_24h': 11.9,
+    'pm25_in': 6.1,
+    'pm25_in_24h': 5.4,
+    'feelsLike': 78.9,
+    'dewPoint': 62.1,
+    'feelsLikein': 79.5,
+    'dewPointin': 60.3,
+    'battout': 1,
+    'batt_25': 1,
+    'tz': 'America/Los_Angeles',
+}
+
+
+def sample_device(index=0):
+    last_data = dict(SAMPLE_LAST_DATA)
+    last_data['tempf'] = round(last_data['tempf'] + index * 0.1, 1)
+    last_data['pm25'] = round(last_data['pm25'] + index * 0.3, 1)
+    return {
+        'macAddress': f"00:0E:C6:00:{index // 256:02X}:{index % 256:02X}",
+        'lastData': last_data,
+        'info': {'name': f"Station {index + 1}", 'location': 'Home'},
+    }
+
+
+def history_record(ts_ms):
+    record = dict(SAMPLE_LAST_DATA)
+    record['dateutc'] = ts_ms
+    record['date'] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(ts_ms / 1000))
+    record['pm25'] = round(10 + (ts_ms // 60_000) % 37 * 0.5, 1)
+    return record
+
+
+class StubAmbientServer:
+    def __init__(self, devices=None, delay=0.0, gzip_min=512, history_days=0,
+                 history_interval_ms=300_000, rate_limit=None):
+        self.devices = devices if devices is not None else [sample_device(0)]
+        self.delay = delay
+        self.gzip_min = gzip_min
+        self.history_days = history_days
+        self.history_interval_ms = history_interval_ms
+        self.rate_limit = rate_limit  # requests per second per apiKey
+        self.retry_after_date = False  # Retry-After as an HTTP-date, not seconds
+        self.rate_limited = 0
+        self._recent = defaultdict(deque)
+        self.requests = 0
+        self.history_requests = 0  # of which per-device history pages
+        self.connections = 0
+        self.host = '127.0.0.1'
+        self.port = None
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._handlers = set()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, 0))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        async def shutdown():
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join()
+        self._loop.close()
+
+    def respond(self, path, query):
+        # Returns (status, payload, extra_headers); override for other routes
+        if self.rate_limit and self._over_limit(query.get('apiKey', [''])[0]):
+            self.rate_limited += 1
+            retry = formatdate(time.time() + 1, usegmt=True) if self.retry_after_date else '1'
+            return 429, {'error': 'above-user-rate-limit'}, {'Retry-After': retry}
+        if path == '/v1/devices':
+            return 200, self.devices, {}
+        if path.startswith('/v1/devices/'):
+            self.history_requests += 1
+            return 200, self.history_page(unquote(path.rsplit('/', 1)[1]), query), {}
+        return 404, {'error': 'not found'}, {}
+
+    def history_page(self, mac, query):
+        # Newest-first records at or before endDate, like the real endpoint
+        now_ms = int(time.time() * 1000)
+        step = self.history_interval_ms
+        end = int(query['endDate'][0]) if 'endDate' in query else now_ms
+        limit = min(int(query.get('limit', ['288'])[0]), 288)
+        oldest = now_ms - self.history_days * 86_400_000
+        ts = end - end % step
+        page = []
+        while ts >= oldest and len(page) < limit:
+            page.append(history_record(ts))
+            ts -= step
+        return page
+
+    def _over_limit(self, api_key):
+        now = time.monotonic()
+        recent = self._recent[api_key]
+        while recent and now - recent[0] >= 1.0:
+            recent.popleft()
+        recent.append(now)
+        return len(recent) > self.rate_limit
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                self.requests += 1
+                _, target, version = request_line.decode('latin-1').split()
+                parts = urlsplit(target)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                status, payload, extra = self.respond(parts.path, parse_qs(parts.query))
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                out = {'Content-Type': 'application/json', 'Date': time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime())}
+                if 'gzip' in headers.get('accept-encoding', '') and len(body) >= self.gzip_min:
+                    body = gzip.compress(body, compresslevel=5)
+                    out['Content-Encoding'] = 'gzip'
+                out['Content-Length'] = str(len(body))
+                keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                out['Connection'] = 'keep-alive' if keep else 'close'
+                out.update(extra)
+                head = f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in out.items()) + "\r\n"
+                writer.write(head.encode('latin-1') + body)
+                await writer.drain()
+                if not keep:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
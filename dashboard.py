@@ -4,39 +4,66 @@ import asyncio
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGridLayout, QFrame
 )
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import QEvent, Qt, QTimer
 from PyQt6.QtGui import QFont, QPixmap
-import requests
 from dotenv import load_dotenv
 from qasync import QEventLoop, asyncSlot
+from pm2aqi_core.aqi import DEFAULT_STANDARD, OUT_OF_RANGE, aqi_from_pm25, standard_name
+from pm2aqi_core.client import AmbientClient
+from pm2aqi_core.fetcher import Fetcher
+from pm2aqi_core.backfill import Backfiller
+from pm2aqi_core.history import HistoryStore, HistoryWriter
+from pm2aqi_core.http import AsyncHTTPClient
+from pm2aqi_core.metrics import METRICS_PATH, Metrics
+from pm2aqi_core.nowcast import AQI_BASES, BASIS_LABELS, NowCastTracker, aqi_by_basis, basis_pm25
+from pm2aqi_core.poller import PollerSubscriber, key_id
+from pm2aqi_core.realtime import RealtimeStream
+from pm2aqi_core.rolling import RollingTracker
+from pm2aqi_core.scheduler import RefreshScheduler
+from pm2aqi_core.viewmodel import ViewModel
+from pm2aqi_core.fields import compile_formatter
+from pm2aqi_core.standards import STANDARDS
+from pm2aqi_core.formatting import FORECAST_ICONS, format_clock, format_range, uv_level
 
-# Helper for running blocking code in a thread
-async def run_in_executor(func, *args, **kwargs):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+# (label, field, window) shown under the tiles as "min–max (avg)"
+TILE_STATS = (
+    ("PM2.5", 'pm25', '24h'),
+    ("Temp", 'tempf', '24h'),
+    ("Gust", 'windgustmph', '1h'),
+)
+# (widget, field, template) for the tiles that show one field as text;
+# the template's "{}" takes the value, None means value and unit
+TILE_FIELDS = (
+    ('wind_speed', 'windspeedmph', "{}"),
+    ('rain_value_unit', 'dailyrainin', None),
+    ('out_temp', 'tempf', None),
+    ('out_hum', 'humidity', None),
+    ('in_temp', 'tempinf', None),
+    ('in_hum', 'humidityin', None),
+    # Absolute pressure, and solar radiation rounded by the registry
+    ('pressure_value', 'baromabsin', "{}"),
+    ('light_value', 'solarradiation', "{}"),
+    ('uv_value', 'uv', "{}"),
+    ('pm25_widget', 'pm25', "PM2.5: {} μg/m³"),
+)
+TILE_FORMATTERS = tuple((widget, compile_formatter(field, template)) for widget, field, template in TILE_FIELDS)
+# Labels update_reading writes to
+TILE_WIDGETS = (
+    'name_label', 'wind_speed', 'rain_value_unit', 'out_temp', 'out_hum', 'in_temp', 'in_hum',
+    'pressure_value', 'light_value', 'uv_value', 'uv_level', 'pm25_widget', 'aqi_widget',
+    'forecast_icon', 'stats_label',
+)
 
-class Dashboard(QWidget):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Ambient Weather Station Dashboard")
-        self.setMinimumSize(800, 350)
-        self.setStyleSheet("background: #181818; color: #fff;")
-        self.api_key = ""
-        self.app_key = ""
-        self.refresh_timer = QTimer(self)
-        self.refresh_timer.timeout.connect(self.fetch_and_update)
-        self.init_ui()
-        self.load_api_keys()
-        self.refresh_timer.start(60000)  # Refresh every 60 seconds
 
-    def load_api_keys(self):
-        load_dotenv()
-        self.api_key = os.getenv('AMBIENT_API_KEY', '')
-        self.app_key = os.getenv('AMBIENT_APP_KEY', '')
-        if self.api_key and self.app_key:
-            self.fetch_and_update()
+class StationTiles(QWidget):
+    # Tile set for one station. header, if given, fills the top-right slot
+    # (the first station hosts the dashboard clock there).
+    def __init__(self, header=None):
+        super().__init__()
+        self.init_ui(header)
+        self.view_model = ViewModel({name: getattr(self, name) for name in TILE_WIDGETS})
 
-    def init_ui(self):
+    def init_ui(self, header):
         font_large = QFont("Arial", 36, QFont.Weight.Bold)
         font_med = QFont("Arial", 24, QFont.Weight.Bold)
         font_small = QFont("Arial", 16)
@@ -44,7 +71,7 @@ class Dashboard(QWidget):
 
         main_layout = QGridLayout()
         main_layout.setSpacing(8)
-        main_layout.setContentsMargins(12, 12, 12, 12)
+        main_layout.setContentsMargins(0, 0, 0, 0)
 
         # PM2.5 and AQI widgets (top row)
         pm_aqi_frame = QFrame()
@@ -148,18 +175,6 @@ class Dashboard(QWidget):
         indoor_frame.setLayout(indoor_layout)
         main_layout.addWidget(indoor_frame, 2, 1, 1, 1)
 
-        # TIME, DAY, DATE (yellow)
-        time_frame = QFrame()
-        time_frame.setStyleSheet("background: #181818;")
-        time_layout = QVBoxLayout()
-        self.time_date_label = QLabel("1:57 Thu 05.22")
-        self.time_date_label.setFont(QFont("Arial", 35, QFont.Weight.Bold))
-        self.time_date_label.setStyleSheet("color: #ffe082;")
-        self.time_date_label.setAlignment(Qt.AlignmentFlag.AlignRight)
-        time_layout.addWidget(self.time_date_label)
-        time_frame.setLayout(time_layout)
-        main_layout.addWidget(time_frame, 0, 2, 1, 2)
-
         # FORECAST ICON (centered, placeholder)
         forecast_frame = QFrame()
         forecast_frame.setStyleSheet("background: #222; border-radius: 8px;")
@@ -243,146 +258,305 @@ class Dashboard(QWidget):
         light_frame.setLayout(light_layout)
         main_layout.addWidget(light_frame, 2, 3, 1, 1)
 
-        self.setLayout(main_layout)
+        if header is not None:
+            main_layout.addWidget(header, 0, 2, 1, 2)
+
+        # Rolling statistics (bottom row)
+        self.stats_label = QLabel("")
+        self.stats_label.setFont(font_xsmall)
+        self.stats_label.setStyleSheet("color: #aaa;")
+        main_layout.addWidget(self.stats_label, 3, 0, 1, 4)
+
+        # Station name above the tiles, shown when there are several stations
+        self.name_label = QLabel()
+        self.name_label.setFont(font_small)
+        self.name_label.setStyleSheet("color: #ffe082;")
+        self.name_label.setVisible(False)
+        outer_layout = QVBoxLayout()
+        outer_layout.setContentsMargins(0, 0, 0, 0)
+        outer_layout.addWidget(self.name_label)
+        outer_layout.addLayout(main_layout)
+        self.setLayout(outer_layout)
+
+    def update_reading(self, data, show_name=False, basis='nowcast', standard=DEFAULT_STANDARD):
+        # Only the labels whose text changed since the last reading are set
+        return self.view_model.apply(self.view(data, show_name, basis, standard))
+
+    def view(self, data, show_name=False, basis='nowcast', standard=DEFAULT_STANDARD):
+        view = {
+            ('name_label', 'text'): data['name'],
+            ('name_label', 'visible'): show_name,
+            ('uv_level', 'text'): uv_level(data['uv']),
+            ('forecast_icon', 'text'): FORECAST_ICONS.get(data['weather'], '☁️'),
+        }
+        for widget, text in TILE_FORMATTERS:
+            view[widget, 'text'] = text(data)
+        if basis == 'all':
+            # NowCast, instant and 24-hour AQI side by side
+            by_basis = aqi_by_basis(data, standard)
+            view['aqi_widget', 'text'] = "AQI: " + " / ".join(str(aqi) for _, aqi in by_basis)
+            view['aqi_widget', 'tooltip'] = " / ".join(label for label, _ in by_basis) + f" ({standard_name(standard)})"
+        else:
+            value, used = basis_pm25(data, basis)
+            view['aqi_widget', 'tooltip'] = f"{BASIS_LABELS[used]} AQI ({standard_name(standard)})"
+            try:
+                view['aqi_widget', 'text'] = f"AQI: {self.aqi_from_pm25(float(value), standard)}"
+            except Exception:
+                view['aqi_widget', 'text'] = "AQI: --"
+        rolling = data.get('rolling') or {}
+        view['stats_label', 'text'] = "  ·  ".join(
+            f"{label} {window} {format_range(rolling[field][window])}"
+            for label, field, window in TILE_STATS
+            if rolling.get(field, {}).get(window) is not None
+        )
+        return view
+
+    def aqi_from_pm25(self, pm_value, standard=DEFAULT_STANDARD):
+        # Returns AQI as int; the top of the standard's scale when out of range
+        aqi, _, _ = aqi_from_pm25(pm_value, standard)
+        if aqi == OUT_OF_RANGE[0]:
+            return STANDARDS[standard][5]['pm25'][2][-1][3]
+        return aqi
+
+class Dashboard(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Ambient Weather Station Dashboard")
+        self.setMinimumSize(800, 350)
+        self.setStyleSheet("background: #181818; color: #fff;")
+        self.api_key = ""
+        self.app_key = ""
+        # Keep-alive connection pool shared by every poll
+        self.http = AsyncHTTPClient()
+        self.fetcher = Fetcher(self.fetch_latest)
+        self.metrics = Metrics()
+        # Every poll is recorded; writes happen off the UI thread
+        self.history = HistoryWriter()
+        self.history_store = HistoryStore()
+        self.backfill = None
+        # Set while readings are pushed by a shared poller daemon
+        self.subscriber = None
+        # PM2AQI_REALTIME=1 streams updates instead of polling every minute
+        self.stream = None
+        self.readings = []
+        self.nowcast = NowCastTracker(self.history_store)
+        self.rolling = RollingTracker(self.history_store)
+        # nowcast, instant, avg24 or all
+        self.aqi_basis = os.getenv('PM2AQI_AQI_BASIS', 'nowcast')
+        if self.aqi_basis not in AQI_BASES + ('all',):
+            self.aqi_basis = 'nowcast'
+        # us, us-2012, cn, in or eu (see pm2aqi_core/standards.py)
+        self.aqi_standard = os.getenv('PM2AQI_AQI_STANDARD', DEFAULT_STANDARD)
+        if self.aqi_standard not in STANDARDS:
+            self.aqi_standard = DEFAULT_STANDARD
+        self.tiles = []
+        # Polls just after the stations report, about once a minute
+        self.scheduler = RefreshScheduler()
+        self.last_poll = None
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.fetch_and_update)
+        self.init_ui()
+        self.load_api_keys()
+
+    def load_api_keys(self):
+        load_dotenv()
+        self.api_key = os.getenv('AMBIENT_API_KEY', '')
+        self.app_key = os.getenv('AMBIENT_APP_KEY', '')
+        if self.api_key and self.app_key:
+            # subscribe() polls directly, and starts the refresh timer, only
+            # once it knows no poller daemon answered
+            self.subscribe()
+            if os.getenv('PM2AQI_REALTIME', '') not in ('', '0'):
+                self.stream = RealtimeStream(self.api_key, self.app_key, self.apply_update, self.realtime_state)
+                self.stream.start()
+        else:
+            self.schedule_refresh()
+
+    def init_ui(self):
+        self.main_layout = QVBoxLayout()
+        self.main_layout.setSpacing(16)
+        self.main_layout.setContentsMargins(12, 12, 12, 12)
+        self.add_tiles(self.make_clock())
+        # PM2AQI_DIAGNOSTICS=1 shows fetch and render timings under the tiles
+        self.diagnostics_label = None
+        if os.getenv('PM2AQI_DIAGNOSTICS', '') not in ('', '0'):
+            self.diagnostics_label = QLabel("")
+            self.diagnostics_label.setFont(QFont("Courier New", 9))
+            self.diagnostics_label.setStyleSheet("color: #888;")
+            self.main_layout.addWidget(self.diagnostics_label)
+        self.setLayout(self.main_layout)
+
+    def make_clock(self):
+        # TIME, DAY, DATE (yellow)
+        time_frame = QFrame()
+        time_frame.setStyleSheet("background: #181818;")
+        time_layout = QVBoxLayout()
+        self.time_date_label = QLabel("1:57 Thu 05.22")
+        self.time_date_label.setFont(QFont("Arial", 35, QFont.Weight.Bold))
+        self.time_date_label.setStyleSheet("color: #ffe082;")
+        self.time_date_label.setAlignment(Qt.AlignmentFlag.AlignRight)
+        time_layout.addWidget(self.time_date_label)
+        time_frame.setLayout(time_layout)
+        return time_frame
+
+    def add_tiles(self, header=None):
+        tiles = StationTiles(header)
+        # Above the diagnostics label, if there is one
+        self.main_layout.insertWidget(len(self.tiles), tiles)
+        self.tiles.append(tiles)
 
     def fetch_and_update(self):
+        if self.subscriber is not None:
+            return  # the poller daemon pushes every reading
         self.async_fetch()
 
     def closeEvent(self, event):
         self.refresh_timer.stop()
+        self.fetcher.cancel()
+        if self.subscriber is not None:
+            self.subscriber.close()
+        if self.stream is not None:
+            self.stream.cancel()
+        if self.backfill is not None:
+            self.backfill.cancel()
+        self.http.close()
+        self.history.close()
+        self.history_store.close()
         super().closeEvent(event)
 
     @asyncSlot()
     async def async_fetch(self):
         if not self.isVisible():
+            self.schedule_refresh()
             return
-        data, error = await run_in_executor(self.fetch_weather_from_ambient, self.api_key, self.app_key)
-        if error:
+        with self.metrics.span('fetch'):
+            result = await self.fetcher.fetch()
+        if result is None or result is self.last_poll:
+            return  # superseded, or shared with a caller that handles it
+        self.last_poll = result
+        self.metrics.inc('fetch_errors' if result[1] else 'fetches')
+        # Nothing new since the last poll: skip the redraw and history work
+        if self.scheduler.observe(*result):
+            self.show_readings(*result)
+        else:
+            if not result[1]:
+                self.metrics.inc('skipped_polls')
+            self.report_metrics()
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        self.time_date_label.setToolTip(self.scheduler.summary())
+        # A running poller daemon or a connected stream does the polling
+        if self.subscriber is not None or (self.stream is not None and self.stream.connected):
+            self.refresh_timer.stop()
             return
-        # Update UI with data
-        self.wind_speed.setText(str(data.get('windspeedmph', '--')))
-        self.rain_value_unit.setText(f"{data.get('dailyrainin', '--')} in")
-        self.out_temp.setText(f"{data.get('tempf', '--')} °F")
-        self.out_hum.setText(f"{data.get('humidity', '--')}%")
-        self.in_temp.setText(f"{data.get('tempinf', '--')} °F")
-        self.in_hum.setText(f"{data.get('humidityin', '--')}%")
-        # Use absolute pressure (baromabsin) and rounded solar radiation
-        self.pressure_value.setText(str(data.get('baromabsin', '--')))
-        solrad = data.get('solarradiation', '--')
-        if isinstance(solrad, float) or isinstance(solrad, int):
-            solrad = str(int(round(solrad, 0)))  # round to nearest integer
-        self.light_value.setText(solrad)
-        # Set UVI level text
-        try:
-            uvi = float(data.get('uv', 0))
-            if uvi < 3:
-                level = "LOW"
-            elif uvi < 6:
-                level = "MODERATE"
-            elif uvi < 8:
-                level = "HIGH"
-            elif uvi < 11:
-                level = "VERY HIGH"
-            else:
-                level = "EXTREME"
-            self.uv_level.setText(level)
-        except Exception:
-            self.uv_level.setText("--")
-        # PM2.5 and AQI update
-        pm25 = data.get('pm25', None)
-        if pm25 is None or pm25 == '--':
-            pm25 = data.get('pm25_out', '--')
-        self.pm25_widget.setText(f"PM2.5: {pm25} μg/m³")
-        try:
-            pm25_val = float(pm25)
-            aqi = self.aqi_from_pm25(pm25_val)
-            self.aqi_widget.setText(f"AQI: {aqi}")
-        except Exception:
-            self.aqi_widget.setText("AQI: --")
-        # Forecast icon (simple mapping)
-        forecast = data.get('weather', 'cloudy')
-        icon_map = {
-            'cloudy': '☁️',
-            'sunny': '☀️',
-            'rain': '🌧️',
-            'snow': '❄️',
-            'partlycloudy': '⛅',
-        }
-        self.forecast_icon.setText(icon_map.get(forecast, '☁️'))
-        # Time and date (single line, always current local time)
-        from datetime import datetime
-        # Force use of pytz for consistency with pm2aqi.py
-        from pytz import timezone, utc
-        tz_pacific = timezone("US/Pacific")
-        now_utc = datetime.utcnow()
-        now_utc = now_utc.replace(tzinfo=utc)
-        now = now_utc.astimezone(tz_pacific)
-        # Use platform-independent hour formatting (no leading zero, no '-')
-        hour = now.strftime('%I').lstrip('0') or '0'
-        minute = now.strftime('%M')
-        ampm = now.strftime('%p')
-        ampm = '' if ampm == 'AM' else 'p'
-        time_str = f"{hour}:{minute}{ampm} {now.strftime('%a %m.%d')}"
-        self.time_date_label.setText(time_str)
-
-    def fetch_weather_from_ambient(self, api_key, app_key):
+        handle = self.windowHandle()
+        visible = (self.isVisible() and not self.isMinimized()
+                   and (handle is None or handle.isExposed()))
+        self.refresh_timer.start(int(self.scheduler.next_delay(visible=visible) * 1000))
+
+    def changeEvent(self, event):
+        # Minimized windows poll slowly, and catch up when restored
+        if event.type() == QEvent.Type.WindowStateChange and self.refresh_timer.isActive():
+            self.schedule_refresh()
+        super().changeEvent(event)
+
+    @asyncSlot()
+    async def subscribe(self):
+        # Take readings from a running poller daemon instead of polling;
+        # the refresh timer takes over again if the daemon goes away
+        if self.subscriber is not None:
+            return
+        subscriber = PollerSubscriber()
+        if not await subscriber.connect(key_id(self.api_key, self.app_key)):
+            self.fetch_and_update()
+            return
+        self.subscriber = subscriber
+        self.refresh_timer.stop()
         try:
-            url = f"https://rt.ambientweather.net/v1/devices?apiKey={api_key}&applicationKey={app_key}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                return None, f"API error: {response.status_code}"
-            devices = response.json()
-            if not devices:
-                return None, "No devices found."
-            device = devices[0]
-            last_data = device.get('lastData', {})
-            # Improved current conditions logic for icon:
-            tempf = last_data.get('tempf', 40)
-            rain_rate = last_data.get('hourlyrainin', 0)
-            daily_rain = last_data.get('dailyrainin', 0)
-            solarrad = last_data.get('solarradiation', 0)
-            # Default
-            weather = 'cloudy'
-            # If it's raining (rain rate or daily rain just increased)
-            if rain_rate > 0.01:
-                # If cold enough, show snow
-                if tempf <= 34:
-                    weather = 'snow'
-                else:
-                    weather = 'rain'
-            # If not raining, check for snow (below freezing, some rain)
-            elif tempf <= 34 and (rain_rate > 0 or daily_rain > 0):
-                weather = 'snow'
-            # If not raining or snowing, check for sun/partly/cloudy
-            elif solarrad > 600:
-                weather = 'sunny'
-            elif solarrad > 200:
-                weather = 'partlycloudy'
-            else:
-                weather = 'cloudy'
-            last_data['weather'] = weather
-            return last_data, None
-        except Exception as e:
-            return None, f'Error fetching data: {e}'
-
-    def aqi_from_pm25(self, pm_value):
-        # Returns AQI as int (US EPA breakpoints)
-        if 0 <= pm_value <= 12:
-            return int((50/12) * pm_value)
-        elif 12 < pm_value <= 35.4:
-            return int(((100-51)/(35.4-12.1)) * (pm_value-12.1) + 51)
-        elif 35.4 < pm_value <= 55.4:
-            return int(((150-101)/(55.4-35.5)) * (pm_value-35.5) + 101)
-        elif 55.4 < pm_value <= 150.4:
-            return int(((200-151)/(150.4-55.5)) * (pm_value-55.5) + 151)
-        elif 150.4 < pm_value <= 250.4:
-            return int(((300-201)/(250.4-150.5)) * (pm_value-150.5) + 201)
-        elif 250.4 < pm_value <= 350.4:
-            return int(((400-301)/(350.4-250.5)) * (pm_value-250.5) + 301)
-        elif 350.4 < pm_value <= 500.4:
-            return int(((500-401)/(500.4-350.5)) * (pm_value-350.5) + 401)
+            async for readings, error in subscriber:
+                if self.isVisible():
+                    self.show_readings(readings, error)
+        finally:
+            self.subscriber = None
+            self.schedule_refresh()
+
+    def show_readings(self, readings, error):
+        if error:
+            return
+        with self.metrics.span('render'):
+            with self.metrics.span('track'):
+                self.record(readings)
+                self.nowcast.update(readings)
+                self.rolling.update(readings)
+            self.readings = readings
+            # Tiles set only the labels that changed; Qt repaints them together
+            with self.metrics.span('widgets'):
+                while len(self.tiles) < len(readings):
+                    self.add_tiles()
+                while len(self.tiles) > max(len(readings), 1):
+                    self.tiles.pop().deleteLater()
+                for tiles, data in zip(self.tiles, readings):
+                    tiles.update_reading(data, show_name=len(readings) > 1, basis=self.aqi_basis,
+                                         standard=self.aqi_standard)
+                # Time and date (single line, always current local time)
+                self.time_date_label.setText(format_clock())
+        self.metrics.inc('renders')
+        self.report_metrics()
+
+    def report_metrics(self):
+        if self.diagnostics_label is not None:
+            self.diagnostics_label.setText(self.metrics.summary())
+        if METRICS_PATH:
+            try:
+                self.metrics.write(METRICS_PATH)
+            except OSError:
+                pass
+
+    def apply_update(self, updates):
+        # Realtime push: only the tiles of the stations in updates change
+        index = {r['mac']: i for i, r in enumerate(self.readings)}
+        if any(u['mac'] not in index for u in updates):
+            merged = {r['mac']: r for r in self.readings}
+            merged.update((u['mac'], u) for u in updates)
+            self.show_readings(list(merged.values()), None)
+            return
+        self.record(updates)
+        self.nowcast.update(updates)
+        self.rolling.update(updates)
+        for data in updates:
+            i = index[data['mac']]
+            self.readings[i] = data
+            self.tiles[i].update_reading(data, show_name=len(self.readings) > 1, basis=self.aqi_basis,
+                                         standard=self.aqi_standard)
+        self.time_date_label.setText(format_clock())
+
+    def realtime_state(self, connected):
+        # The refresh timer only runs while the stream is down
+        if connected:
+            self.refresh_timer.stop()
         else:
-            return 500
+            self.fetch_and_update()
+
+    def record(self, readings):
+        # History and backfill; a poller daemon does both for every subscriber
+        if self.subscriber is None:
+            self.start_backfill(readings)
+            self.history.submit(readings)
+
+    def start_backfill(self, readings):
+        # Fill history gaps for stations seen for the first time this session
+        keys = (self.api_key, self.app_key)
+        if self.backfill is None or (self.backfill.api_key, self.backfill.app_key) != keys:
+            if self.backfill is not None:
+                self.backfill.cancel()
+            self.backfill = Backfiller(self.http, *keys, self.history, self.history_store)
+        self.backfill.watch(readings)
+
+    async def fetch_latest(self):
+        client = AmbientClient(self.api_key, self.app_key, http=self.http, metrics=self.metrics)
+        return await client.fetch_readings()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
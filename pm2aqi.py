@@ -2,20 +2,62 @@ import sys
 import asyncio
 import os
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QCheckBox, QTextEdit, QGroupBox, QFrame, QSizePolicy
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QCheckBox, QTextEdit, QGroupBox, QFrame, QSizePolicy, QComboBox
 )
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import QEvent, Qt, QTimer
 from PyQt6.QtGui import QFont, QIcon
-import requests
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from dotenv import load_dotenv
 from qasync import QEventLoop, asyncSlot
+from pm2aqi_core.aqi import DEFAULT_STANDARD, OUT_OF_RANGE, aqi_details_text, aqi_from_pm25, colors, standard_name
+from pm2aqi_core.client import AmbientClient
+from pm2aqi_core.fetcher import Fetcher
+from pm2aqi_core.fields import FIELD_INFO, compile_formatter, label
+from pm2aqi_core.backfill import Backfiller
+from pm2aqi_core.history import HistoryStore, HistoryWriter
+from pm2aqi_core.http import AsyncHTTPClient
+from pm2aqi_core.metrics import METRICS_PATH, Metrics
+from pm2aqi_core.nowcast import AQI_BASES, BASIS_LABELS, NowCastTracker, aqi_by_basis, basis_pm25
+from pm2aqi_core.poller import PollerSubscriber, key_id
+from pm2aqi_core.realtime import RealtimeStream
+from pm2aqi_core.rolling import RollingTracker
+from pm2aqi_core.scheduler import RefreshScheduler
+from pm2aqi_core.trends import TrendTracker
+from pm2aqi_core.viewmodel import ViewModel
+from pm2aqi_core.formatting import display, format_rolling, format_weather
+from pm2aqi_core.standards import STANDARDS
+from trend_chart import SERIES, SPANS, TrendChart
 
-# Async helper for running blocking code in a thread
-async def run_in_executor(func, *args, **kwargs):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+NO_DATA_COLOR = "#9e9e9e"
+INVALID_COLOR = "#e57373"
+# Every category color of every standard
+AQI_COLORS = tuple(dict.fromkeys(color for standard in STANDARDS for color in colors(standard)))
+# Stylesheets per AQI color, built once; the view-model only re-applies one
+# when the color changes
+BADGE_STYLES = {
+    color: f"border-radius: 16px; padding: 16px; background: {color}; color: #fff;"
+    for color in AQI_COLORS + (OUT_OF_RANGE[2], INVALID_COLOR)
+}
+ROW_STYLES = {
+    color: f"border-radius: 8px; padding: 4px 12px; background: {color}; color: #fff;"
+    for color in AQI_COLORS + (OUT_OF_RANGE[2], NO_DATA_COLOR)
+}
+# (widget, field) for the summary bubbles; each reads "label: value unit"
+# from the field registry, and an empty reading gives the placeholder text
+SUMMARY_FIELDS = (
+    ('o_temp_label', 'tempf'),
+    ('i_temp_label', 'tempinf'),
+    ('wind_label', 'windspeedmph'),
+    ('rain_label', 'dailyrainin'),
+)
+SUMMARY_FORMATTERS = tuple(
+    (widget, compile_formatter(field, f"{label(field)}: {{}}{FIELD_INFO[field][2]}"))
+    for widget, field in SUMMARY_FIELDS
+)
+# Widgets written through the view-model
+VIEW_WIDGETS = (
+    'pm_input', 'aqi_badge', 'aqi_basis_label', 'aqi_compare_label', 'aqi_details_text',
+    'o_temp_label', 'i_temp_label', 'wind_label', 'rain_label', 'weather_text',
+)
 
 class PM2AQIApp(QWidget):
     def __init__(self):
@@ -24,11 +66,39 @@ class PM2AQIApp(QWidget):
         self.setMinimumSize(500, 500)
         self.api_key = ""
         self.app_key = ""
+        # Keep-alive connection pool shared by every poll
+        self.http = AsyncHTTPClient()
+        # Timer, button and auto-refresh share one in-flight request
+        self.fetcher = Fetcher(self.fetch_latest)
+        # Stage timings and counters for the diagnostics panel and
+        # PM2AQI_METRICS
+        self.metrics = Metrics()
+        # Every poll is recorded; writes happen off the UI thread
+        self.history = HistoryWriter()
+        self.history_store = HistoryStore()
+        self.nowcast = NowCastTracker(self.history_store)
+        self.rolling = RollingTracker(self.history_store)
+        # Created, and seeded from history, when the trend chart is first shown
+        self.trends = None
+        self.backfill = None
+        # Set while readings are pushed by a shared poller daemon
+        self.subscriber = None
+        # Realtime feed, when enabled
+        self.stream = None
         self.auto_refresh = False
+        # Auto-refresh polls just after the stations report, not on a fixed tick
+        self.scheduler = RefreshScheduler()
+        self.last_poll = None
         self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
         self.refresh_timer.timeout.connect(self.fetch_and_update)
         self.api_fields_visible = True
+        # Latest reading per station, and the station shown in the badge
+        self.readings = []
+        self.selected_mac = None
+        self.station_rows = []
         self.init_ui()
+        self.view_model = ViewModel({name: getattr(self, name) for name in VIEW_WIDGETS})
         self.load_api_keys()
         # Set window icon to use the new PNG image
         from PyQt6.QtGui import QIcon
@@ -44,8 +114,10 @@ class PM2AQIApp(QWidget):
             self.toggle_api_fields(False)
             self.api_group.setVisible(False)
             self.change_api_btn.setVisible(True)
-            # Fetch data on startup if keys are present
-            self.fetch_and_update()
+            # Fetch data on startup if keys are present, from the shared
+            # poller when one is running
+            self.api_key, self.app_key = api_key, app_key
+            self.subscribe()
         else:
             self.toggle_api_fields(True)
             self.api_group.setVisible(True)
@@ -64,7 +136,7 @@ class PM2AQIApp(QWidget):
         api_key = self.api_key_input.text().strip()
         app_key = self.app_key_input.text().strip()
         if not api_key or not app_key:
-            self.weather_text.setText("Please enter both API Key and App Key.")
+            self.show_message("Please enter both API Key and App Key.")
             return
         with open('.env', 'w') as f:
             f.write(f'AMBIENT_API_KEY={api_key}\n')
@@ -103,6 +175,8 @@ class PM2AQIApp(QWidget):
         pm_layout = QHBoxLayout()
         self.pm_input = QLineEdit()
         self.pm_input.setPlaceholderText("PM2.5 value (1-500)")
+        # A typed value is converted as-is, not from a fetched basis
+        self.pm_input.textEdited.connect(self.manual_input)
         pm_layout.addWidget(self.pm_input)
         self.calc_btn = QPushButton("Calculate AQI")
         self.calc_btn.clicked.connect(self.calculate_aqi)
@@ -114,9 +188,49 @@ class PM2AQIApp(QWidget):
         layout.addWidget(pm_group)
 
         # Auto-refresh
-        self.auto_refresh_check = QCheckBox("Auto-Refresh (every 60s)")
+        self.auto_refresh_check = QCheckBox("Auto-Refresh (about every 60s, when stations report)")
         self.auto_refresh_check.stateChanged.connect(self.toggle_auto_refresh)
         layout.addWidget(self.auto_refresh_check)
+        self.poll_stats_label = QLabel("")
+        self.poll_stats_label.setStyleSheet("color: #666; font-size: 11px;")
+        self.poll_stats_label.setVisible(False)
+        layout.addWidget(self.poll_stats_label)
+        self.realtime_check = QCheckBox("Realtime updates (falls back to polling if the stream drops)")
+        self.realtime_check.toggled.connect(self.toggle_realtime)
+        layout.addWidget(self.realtime_check)
+
+        # Which PM2.5 concentration fetched readings are converted from
+        basis_layout = QHBoxLayout()
+        basis_layout.addWidget(QLabel("AQI basis:"))
+        self.aqi_basis_select = QComboBox()
+        self.aqi_basis_select.addItems([BASIS_LABELS[b] for b in AQI_BASES])
+        self.aqi_basis_select.currentIndexChanged.connect(self.refresh_aqi_basis)
+        basis_layout.addWidget(self.aqi_basis_select)
+        self.show_all_bases_check = QCheckBox("Show all side by side")
+        self.show_all_bases_check.toggled.connect(lambda checked: self.aqi_compare_label.setVisible(checked))
+        basis_layout.addWidget(self.show_all_bases_check)
+        basis_layout.addStretch(1)
+        layout.addLayout(basis_layout)
+
+        # Which AQI standard every conversion uses; PM2AQI_AQI_STANDARD
+        # picks the initial one
+        standard_layout = QHBoxLayout()
+        standard_layout.addWidget(QLabel("AQI standard:"))
+        self.aqi_standard_select = QComboBox()
+        for key in STANDARDS:
+            self.aqi_standard_select.addItem(standard_name(key), key)
+        initial = self.aqi_standard_select.findData(os.getenv('PM2AQI_AQI_STANDARD', DEFAULT_STANDARD))
+        self.aqi_standard_select.setCurrentIndex(max(initial, 0))
+        self.aqi_standard_select.currentIndexChanged.connect(self.refresh_aqi_standard)
+        standard_layout.addWidget(self.aqi_standard_select)
+        standard_layout.addStretch(1)
+        layout.addLayout(standard_layout)
+
+        # Station selector (only shown when the account has several devices)
+        self.station_select = QComboBox()
+        self.station_select.setVisible(False)
+        self.station_select.currentIndexChanged.connect(self.show_selected_station)
+        layout.addWidget(self.station_select)
 
         # AQI output (large badge)
         self.aqi_badge = QLabel("AQI: --")
@@ -124,6 +238,14 @@ class PM2AQIApp(QWidget):
         self.aqi_badge.setFont(QFont("Arial", 32, QFont.Weight.Bold))
         self.aqi_badge.setStyleSheet("border-radius: 16px; padding: 16px; background: #e0e0e0; color: #222;")
         layout.addWidget(self.aqi_badge)
+        self.aqi_basis_label = QLabel("")
+        self.aqi_basis_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.aqi_basis_label)
+        self.aqi_compare_label = QLabel("")
+        self.aqi_compare_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.aqi_compare_label.setFont(QFont("Arial", 14, QFont.Weight.Bold))
+        self.aqi_compare_label.setVisible(False)
+        layout.addWidget(self.aqi_compare_label)
 
         # Show AQI Details button
         self.show_aqi_details_btn = QPushButton("Show AQI Details")
@@ -148,22 +270,24 @@ class PM2AQIApp(QWidget):
             "border-radius: 16px; padding: 16px; background: #1976d2; color: #fff; "
             "font-size: 16px; min-width: 120px; min-height: 48px; text-align: center;"
         )
-        self.o_temp_label = QLabel("Outdoor Temp: -- °F")
+        self.o_temp_label = QLabel()
         self.o_temp_label.setFont(QFont("Arial", 16))
         self.o_temp_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.o_temp_label.setStyleSheet(bubble_style)
-        self.i_temp_label = QLabel("Indoor Temp: -- °F")
+        self.i_temp_label = QLabel()
         self.i_temp_label.setFont(QFont("Arial", 16))
         self.i_temp_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.i_temp_label.setStyleSheet(bubble_style)
-        self.wind_label = QLabel("Wind: -- mph")
+        self.wind_label = QLabel()
         self.wind_label.setFont(QFont("Arial", 16))
         self.wind_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.wind_label.setStyleSheet(bubble_style)
-        self.rain_label = QLabel("Rain: -- in")
+        self.rain_label = QLabel()
         self.rain_label.setFont(QFont("Arial", 16))
         self.rain_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.rain_label.setStyleSheet(bubble_style)
+        for widget, text in SUMMARY_FORMATTERS:
+            getattr(self, widget).setText(text({}))
         row1.addWidget(self.o_temp_label)
         row1.addWidget(self.i_temp_label)
         row2.addWidget(self.wind_label)
@@ -173,6 +297,13 @@ class PM2AQIApp(QWidget):
         summary_group.setLayout(summary_layout)
         layout.addWidget(summary_group)
 
+        # One AQI + summary row per station (hidden for single-device accounts)
+        self.stations_group = QGroupBox("Stations")
+        self.stations_layout = QVBoxLayout()
+        self.stations_group.setLayout(self.stations_layout)
+        self.stations_group.setVisible(False)
+        layout.addWidget(self.stations_group)
+
         # Show More button for full weather details (centered)
         self.show_more_btn = QPushButton("Show More")
         self.show_more_btn.setCheckable(True)
@@ -180,6 +311,14 @@ class PM2AQIApp(QWidget):
         show_more_layout = QHBoxLayout()
         show_more_layout.addStretch(1)
         show_more_layout.addWidget(self.show_more_btn)
+        self.diagnostics_btn = QPushButton("Diagnostics")
+        self.diagnostics_btn.setCheckable(True)
+        self.diagnostics_btn.toggled.connect(self.toggle_diagnostics)
+        show_more_layout.addWidget(self.diagnostics_btn)
+        self.trends_btn = QPushButton("Trends")
+        self.trends_btn.setCheckable(True)
+        self.trends_btn.toggled.connect(self.toggle_trends)
+        show_more_layout.addWidget(self.trends_btn)
         show_more_layout.addStretch(1)
         layout.addLayout(show_more_layout)
 
@@ -191,248 +330,403 @@ class PM2AQIApp(QWidget):
         self.weather_text.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
         layout.addWidget(self.weather_text)
 
+        # Trend chart of the selected station (hidden by default)
+        self.trend_panel = QWidget()
+        trend_layout = QVBoxLayout()
+        trend_layout.setContentsMargins(0, 0, 0, 0)
+        trend_controls = QHBoxLayout()
+        self.trend_series_select = QComboBox()
+        self.trend_series_select.addItems([label for _, label in SERIES])
+        self.trend_series_select.currentIndexChanged.connect(self.show_trend)
+        trend_controls.addWidget(self.trend_series_select)
+        self.trend_span_select = QComboBox()
+        self.trend_span_select.addItems([label for label, _ in SPANS])
+        self.trend_span_select.currentIndexChanged.connect(self.show_trend)
+        trend_controls.addWidget(self.trend_span_select)
+        trend_controls.addStretch(1)
+        trend_layout.addLayout(trend_controls)
+        self.trend_chart = TrendChart()
+        trend_layout.addWidget(self.trend_chart)
+        self.trend_panel.setLayout(trend_layout)
+        self.trend_panel.setVisible(False)
+        layout.addWidget(self.trend_panel)
+
+        # Fetch and render timings (hidden by default)
+        self.diagnostics_label = QLabel("")
+        self.diagnostics_label.setFont(QFont("Courier New", 9))
+        self.diagnostics_label.setStyleSheet("color: #555;")
+        self.diagnostics_label.setVisible(False)
+        layout.addWidget(self.diagnostics_label)
+
         self.setLayout(layout)
 
     def toggle_weather_details(self, checked):
         self.weather_text.setVisible(checked)
         self.show_more_btn.setText("Hide Details" if checked else "Show More")
 
+    def toggle_trends(self, checked):
+        self.trend_panel.setVisible(checked)
+        if checked and self.trends is None:
+            self.trends = TrendTracker(self.history_store)
+            self.trends.update(self.readings)
+        self.show_trend()
+
+    def show_trend(self):
+        # Points the chart at the selected station; it redraws only when the
+        # station, series or span changed, and otherwise adds new samples
+        if self.trends is None or self.selected_mac is None or not self.trend_panel.isVisible():
+            return
+        self.trend_chart.set_source(
+            self.trends.buffer(self.selected_mac),
+            SERIES[self.trend_series_select.currentIndex()][0],
+            SPANS[self.trend_span_select.currentIndex()][1],
+            self.aqi_standard(),
+        )
+
+    def toggle_diagnostics(self, checked):
+        self.diagnostics_label.setVisible(checked)
+        if checked:
+            self.diagnostics_label.setText(self.metrics.summary())
+
+    def report_metrics(self):
+        # The summary is only built while the panel is open
+        if self.diagnostics_label.isVisible():
+            self.diagnostics_label.setText(self.metrics.summary())
+        if METRICS_PATH:
+            try:
+                self.metrics.write(METRICS_PATH)
+            except OSError:
+                pass
+
     def toggle_aqi_details(self, checked):
         self.aqi_details_text.setVisible(checked)
         self.show_aqi_details_btn.setText("Hide AQI Details" if checked else "Show AQI Details")
         if checked:
-            self.aqi_details_text.setText(self.get_aqi_details_text())
+            self.view_model.apply({('aqi_details_text', 'text'): self.get_aqi_details_text()})
+
+    def manual_input(self, _):
+        # The user typed over the fetched value
+        self.view_model.reset(('pm_input', 'text'))
+        self.view_model.apply({('aqi_basis_label', 'text'): "Manual PM2.5"})
+
+    def show_message(self, text):
+        self.view_model.apply({('weather_text', 'text'): text})
 
     def calculate_aqi(self):
         try:
-            pm_value = float(self.pm_input.text())
-            aqi, category, color = self.aqi_from_pm25(pm_value)
-            self.aqi_badge.setText(f"AQI: {aqi}")
-            self.aqi_badge.setStyleSheet(f"border-radius: 16px; padding: 16px; background: {color}; color: #fff;")
-            # If AQI details are visible, update them immediately
-            if self.aqi_details_text.isVisible():
-                self.aqi_details_text.setText(self.get_aqi_details_text())
+            aqi, _, color = self.aqi_from_pm25(float(self.pm_input.text()))
+            view = {('aqi_badge', 'text'): f"AQI: {aqi}", ('aqi_badge', 'style'): BADGE_STYLES[color]}
         except ValueError:
-            self.aqi_badge.setText("Invalid input")
-            self.aqi_badge.setStyleSheet("border-radius: 16px; padding: 16px; background: #e57373; color: #fff;")
-            if self.aqi_details_text.isVisible():
-                self.aqi_details_text.setText("No valid PM2.5 value.")
+            view = {('aqi_badge', 'text'): "Invalid input", ('aqi_badge', 'style'): BADGE_STYLES[INVALID_COLOR]}
+        # If AQI details are visible, update them immediately
+        if self.aqi_details_text.isVisible():
+            view['aqi_details_text', 'text'] = self.get_aqi_details_text()
+        self.view_model.apply(view)
 
     def aqi_from_pm25(self, pm_value):
-        # Returns (aqi, category, color)
-        if 0 <= pm_value <= 12:
-            aqi = int((50/12) * pm_value)
-            return aqi, "Good", "#43a047"
-        elif 12 < pm_value <= 35.4:
-            aqi = int(((100-51)/(35.4-12.1)) * (pm_value-12.1) + 51)
-            return aqi, "Moderate", "#fbc02d"
-        elif 35.4 < pm_value <= 55.4:
-            aqi = int(((150-101)/(55.4-35.5)) * (pm_value-35.5) + 101)
-            return aqi, "Unhealthy for Sensitive Groups", "#fb8c00"
-        elif 55.4 < pm_value <= 150.4:
-            aqi = int(((200-151)/(150.4-55.5)) * (pm_value-55.5) + 151)
-            return aqi, "Unhealthy", "#e53935"
-        elif 150.4 < pm_value <= 250.4:
-            aqi = int(((300-201)/(250.4-150.5)) * (pm_value-150.5) + 201)
-            return aqi, "Very Unhealthy", "#8e24aa"
-        elif 250.4 < pm_value <= 350.4:
-            aqi = int(((400-301)/(350.4-250.5)) * (pm_value-250.5) + 301)
-            return aqi, "Hazardous", "#6d4c41"
-        elif 350.4 < pm_value <= 500.4:
-            aqi = int(((500-401)/(500.4-350.5)) * (pm_value-350.5) + 401)
-            return aqi, "Beyond AQI", "#212121"
-        else:
-            return "--", "Out of Range", "#e57373"
+        # Returns (aqi, category, color) under the selected standard
+        return aqi_from_pm25(pm_value, self.aqi_standard())
 
     def fetch_and_update(self):
-        self.api_key = self.api_key_input.text().strip()
-        self.app_key = self.app_key_input.text().strip()
+        api_key = self.api_key_input.text().strip()
+        app_key = self.app_key_input.text().strip()
+        if (api_key, app_key) != (self.api_key, self.app_key):
+            # A request made with the old keys is stale
+            self.fetcher.cancel()
+            self.scheduler = RefreshScheduler()
+        self.api_key = api_key
+        self.app_key = app_key
         if not self.api_key or not self.app_key:
-            self.weather_text.setText("Please enter both API Key and App Key.")
+            self.show_message("Please enter both API Key and App Key.")
+            self.schedule_refresh()
             return
+        if self.stream is not None and (self.stream.api_key, self.stream.app_key) != (api_key, app_key):
+            self.toggle_realtime(True)  # resubscribe with the new keys
+        if self.subscriber is not None:
+            if self.subscriber.key == key_id(self.api_key, self.app_key):
+                self.subscriber.refresh()  # the daemon polls for every window
+                return
+            self.subscriber.close()  # keys changed; poll directly again
         self.async_fetch()
 
     @asyncSlot()
     async def async_fetch(self):
-        data, error = await run_in_executor(self.fetch_pm25_and_weather_from_ambient, self.api_key, self.app_key)
+        with self.metrics.span('fetch'):
+            result = await self.fetcher.fetch()
+        if result is None or result is self.last_poll:
+            return  # superseded, or shared with a caller that handles it
+        self.last_poll = result
+        self.metrics.inc('fetch_errors' if result[1] else 'fetches')
+        # Nothing new since the last poll: skip the redraw and history work
+        if self.scheduler.observe(*result):
+            self.show_readings(*result)
+        else:
+            if not result[1]:
+                self.metrics.inc('skipped_polls')
+            self.report_metrics()
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        self.poll_stats_label.setText(self.scheduler.summary())
+        self.poll_stats_label.setVisible(self.auto_refresh)
+        # A running poller daemon or a connected stream does the polling
+        if (not self.auto_refresh or self.subscriber is not None
+                or (self.stream is not None and self.stream.connected)):
+            self.refresh_timer.stop()
+            return
+        handle = self.windowHandle()
+        visible = (self.isVisible() and not self.isMinimized()
+                   and (handle is None or handle.isExposed()))
+        self.refresh_timer.start(int(self.scheduler.next_delay(visible=visible) * 1000))
+
+    def changeEvent(self, event):
+        # Minimized windows poll slowly, and catch up when restored
+        if event.type() == QEvent.Type.WindowStateChange and self.refresh_timer.isActive():
+            self.schedule_refresh()
+        super().changeEvent(event)
+
+    @asyncSlot()
+    async def subscribe(self):
+        # Take readings from a running poller daemon instead of polling
+        if self.subscriber is not None:
+            return
+        subscriber = PollerSubscriber()
+        if not await subscriber.connect(key_id(self.api_key, self.app_key)):
+            self.async_fetch()
+            return
+        self.subscriber = subscriber
+        self.refresh_timer.stop()
+        try:
+            async for readings, error in subscriber:
+                self.show_readings(readings, error)
+        finally:
+            self.subscriber = None
+            self.schedule_refresh()
+
+    def show_readings(self, readings, error):
+        with self.metrics.span('render'):
+            self.render_readings(readings, error)
+        self.metrics.inc('renders')
+        self.report_metrics()
+
+    def render_readings(self, readings, error):
         if error:
-            self.weather_text.setText(error)
+            self.show_message(error)
+            return
+        with self.metrics.span('track'):
+            self.record(readings)
+            self.nowcast.update(readings)
+            self.rolling.update(readings)
+            if self.trends is not None:
+                self.trends.update(readings)
+        if all(r['pm25'] is None for r in readings):
+            self.show_message("No PM2.5 data found.")
+            return
+        self.readings = readings
+        # Only changed properties are set, and Qt repaints them together on
+        # the next pass of the event loop. Disabling updates around this
+        # would repaint the whole window when they are re-enabled.
+        with self.metrics.span('widgets'):
+            self.update_stations(readings)
+            self.show_selected_station(self.station_select.currentIndex())
+
+    def apply_update(self, updates):
+        # Realtime push: only the stations in updates have changed
+        index = {r['mac']: i for i, r in enumerate(self.readings)}
+        if not self.readings or any(u['mac'] not in index for u in updates):
+            # First push after subscribing, or a new station: full refresh
+            merged = {r['mac']: r for r in self.readings}
+            merged.update((u['mac'], u) for u in updates)
+            self.show_readings(list(merged.values()), None)
+            return
+        self.record(updates)
+        self.nowcast.update(updates)
+        self.rolling.update(updates)
+        if self.trends is not None:
+            self.trends.update(updates)
+        for data in updates:
+            i = index[data['mac']]
+            self.readings[i] = data
+            self.update_station_row(self.station_rows[i], data)
+            if data['mac'] == self.selected_mac:
+                self.show_selected_station(i)
+
+    def toggle_realtime(self, checked):
+        if self.stream is not None:
+            self.stream.cancel()
+            self.stream = None
+        if checked and self.api_key and self.app_key:
+            self.stream = RealtimeStream(self.api_key, self.app_key, self.apply_update, self.realtime_state)
+            self.stream.start()
         else:
-            self.pm_input.setText(str(data.get('pm25', '')))
-            self.update_summary(data)
+            self.realtime_state(False)
+
+    def realtime_state(self, connected):
+        # While the stream is up it replaces polling; when it drops, poll
+        # until it reconnects
+        if connected:
+            self.refresh_timer.stop()
+        elif self.auto_refresh:
+            self.fetch_and_update()
+
+    def record(self, readings):
+        # History and backfill; a poller daemon does both for every subscriber
+        if self.subscriber is None:
+            self.start_backfill(readings)
+            self.history.submit(readings)
+
+    def start_backfill(self, readings):
+        # Fill history gaps for stations seen for the first time this session
+        keys = (self.api_key, self.app_key)
+        if self.backfill is None or (self.backfill.api_key, self.backfill.app_key) != keys:
+            if self.backfill is not None:
+                self.backfill.cancel()
+            self.backfill = Backfiller(self.http, *keys, self.history, self.history_store)
+        self.backfill.watch(readings)
+
+    async def fetch_latest(self):
+        client = AmbientClient(self.api_key, self.app_key, http=self.http, metrics=self.metrics)
+        return await client.fetch_readings()
+
+    def update_stations(self, readings):
+        # Station rows are only created or removed when the device count changes
+        while len(self.station_rows) < len(readings):
+            self.station_rows.append(self.add_station_row())
+        while len(self.station_rows) > len(readings):
+            self.station_rows.pop()[0].deleteLater()
+        for row, data in zip(self.station_rows, readings):
+            self.update_station_row(row, data)
+        multiple = len(readings) > 1
+        self.stations_group.setVisible(multiple)
+        self.station_select.setVisible(multiple)
+
+        macs = [r['mac'] for r in readings]
+        self.station_select.blockSignals(True)
+        if macs != [self.station_select.itemData(i) for i in range(self.station_select.count())]:
+            self.station_select.clear()
+            for data in readings:
+                self.station_select.addItem(data['name'], data['mac'])
+        if self.selected_mac in macs:
+            index = macs.index(self.selected_mac)
+        else:
+            # Default to the first station with a PM2.5 sensor
+            index = next(i for i, r in enumerate(readings) if r['pm25'] is not None)
+        self.station_select.setCurrentIndex(index)
+        self.station_select.blockSignals(False)
+
+    def update_station_row(self, row, data):
+        pm25, _ = basis_pm25(data, self.aqi_basis())
+        if pm25 is None:
+            aqi, color = "--", NO_DATA_COLOR
+        else:
+            aqi, _, color = self.aqi_from_pm25(pm25)
+        row[-1].apply({
+            ('name', 'text'): data['name'],
+            ('aqi', 'text'): f"AQI: {aqi}",
+            ('aqi', 'style'): ROW_STYLES[color],
+            ('summary', 'text'): (
+                f"{display(data['tempf'])} °F · {display(data['windspeedmph'])} mph · "
+                f"{display(data['dailyrainin'])} in"
+            ),
+        })
+
+    def add_station_row(self):
+        row = QWidget()
+        row_layout = QHBoxLayout()
+        row_layout.setContentsMargins(0, 0, 0, 0)
+        name_label = QLabel()
+        name_label.setFont(QFont("Arial", 12, QFont.Weight.Bold))
+        aqi_label = QLabel("AQI: --")
+        aqi_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        aqi_label.setMinimumWidth(90)
+        summary_label = QLabel()
+        row_layout.addWidget(name_label, 1)
+        row_layout.addWidget(aqi_label)
+        row_layout.addWidget(summary_label, 2)
+        row.setLayout(row_layout)
+        self.stations_layout.addWidget(row)
+        view_model = ViewModel({'name': name_label, 'aqi': aqi_label, 'summary': summary_label})
+        return row, name_label, aqi_label, summary_label, view_model
+
+    def show_selected_station(self, index):
+        if not 0 <= index < len(self.readings):
+            return
+        data = self.readings[index]
+        self.selected_mac = data['mac']
+        pm25, basis = basis_pm25(data, self.aqi_basis())
+        self.view_model.apply({
+            ('pm_input', 'text'): '' if pm25 is None else str(pm25),
+            ('aqi_basis_label', 'text'): f"{BASIS_LABELS[basis]} PM2.5",
+            ('aqi_compare_label', 'text'): self.compare_text(data),
+            ('weather_text', 'text'): format_weather(data) + format_rolling(data.get('rolling')),
+        })
+        self.update_summary(data)
+        self.calculate_aqi()
+        self.show_trend()
+
+    def compare_text(self, data):
+        return "    ".join(f"{label}: {aqi}" for label, aqi in aqi_by_basis(data, self.aqi_standard()))
+
+    def aqi_basis(self):
+        return AQI_BASES[self.aqi_basis_select.currentIndex()]
+
+    def aqi_standard(self):
+        return self.aqi_standard_select.currentData() or DEFAULT_STANDARD
+
+    def refresh_aqi_standard(self):
+        # Converts the same concentrations, typed or fetched, under the new
+        # standard
+        if self.readings:
+            self.update_stations(self.readings)
+            index = self.station_select.currentIndex()
+            if 0 <= index < len(self.readings):
+                self.view_model.apply({('aqi_compare_label', 'text'): self.compare_text(self.readings[index])})
+        if self.pm_input.text():
             self.calculate_aqi()
-            self.weather_text.setText(self.format_weather(data))
-            # Removed PM2.5 plot
+        self.show_trend()
 
-    def update_summary(self, data):
-        self.o_temp_label.setText(f"Outdoor Temp: {data.get('tempf', '--')} °F")
-        self.i_temp_label.setText(f"Indoor Temp: {data.get('tempinf', '--')} °F")
-        self.wind_label.setText(f"Wind: {data.get('windspeedmph', '--')} mph")
-        self.rain_label.setText(f"Rain: {data.get('dailyrainin', '--')} in")
+    def refresh_aqi_basis(self):
+        if self.readings:
+            self.update_stations(self.readings)
+            self.show_selected_station(self.station_select.currentIndex())
 
-    def fetch_pm25_and_weather_from_ambient(self, api_key, app_key):
-        try:
-            url = f"https://rt.ambientweather.net/v1/devices?apiKey={api_key}&applicationKey={app_key}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                return None, f"API error: {response.status_code}"
-            devices = response.json()
-            if not devices:
-                return None, "No devices found."
-            device = devices[0]
-            last_data = device.get('lastData', {})
-            weather_data = {
-                'date': last_data.get('date'),
-                'tempf': last_data.get('tempf'),
-                'humidity': last_data.get('humidity'),
-                'baromrelin': last_data.get('baromrelin'),
-                'baromabsin': last_data.get('baromabsin'),
-                'windspeedmph': last_data.get('windspeedmph'),
-                'windgustmph': last_data.get('windgustmph'),
-                'winddir': last_data.get('winddir'),
-                'maxdailygust': last_data.get('maxdailygust'),
-                'hourlyrainin': last_data.get('hourlyrainin'),
-                'dailyrainin': last_data.get('dailyrainin'),
-                'weeklyrainin': last_data.get('weeklyrainin'),
-                'monthlyrainin': last_data.get('monthlyrainin'),
-                'yearlyrainin': last_data.get('yearlyrainin'),
-                'solarradiation': last_data.get('solarradiation'),
-                'uv': last_data.get('uv'),
-                'tempinf': last_data.get('tempinf'),
-                'humidityin': last_data.get('humidityin'),
-                'pm25_in': last_data.get('pm25_in'),
-                'pm25_in_24h': last_data.get('pm25_in_24h'),
-                'feelsLike': last_data.get('feelsLike'),
-                'dewPoint': last_data.get('dewPoint'),
-                'feelsLikein': last_data.get('feelsLikein'),
-                'dewPointin': last_data.get('dewPointin'),
-            }
-            pm25 = last_data.get('pm25')
-            if pm25 is None:
-                pm25 = last_data.get('pm25_out')
-            if pm25 is None:
-                return None, "No PM2.5 data found."
-            weather_data['pm25'] = pm25
-            return weather_data, None
-        except Exception as e:
-            return None, f'Error fetching data: {e}'
-
-    def format_weather(self, data):
-        from datetime import datetime
-        try:
-            from zoneinfo import ZoneInfo  # Python 3.9+
-            tz_pacific = ZoneInfo("America/Los_Angeles")
-        except ImportError:
-            from pytz import timezone, utc
-            tz_pacific = timezone("US/Pacific")
-        date_str = data.get('date', 'N/A')
-        formatted_date = 'N/A'
-        if date_str and date_str != 'N/A':
-            try:
-                # Parse as UTC
-                dt_utc = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                # Convert to Pacific Time
-                try:
-                    # zoneinfo (Python 3.9+)
-                    dt_pacific = dt_utc.astimezone(tz_pacific)
-                except Exception:
-                    # fallback for pytz
-                    import pytz
-                    dt_utc = dt_utc.replace(tzinfo=pytz.utc)
-                    dt_pacific = dt_utc.astimezone(tz_pacific)
-                formatted_date = dt_pacific.strftime('%Y-%m-%d %I:%M %p')
-            except Exception:
-                formatted_date = date_str
-        items = [
-            ("Date", formatted_date),
-            ("Outdoor Temp", f"{data.get('tempf', 'N/A')} °F"),
-            ("Outdoor Humidity", f"{data.get('humidity', 'N/A')}%"),
-            ("Barometer (rel)", f"{data.get('baromrelin', 'N/A')} inHg"),
-            ("Barometer (abs)", f"{data.get('baromabsin', 'N/A')} inHg"),
-            ("Wind Speed", f"{data.get('windspeedmph', 'N/A')} mph"),
-            ("Wind Gust", f"{data.get('windgustmph', 'N/A')} mph"),
-            ("Wind Dir", f"{data.get('winddir', 'N/A')}°"),
-            ("Max Daily Gust", f"{data.get('maxdailygust', 'N/A')} mph"),
-            ("Rain (hour)", f"{data.get('hourlyrainin', 'N/A')} in"),
-            ("Rain (day)", f"{data.get('dailyrainin', 'N/A')} in"),
-            ("Rain (week)", f"{data.get('weeklyrainin', 'N/A')} in"),
-            ("Rain (month)", f"{data.get('monthlyrainin', 'N/A')} in"),
-            ("Rain (year)", f"{data.get('yearlyrainin', 'N/A')} in"),
-            ("Solar Radiation", f"{data.get('solarradiation', 'N/A')} W/m²"),
-            ("UV Index", f"{data.get('uv', 'N/A')}") ,
-            ("Indoor Temp", f"{data.get('tempinf', 'N/A')} °F"),
-            ("Indoor Humidity", f"{data.get('humidityin', 'N/A')}%"),
-            ("Indoor PM2.5", f"{data.get('pm25_in', 'N/A')} μg/m³"),
-            ("Indoor PM2.5 (24h avg)", f"{data.get('pm25_in_24h', 'N/A')} μg/m³"),
-            ("Outdoor Feels Like", f"{data.get('feelsLike', 'N/A')} °F"),
-            ("Outdoor Dew Point", f"{data.get('dewPoint', 'N/A')} °F"),
-            ("Indoor Feels Like", f"{data.get('feelsLikein', 'N/A')} °F"),
-            ("Indoor Dew Point", f"{data.get('dewPointin', 'N/A')} °F"),
-        ]
-        mid = (len(items) + 1) // 2
-        col1 = items[:mid]
-        col2 = items[mid:]
-        lines = []
-        for i in range(max(len(col1), len(col2))):
-            left = f"{col1[i][0]}: {col1[i][1]}" if i < len(col1) else ""
-            right = f"{col2[i][0]}: {col2[i][1]}" if i < len(col2) else ""
-            lines.append(f"{left:<40}    {right:<40}")
-        block = "\n".join(lines)
-        # Center the block horizontally by adding spaces to each line
-        max_line_length = max(len(line) for line in lines) if lines else 0
-        pad = max(0, 20)
-        centered_block = "\n".join([f"{'':<{pad}}{line}" for line in lines])
-        return f"\n{centered_block}\n"
+    def update_summary(self, data):
+        self.view_model.apply({(widget, 'text'): text(data) for widget, text in SUMMARY_FORMATTERS})
 
     def toggle_auto_refresh(self, state):
         if state == Qt.CheckState.Checked.value:
             self.auto_refresh = True
-            self.refresh_timer.start(60000)
             self.fetch_and_update()
         else:
             self.auto_refresh = False
-            self.refresh_timer.stop()
+            self.schedule_refresh()
 
     def get_aqi_details_text(self):
-        health_risks = [
-            ("Good", "None", "No health implications.", "Everyone can continue their outdoor activities normally."),
-            ("Moderate", "Extremely sensitive individuals", "May cause mild respiratory symptoms in extremely sensitive people.", "Good air quality is expected."),
-            ("Unhealthy for Sensitive Groups", "People with respiratory or heart disease, the elderly and children", "Increasing likelihood of respiratory symptoms in sensitive individuals, aggravation of heart or lung disease and premature mortality in persons with cardiopulmonary disease and the elderly.", "People with respiratory or heart disease, the elderly and children should limit prolonged exertion."),
-            ("Unhealthy", "Everyone may begin to experience health effects", "Increased respiratory symptom, reduced exercise tolerance in persons with heart or lung disease; increased likelihood of symptoms in sensitive individuals.", "People with heart or lung disease, children and older adults should limit prolonged outdoor exertion; everyone else should limit prolonged outdoor exertion."),
-            ("Very Unhealthy", "People with respiratory or heart disease, the elderly and children", "Significant increase in respiratory symptoms and reduced exercise tolerance in persons with heart or lung disease; increased likelihood of symptoms in sensitive individuals.", "People with heart or lung disease, elderly, children and people of lower socioeconomic status should avoid all outdoor exertion; everyone else should limit outdoor exertion."),
-            ("Hazardous", "The entire population", "Health alert: The risk of health effects is increased for everyone.", "Everyone should avoid all outdoor exertion."),
-            ("Beyond AQI", "The entire population", "Health warnings of emergency conditions. The entire population is more likely to be affected.", "Everyone should avoid all physical activity outdoors.")
-        ]
-        # Determine current AQI and select the correct category
         try:
             pm_value = float(self.pm_input.text())
         except ValueError:
-            return "No valid PM2.5 value."
-        # Find the index as in aqi_from_pm25
-        if 0 <= pm_value <= 12:
-            idx = 0
-        elif 12 < pm_value <= 35.4:
-            idx = 1
-        elif 35.4 < pm_value <= 55.4:
-            idx = 2
-        elif 55.4 < pm_value <= 150.4:
-            idx = 3
-        elif 150.4 < pm_value <= 250.4:
-            idx = 4
-        elif 250.4 < pm_value <= 350.4:
-            idx = 5
-        elif 350.4 < pm_value <= 500.4:
-            idx = 6
-        else:
-            return "AQI out of range."
-        cat, group, effect, caution = health_risks[idx]
-        return f"Category: {cat}\nSensitive Groups: {group}\nHealth Effects Statement: {effect}\nCautionary Statements: {caution}\n"
+            pm_value = None
+        return aqi_details_text(pm_value, self.aqi_standard())
 
     def show_api_fields(self):
         self.toggle_api_fields(True)
         self.api_group.setVisible(True)
         self.change_api_btn.setVisible(False)
 
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        self.fetcher.cancel()
+        if self.subscriber is not None:
+            self.subscriber.close()
+        if self.stream is not None:
+            self.stream.cancel()
+        if self.backfill is not None:
+            self.backfill.cancel()
+        self.http.close()
+        self.history.close()
+        self.history_store.close()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     loop = QEventLoop(app)
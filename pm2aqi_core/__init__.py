@@ -0,0 +1,26 @@
+# Headless core shared by the PM2AQI front-ends. Nothing in this package
+# may import PyQt6, matplotlib or other GUI toolkits. The asyncio modules
+# (client, fetcher, http) are imported explicitly by the code that needs them.
+from .aqi import (
+    BREAKPOINTS,
+    CATEGORIES,
+    COLORS,
+    DEFAULT_STANDARD,
+    OUT_OF_RANGE,
+    aqi_array,
+    aqi_details_text,
+    aqi_from_concentration,
+    aqi_from_pm25,
+    aqi_from_pm25_array,
+    category_index,
+    overall_aqi,
+)
+from .standards import STANDARDS
+from .ambient import (
+    fetch_devices,
+    fetch_pm25_and_weather_from_ambient,
+    fetch_reading,
+    fetch_readings,
+)
+from .formatting import format_weather
+from .reading import WEATHER_FIELDS, reading_from_device, readings_from_devices
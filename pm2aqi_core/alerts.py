@@ -0,0 +1,373 @@
+# Alert rules on the reading stream: AQI category and field thresholds,
+# with hysteresis and debouncing, delivered in batches to a webhook or a
+# command.
+#
+# A rules file has one rule per line ('#' starts a comment):
+#
+#   [name] [@ MAC]: FIELD OP VALUE [for DURATION] [clear VALUE]
+#
+#   usg:   aqi_category >= "Unhealthy for Sensitive Groups" for 10m
+#   gusts: windgustmph > 40 clear 35
+#   garage @ 00:0E:C6:00:00:01: tempinf < 35 for 15m
+#
+# FIELD is any numeric reading field, "aqi", or "aqi_category" compared by
+# category name (both from the reading's pm25). OP is >, >=, < or <=. A
+# rule fires once its condition has held for DURATION (s, m or h, by the
+# readings' dateutc) and resolves when the value is no longer past the
+# clear level (default: the threshold itself). Without "@ MAC" a rule
+# applies to every station.
+#
+# Rules are compiled into one index per (station, field): their trigger
+# and clear levels, sorted. A new reading only looks at fields whose value
+# changed, and only at rules with a level between the old and new value,
+# since no other rule's outcome can have changed; two bisects per field
+# find them. A rule waiting out its duration is rechecked when it falls
+# due, from a heap per station, or sooner if a reading crosses its level.
+# So the cost of a reading depends on how many rules it crosses, not on
+# how many there are.
+import asyncio
+import json
+import re
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
+
+from .aqi import CATEGORIES, aqi_from_pm25, category_index
+from .fields import FIELD_INFO
+
+# Readings fields that are not measurements
+NOT_NUMERIC = ('date', 'dateutc')
+DERIVED_FIELDS = ('aqi', 'aqi_category')
+UNITS_MS = {'s': 1000, 'm': 60_000, 'h': 3_600_000}
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_DELAY = 2.0
+# Strict levels (> and <=) change outcome at value == level going up;
+# the others just past it
+_STRICT = {'>': True, '<=': True, '>=': False, '<': False}
+
+_VALUE = r'"[^"]*"|\'[^\']*\'|[-+]?(?:\d+\.?\d*|\.\d+)'
+_RULE = re.compile(
+    rf'^\s*(?:(?P<name>[^:@]*?)\s*(?:@\s*(?P<mac>[0-9A-Fa-f]{{2}}(?::[0-9A-Fa-f]{{2}}){{5}}))?\s*:)?'
+    rf'\s*(?P<field>\w+)\s*(?P<op>>=|<=|>|<)\s*(?P<value>{_VALUE})'
+    rf'(?:\s+for\s+(?P<duration>\d+(?:\.\d+)?)\s*(?P<unit>[smh]))?'
+    rf'(?:\s+clear\s+(?P<clear>{_VALUE}))?\s*$'
+)
+
+
+class Rule:
+    def __init__(self, name, field, op, threshold, duration_ms=0, clear=None, mac=None):
+        if field not in FIELD_INFO and field not in DERIVED_FIELDS or field in NOT_NUMERIC:
+            raise ValueError(f"unknown field: {field}")
+        if op not in _STRICT:
+            raise ValueError(f"unknown operator: {op}")
+        # Hysteresis only: a clear level past the threshold would resolve an
+        # alert as it fires
+        if clear is not None and (clear > threshold if op in ('>', '>=') else clear < threshold):
+            raise ValueError(f"clear level {clear:g} is past the threshold {threshold:g}")
+        self.name = name
+        self.field = field
+        self.op = op
+        self.threshold = threshold
+        self.duration_ms = duration_ms
+        self.clear = threshold if clear is None else clear
+        self.mac = mac
+
+    def holds(self, value, level):
+        op = self.op
+        if op == '>':
+            return value > level
+        if op == '>=':
+            return value >= level
+        if op == '<':
+            return value < level
+        return value <= level
+
+    def display(self, value):
+        # Category rules report the category name
+        if self.field == 'aqi_category':
+            return CATEGORIES[int(value)]
+        return value
+
+    def __repr__(self):
+        return f"Rule({self.name!r})"
+
+
+def parse_rule(text):
+    match = _RULE.match(text)
+    if match is None:
+        raise ValueError(f"cannot parse rule: {text.strip()}")
+    field = match['field']
+    threshold = _level(field, match['value'])
+    clear = _level(field, match['clear']) if match['clear'] else None
+    duration = float(match['duration']) * UNITS_MS[match['unit']] if match['duration'] else 0
+    name = (match['name'] or '').strip() or text[match.start('field'):].strip()
+    mac = match['mac'].upper() if match['mac'] else None
+    return Rule(name, field, match['op'], threshold, int(duration), clear, mac)
+
+
+def read_rules(path):
+    rules = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0]
+            if not line.strip():
+                continue
+            try:
+                rules.append(parse_rule(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}")
+    return rules
+
+
+def _level(field, text):
+    if text[0] in '"\'':
+        name = text[1:-1].strip().lower()
+        for i, category in enumerate(CATEGORIES):
+            if category.lower() == name:
+                if field != 'aqi_category':
+                    raise ValueError(f"a category is only comparable with aqi_category, not {field}")
+                return i
+        raise ValueError(f"unknown AQI category: {text}")
+    return float(text)
+
+
+class _Index:
+    # Trigger and clear levels of the rules on one (station, field), sorted,
+    # split by whether the level itself counts as past it
+    def __init__(self, entries):
+        # entries: (level, strict, rule id)
+        self.levels = {}
+        self.ids = {}
+        for strict in (True, False):
+            part = sorted((level, rid) for level, s, rid in entries if s == strict)
+            self.levels[strict] = [level for level, _ in part]
+            self.ids[strict] = [rid for _, rid in part]
+        self.all = sorted({rid for _, _, rid in entries})
+
+    def crossed(self, old, new):
+        # Ids of rules whose outcome can differ between old and new
+        lo, hi = (old, new) if old < new else (new, old)
+        levels, ids = self.levels[True], self.ids[True]
+        found = ids[bisect_left(levels, lo):bisect_left(levels, hi)]
+        levels, ids = self.levels[False], self.ids[False]
+        return found + ids[bisect_right(levels, lo):bisect_right(levels, hi)]
+
+
+class AlertEngine:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.fields = tuple(dict.fromkeys(rule.field for rule in self.rules))
+        entries = {}
+        for rid, rule in enumerate(self.rules):
+            strict = _STRICT[rule.op]
+            levels = {rule.threshold, rule.clear}
+            entries.setdefault((rule.mac, rule.field), []).extend((level, strict, rid) for level in levels)
+        self.index = {key: _Index(found) for key, found in entries.items()}
+        self.values = {}  # mac -> {field: last value}
+        self.last_ts = {}  # mac -> newest dateutc seen
+        self.pending = {}  # mac -> {rule id: dateutc the condition started to hold}
+        self.due = {}  # mac -> heap of (dateutc a pending rule falls due, rule id)
+        self.firing = {}  # mac -> {rule id: dateutc it fired}
+        self.evaluated = 0  # rule checks, for the benchmark
+
+    def process(self, readings):
+        # Returns the alert events the readings cause, oldest first
+        events = []
+        for reading in readings:
+            mac = reading.get('mac')
+            ts = reading.get('dateutc')
+            if ts is not None:
+                if ts <= self.last_ts.get(mac, -1):
+                    continue
+                self.last_ts[mac] = ts
+            self._reading(mac, ts, reading, events)
+        return events
+
+    def _reading(self, mac, ts, reading, events):
+        values = self.values.get(mac)
+        if values is None:
+            values = self.values[mac] = {}
+        candidates = set()
+        derived = None
+        for field in self.fields:
+            if field in DERIVED_FIELDS:
+                if derived is None:
+                    derived = _derived(reading.get('pm25'))
+                value = derived[field]
+            else:
+                value = reading.get(field)
+            if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            old = values.get(field)
+            if old == value:
+                continue
+            values[field] = value
+            for key in ((mac, field), (None, field)):
+                index = self.index.get(key)
+                if index is None:
+                    continue
+                candidates.update(index.all if old is None else index.crossed(old, value))
+        now = ts if ts is not None else int(time.time() * 1000)
+        due = self.due.get(mac)
+        if due:
+            pending = self.pending[mac]
+            while due and due[0][0] <= now:
+                when, rid = heappop(due)
+                # Stale if the rule stopped holding (or fired) since
+                since = pending.get(rid)
+                if since is not None and since + self.rules[rid].duration_ms == when:
+                    candidates.add(rid)
+        if candidates:
+            for rid in sorted(candidates):
+                self._evaluate(rid, mac, now, reading, values, events)
+
+    def _evaluate(self, rid, mac, now, reading, values, events):
+        self.evaluated += 1
+        rule = self.rules[rid]
+        value = values.get(rule.field)
+        if value is None:
+            return
+        firing = self.firing.setdefault(mac, {})
+        if rid in firing:
+            if not rule.holds(value, rule.clear):
+                since = firing.pop(rid)
+                events.append(_event(rule, 'resolved', reading, mac, now, value, since))
+            return
+        pending = self.pending.setdefault(mac, {})
+        if not rule.holds(value, rule.threshold):
+            pending.pop(rid, None)
+            return
+        since = pending.get(rid)
+        if since is None:
+            since = pending[rid] = now
+            if rule.duration_ms:
+                heappush(self.due.setdefault(mac, []), (now + rule.duration_ms, rid))
+        if now - since >= rule.duration_ms:
+            del pending[rid]
+            firing[rid] = now
+            events.append(_event(rule, 'firing', reading, mac, now, value, since))
+
+    def active(self):
+        # (mac, rule name) of every firing alert
+        return [(mac, self.rules[rid].name) for mac, firing in self.firing.items() for rid in firing]
+
+
+def _derived(pm25):
+    if pm25 is None or isinstance(pm25, bool) or not isinstance(pm25, (int, float)):
+        return {'aqi': None, 'aqi_category': None}
+    idx = category_index(pm25)
+    if idx < 0:
+        return {'aqi': None, 'aqi_category': None}
+    return {'aqi': aqi_from_pm25(pm25)[0], 'aqi_category': idx}
+
+
+def _event(rule, state, reading, mac, ts, value, since):
+    return {
+        'rule': rule.name,
+        'state': state,
+        'mac': mac,
+        'name': reading.get('name'),
+        'field': rule.field,
+        'value': rule.display(value),
+        'op': rule.op,
+        'threshold': rule.display(rule.threshold),
+        'since': since,
+        'ts': ts,
+    }
+
+
+class WebhookSink:
+    # POSTs each batch as a JSON array
+    def __init__(self, url, http=None, timeout=10.0):
+        from .http import AsyncHTTPClient
+
+        self.url = url
+        self.http = http or AsyncHTTPClient()
+        self.timeout = timeout
+
+    async def deliver(self, events):
+        body = json.dumps(events, separators=(',', ':')).encode()
+        response = await asyncio.wait_for(self.http.post(self.url, body), self.timeout)
+        if not 200 <= response.status < 300:
+            raise RuntimeError(f"webhook answered {response.status}")
+
+    def close(self):
+        self.http.close()
+
+
+class CommandSink:
+    # Runs a shell command per batch with the JSON array on its stdin
+    def __init__(self, command, timeout=30.0):
+        self.command = command
+        self.timeout = timeout
+
+    async def deliver(self, events):
+        process = await asyncio.create_subprocess_shell(self.command, stdin=asyncio.subprocess.PIPE)
+        try:
+            await asyncio.wait_for(process.communicate(json.dumps(events).encode()), self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RuntimeError(f"alert command timed out after {self.timeout:g} s")
+        if process.returncode:
+            raise RuntimeError(f"alert command exited with {process.returncode}")
+
+    def close(self):
+        pass
+
+
+class AlertDispatcher:
+    # Batches events for a sink: a batch goes out when max_batch events are
+    # waiting or the oldest has waited max_delay seconds. One delivery runs
+    # at a time, so batches arrive in order. A failed batch is dropped and
+    # counted, and the error is printed to stderr.
+    def __init__(self, sink, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = []
+        self.delivered = 0
+        self.batches = 0
+        self.failed = 0
+        self.error = None
+        self._task = None
+        self._wake = None
+
+    def submit(self, events):
+        if not events:
+            return
+        self.queue.extend(events)
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        elif len(self.queue) >= self.max_batch:
+            self._wake.set()
+
+    async def _run(self):
+        while self.queue:
+            if len(self.queue) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+            try:
+                await self.sink.deliver(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                self.error = str(e) or type(e).__name__
+                print(f"alert delivery failed: {self.error}", file=sys.stderr)
+            else:
+                self.delivered += len(batch)
+                self.batches += 1
+                self.error = None
+
+    async def close(self):
+        # Delivers whatever is waiting, then closes the sink
+        if self._task is not None and not self._task.done():
+            self._wake.set()
+            self.max_delay = 0
+            await self._task
+        self.sink.close()
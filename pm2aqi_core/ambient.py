@@ -0,0 +1,102 @@
+# Ambient Weather REST API: blocking helpers and response handling shared
+# with the asyncio client in client.py. requests is imported on first use
+# so importing the core stays cheap.
+import os
+
+from .decode import decode_devices, readings_from_decoded
+from .reading import reading_from_device, readings_from_devices
+
+API_URL = os.getenv('AMBIENT_API_URL', "https://rt.ambientweather.net/v1")
+# Seconds before a request to the API is abandoned
+DEFAULT_TIMEOUT = 15.0
+
+
+def devices_url(api_key, app_key, api_url=None):
+    return f"{api_url or API_URL}/devices?apiKey={api_key}&applicationKey={app_key}"
+
+
+def fetch_devices(api_key, app_key, timeout=DEFAULT_TIMEOUT):
+    # Returns (devices, error)
+    return _fetch(api_key, app_key, timeout, devices_from_response)
+
+
+def _fetch(api_key, app_key, timeout, handle):
+    import requests
+
+    try:
+        response = requests.get(devices_url(api_key, app_key), timeout=timeout)
+        return handle(response)
+    except requests.Timeout:
+        return None, f"Request timed out after {timeout:g} s"
+    except Exception as e:
+        return None, f'Error fetching data: {e}'
+
+
+def fetch_reading(api_key, app_key, timeout=DEFAULT_TIMEOUT):
+    # Returns (reading, error) for the first device on the account
+    return first_reading(*fetch_devices(api_key, app_key, timeout))
+
+
+def fetch_readings(api_key, app_key, timeout=DEFAULT_TIMEOUT):
+    # Returns (readings, error) with one reading per device
+    return decoded_readings(*_fetch(api_key, app_key, timeout, decode_response))
+
+
+def fetch_pm25_and_weather_from_ambient(api_key, app_key, timeout=DEFAULT_TIMEOUT):
+    # Like fetch_reading, but a reading without PM2.5 is an error
+    return require_pm25(*fetch_reading(api_key, app_key, timeout))
+
+
+def devices_from_response(response):
+    if response.status_code != 200:
+        return None, f"API error: {response.status_code}"
+    devices = response.json()
+    if not devices:
+        return None, "No devices found."
+    return devices, None
+
+
+def decode_response(response):
+    # Like devices_from_response, but decodes only what a reading uses
+    # (decode.py); pass the result to decoded_readings
+    if response.status_code != 200:
+        return None, f"API error: {response.status_code}"
+    devices = decode_devices(response.content)
+    if not devices:
+        return None, "No devices found."
+    return devices, None
+
+
+def decoded_readings(devices, error):
+    if error:
+        return None, error
+    try:
+        return readings_from_decoded(devices), None
+    except Exception as e:
+        return None, f'Error fetching data: {e}'
+
+
+def first_reading(devices, error):
+    if error:
+        return None, error
+    try:
+        return reading_from_device(devices[0]), None
+    except Exception as e:
+        return None, f'Error fetching data: {e}'
+
+
+def all_readings(devices, error):
+    if error:
+        return None, error
+    try:
+        return readings_from_devices(devices), None
+    except Exception as e:
+        return None, f'Error fetching data: {e}'
+
+
+def require_pm25(reading, error):
+    if error:
+        return None, error
+    if reading['pm25'] is None:
+        return None, "No PM2.5 data found."
+    return reading, None
@@ -0,0 +1,185 @@
+# Pollutant concentration -> AQI, free of any UI imports. The standards
+# and their breakpoints are in standards.py. Every function takes a
+# standard key; the default is the US EPA 2024 table.
+#
+# Each (standard, pollutant) gets a lookup table over its truncated
+# concentration domain, built on first use: one entry per step of the
+# standard's resolution (0.1 μg/m³ for US PM2.5, so 3,255 entries up to
+# 325.4), each holding the finished (aqi, category, color). A conversion
+# is a multiply, a truncation and an index, however many bands there are.
+# Entries are interpolated in integer arithmetic, so they round exactly.
+from .standards import POLLUTANT_LABELS, STANDARDS
+
+DEFAULT_STANDARD = 'us'
+OUT_OF_RANGE = ("--", "Out of Range", "#e57373")
+# Added before truncating, so 0.071 ppm (70.99999... thousandths) stays 0.071
+_EPSILON = 1e-6
+
+# The default standard's PM2.5 table as
+# (conc_lo, conc_hi, aqi_lo, aqi_hi, category, color)
+BREAKPOINTS = tuple(
+    (c_lo, c_hi, i_lo, i_hi, STANDARDS[DEFAULT_STANDARD][2][c], STANDARDS[DEFAULT_STANDARD][3][c])
+    for c_lo, c_hi, i_lo, i_hi, c in STANDARDS[DEFAULT_STANDARD][5]['pm25'][2]
+)
+CATEGORIES = STANDARDS[DEFAULT_STANDARD][2]
+COLORS = STANDARDS[DEFAULT_STANDARD][3]
+# (sensitive groups, health effects, cautionary statement) per category
+HEALTH_STATEMENTS = STANDARDS[DEFAULT_STANDARD][4]
+
+
+def standard_name(standard):
+    return _standard(standard)[0]
+
+
+def categories(standard=DEFAULT_STANDARD):
+    return _standard(standard)[2]
+
+
+def colors(standard=DEFAULT_STANDARD):
+    return _standard(standard)[3]
+
+
+def pollutants(standard=DEFAULT_STANDARD):
+    return tuple(_standard(standard)[5])
+
+
+def pollutant_label(pollutant):
+    return POLLUTANT_LABELS.get(pollutant, pollutant)
+
+
+def _standard(standard):
+    try:
+        return STANDARDS[standard]
+    except KeyError:
+        raise ValueError(f"unknown AQI standard: {standard}") from None
+
+
+class _Table:
+    # Lookup table for one pollutant under one standard
+    def __init__(self, standard, pollutant):
+        name, rounding, names, palette, _, tables = _standard(standard)
+        if pollutant not in tables:
+            raise ValueError(f"{name} has no {pollutant} breakpoints")
+        self.unit, decimals, bands = tables[pollutant]
+        self.scale = 10 ** decimals
+        self.aqi = []
+        self.index = []
+        for c_lo, c_hi, i_lo, i_hi, category in bands:
+            lo, hi = round(c_lo * self.scale), round(c_hi * self.scale)
+            # A shared endpoint stays in the band below
+            for k in range(max(lo, len(self.aqi)), hi + 1):
+                num, den = (i_hi - i_lo) * (k - lo), hi - lo
+                if rounding == 'round':
+                    step = (2 * num + den) // (2 * den)
+                elif rounding == 'ceil':
+                    step = -(-num // den)
+                else:
+                    step = num // den
+                self.aqi.append(i_lo + step)
+                self.index.append(category)
+        self.results = [(aqi, names[i], palette[i]) for aqi, i in zip(self.aqi, self.index)]
+        self.colors = palette
+        # Values from here up truncate past the last entry
+        self.limit = (len(self.aqi) - _EPSILON) / self.scale
+        self._arrays = None
+
+    def arrays(self):
+        # (aqi, category index, colors) numpy arrays for the batch path; the
+        # colors end with the out-of-range one, so index -1 picks it
+        if self._arrays is None:
+            import numpy as np
+
+            self._arrays = (
+                np.array(self.aqi, dtype=np.int64),
+                np.array(self.index, dtype=np.int64),
+                np.array(self.colors + (OUT_OF_RANGE[2],), dtype=object),
+            )
+        return self._arrays
+
+
+_tables = {}
+
+
+def _table(standard, pollutant):
+    table = _tables.get((standard, pollutant))
+    if table is None:
+        table = _tables[standard, pollutant] = _Table(standard, pollutant)
+    return table
+
+
+def aqi_from_concentration(value, pollutant='pm25', standard=DEFAULT_STANDARD):
+    # Returns (aqi, category, color); OUT_OF_RANGE outside the table
+    table = _tables.get((standard, pollutant)) or _table(standard, pollutant)
+    if 0 <= value < table.limit:
+        return table.results[int(value * table.scale + _EPSILON)]
+    return OUT_OF_RANGE
+
+
+def aqi_from_pm25(pm_value, standard=DEFAULT_STANDARD):
+    # Returns (aqi, category, color)
+    table = _tables.get((standard, 'pm25')) or _table(standard, 'pm25')
+    if 0 <= pm_value < table.limit:
+        return table.results[int(pm_value * table.scale + _EPSILON)]
+    return OUT_OF_RANGE
+
+
+def category_index(value, standard=DEFAULT_STANDARD, pollutant='pm25'):
+    # Index into categories(standard), or -1 if the value is outside the
+    # table
+    table = _tables.get((standard, pollutant)) or _table(standard, pollutant)
+    if 0 <= value < table.limit:
+        return table.index[int(value * table.scale + _EPSILON)]
+    return -1
+
+
+def overall_aqi(concentrations, standard=DEFAULT_STANDARD):
+    # (aqi, category, color, pollutant) of the highest sub-index among the
+    # standard's pollutants present in concentrations ({pollutant: value}).
+    # OUT_OF_RANGE plus the pollutant if a value is past its table; None
+    # if no pollutant has a value.
+    best = None
+    for pollutant in _standard(standard)[5]:
+        value = concentrations.get(pollutant)
+        if value is None:
+            continue
+        result = aqi_from_concentration(value, pollutant, standard)
+        if result is OUT_OF_RANGE:
+            return OUT_OF_RANGE + (pollutant,)
+        if best is None or result[0] > best[0]:
+            best = result + (pollutant,)
+    return best
+
+
+def aqi_details_text(pm_value, standard=DEFAULT_STANDARD):
+    # Health statements for the category of pm_value (None if the input
+    # was not a number); only the US standards publish them
+    if pm_value is None:
+        return "No valid PM2.5 value."
+    idx = category_index(pm_value, standard)
+    if idx < 0:
+        return "AQI out of range."
+    name, _, names, _, statements, _ = STANDARDS[standard]
+    if statements is None:
+        return f"Category: {names[idx]}\nStandard: {name}\n"
+    group, effect, caution = statements[idx]
+    return f"Category: {names[idx]}\nSensitive Groups: {group}\nHealth Effects Statement: {effect}\nCautionary Statements: {caution}\n"
+
+
+def aqi_array(values, pollutant='pm25', standard=DEFAULT_STANDARD):
+    # Vectorized aqi_from_concentration for a whole array of readings.
+    # Returns (aqi, index, colors): int64 AQI and category index arrays
+    # (-1 where out of range or NaN) and an object array of colors.
+    import numpy as np
+
+    table = _table(standard, pollutant)
+    aqi_table, index_table, color_table = table.arrays()
+    values = np.asarray(values, dtype=np.float64)
+    valid = (values >= 0) & (values < table.limit)
+    k = np.where(valid, values * table.scale + _EPSILON, 0).astype(np.int64)
+    aqi = np.where(valid, aqi_table[k], -1)
+    idx = np.where(valid, index_table[k], -1)
+    return aqi, idx, color_table[idx]
+
+
+def aqi_from_pm25_array(values, standard=DEFAULT_STANDARD):
+    return aqi_array(values, 'pm25', standard)
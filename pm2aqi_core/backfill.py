@@ -0,0 +1,148 @@
+# Historical backfill from the per-device data endpoint.
+#
+# Pages GET /v1/devices/<mac>?endDate=...&limit=288 from newest to oldest
+# until it reaches the last stored reading (or the backfill horizon),
+# handing each page straight to the history writer. How far down each gap
+# has been paged is saved with the pages, so a backfill cut short (the app
+# closed) is resumed below its last page by the next session, along with
+# the new gap above the readings stored since. All requests for one API key
+# share a token bucket, so several devices can backfill in parallel without
+# exceeding the per-key rate limit.
+import asyncio
+import time
+
+from .ambient import API_URL, DEFAULT_TIMEOUT
+from .ratelimit import TokenBucket, retry_after
+from .reading import reading_from_device
+
+PAGE_LIMIT = 288  # the API's maximum records per request
+# Ambient allows one request per second per API key
+API_KEY_RATE = 1.0
+# How far back to go for a station with no stored history
+DEFAULT_HORIZON_DAYS = 7
+MAX_RETRIES = 5
+
+
+def device_data_url(api_key, app_key, mac, end_date=None, limit=PAGE_LIMIT, api_url=None):
+    url = f"{api_url or API_URL}/devices/{mac}?apiKey={api_key}&applicationKey={app_key}&limit={limit}"
+    if end_date is not None:
+        url += f"&endDate={end_date}"
+    return url
+
+
+class Backfiller:
+    # writer: anything with submit(readings) and set_backfill(mac, floor,
+    # end), e.g. HistoryWriter.
+    # store: a HistoryStore used to look up where each device left off.
+    def __init__(self, http, api_key, app_key, writer, store, api_url=None,
+                 rate=API_KEY_RATE, horizon_days=DEFAULT_HORIZON_DAYS, timeout=DEFAULT_TIMEOUT):
+        self.http = http
+        self.api_key = api_key
+        self.app_key = app_key
+        self.writer = writer
+        self.store = store
+        self.api_url = api_url or API_URL
+        self.bucket = TokenBucket(rate)
+        self.horizon_ms = int(horizon_days * 86_400_000)
+        self.timeout = timeout
+        self.requests = 0
+        self.rate_limited = 0
+        self.written = 0
+        self.errors = 0
+        self._seen = set()
+        self._tasks = set()
+
+    def watch(self, readings):
+        # Start a backfill for each station not seen before in this session.
+        # Call this before the readings themselves are written, so the gap
+        # is measured from the last reading stored by a previous session.
+        for reading in readings:
+            mac = reading.get('mac')
+            if mac is None or mac in self._seen:
+                continue
+            self._seen.add(mac)
+            since = self.store.latest_timestamp(mac)
+            task = asyncio.ensure_future(self._backfill_in_background(mac, reading.get('name'), since))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run(self, devices):
+        # Backfill several (mac, name) pairs in parallel; returns rows written
+        results = await asyncio.gather(*(
+            self.backfill_device(mac, name, self.store.latest_timestamp(mac))
+            for mac, name in devices
+        ))
+        return sum(results)
+
+    async def backfill_device(self, mac, name=None, since=None):
+        now_ms = int(time.time() * 1000)
+        horizon = now_ms - self.horizon_ms
+        # floor -> end: the new gap above `since`, then any left unfinished
+        gaps = dict(self.store.pending_backfill(mac))
+        floor = max(since or 0, horizon)
+        gaps[floor] = now_ms
+        self.writer.set_backfill(mac, floor, now_ms)
+        written = 0
+        for key, end in sorted(gaps.items(), key=lambda gap: gap[1], reverse=True):
+            if end <= max(key, horizon):
+                self.writer.set_backfill(mac, key, None)  # aged past the horizon
+                continue
+            written += await self._fill(mac, name, key, max(key, horizon), end)
+        self.written += written
+        return written
+
+    async def _fill(self, mac, name, key, floor, end_date):
+        # Readings after floor and at or before end_date, newest page first
+        written = 0
+        while True:
+            records = await self._page(mac, end_date)
+            if not records:
+                break
+            device = {'macAddress': mac, 'info': {'name': name}}
+            readings = []
+            oldest = None
+            for record in records:
+                ts = record.get('dateutc')
+                if ts is None:
+                    continue
+                oldest = ts if oldest is None else min(oldest, ts)
+                if ts > floor:
+                    device['lastData'] = record
+                    readings.append(reading_from_device(device))
+            if readings:
+                self.writer.submit(readings)
+                written += len(readings)
+            if oldest is None or oldest <= floor or len(records) < PAGE_LIMIT:
+                break
+            end_date = oldest - 1
+            self.writer.set_backfill(mac, key, end_date)
+        self.writer.set_backfill(mac, key, None)
+        return written
+
+    async def _backfill_in_background(self, mac, name, since):
+        try:
+            await self.backfill_device(mac, name, since)
+        except Exception:
+            # Retried on the next poll that sees this station; live polling
+            # is unaffected
+            self.errors += 1
+            self._seen.discard(mac)
+
+    def cancel(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _page(self, mac, end_date):
+        url = device_data_url(self.api_key, self.app_key, mac, end_date, api_url=self.api_url)
+        for _ in range(MAX_RETRIES):
+            await self.bucket.acquire()
+            self.requests += 1
+            response = await asyncio.wait_for(self.http.get(url), self.timeout)
+            if response.status == 429:
+                self.rate_limited += 1
+                self.bucket.penalize(retry_after(response.headers.get('retry-after')))
+                continue
+            if response.status != 200:
+                raise RuntimeError(f"API error: {response.status}")
+            return response.json()
+        raise RuntimeError("API error: 429")
@@ -0,0 +1,65 @@
+# Native asyncio client for the Ambient Weather REST API. Kept out of the
+# package __init__ so headless scripts using the blocking helpers never pay
+# for importing asyncio.
+import asyncio
+
+from .ambient import (
+    API_URL,
+    DEFAULT_TIMEOUT,
+    decode_response,
+    decoded_readings,
+    devices_from_response,
+    devices_url,
+    first_reading,
+    require_pm25,
+)
+from .http import AsyncHTTPClient
+
+
+class AmbientClient:
+    # Native asyncio client: runs on the caller's event loop (no executor
+    # thread) and keeps its connections alive between polls. Each request
+    # must complete within timeout seconds or it is cancelled. With a
+    # Metrics object it records the http, decode and parse stages.
+    def __init__(self, api_key, app_key, http=None, api_url=None, timeout=DEFAULT_TIMEOUT, metrics=None):
+        self.api_key = api_key
+        self.app_key = app_key
+        self.api_url = api_url or API_URL
+        self.http = http or AsyncHTTPClient()
+        self.timeout = timeout
+        self.metrics = metrics
+
+    async def fetch_devices(self):
+        return await self._fetch(devices_from_response)
+
+    async def _fetch(self, handle):
+        url = devices_url(self.api_key, self.app_key, self.api_url)
+        try:
+            if self.metrics is None:
+                return handle(await asyncio.wait_for(self.http.get(url), self.timeout))
+            with self.metrics.span('http'):
+                response = await asyncio.wait_for(self.http.get(url), self.timeout)
+            self.metrics.inc('bytes_received', response.wire_size)
+            with self.metrics.span('decode'):
+                return handle(response)
+        except asyncio.TimeoutError:
+            return None, f"Request timed out after {self.timeout:g} s"
+        except Exception as e:
+            return None, f'Error fetching data: {e}'
+
+    async def fetch_reading(self):
+        return first_reading(*await self.fetch_devices())
+
+    async def fetch_readings(self):
+        # Only the fields a reading uses are decoded (decode.py)
+        result = await self._fetch(decode_response)
+        if self.metrics is None:
+            return decoded_readings(*result)
+        with self.metrics.span('parse'):
+            return decoded_readings(*result)
+
+    async def fetch_pm25_and_weather(self):
+        return require_pm25(*await self.fetch_reading())
+
+    def close(self):
+        self.http.close()
@@ -0,0 +1,305 @@
+# Bulk PM2.5 -> AQI conversion for CSV and Parquet archives.
+#
+# Files are streamed in chunks of --chunk-rows rows, so memory stays at one
+# chunk however large the input is. Each chunk's PM2.5 column (or the
+# --pollutant column) goes through aqi_array, under --standard, in one
+# NumPy pass, and the chunk is written back out
+# with "aqi" and "aqi_category" columns appended. Short rows are padded
+# (and long ones cut) to the header's width first. Blank or non-numeric
+# values leave both columns empty; values outside the breakpoint table get
+# category "Out of Range". Output goes to a hidden partial file that is
+# renamed into place once the whole file has converted, so a failure never
+# leaves a truncated output. With several files and --jobs > 1 the files
+# are converted in a process pool.
+#
+# CSV (optionally .gz) needs only the standard library and NumPy. Parquet
+# input or output needs pyarrow.
+#
+#   python -m pm2aqi_core.convert export.csv [more.csv.gz ...] [--column pm25]
+#       [--standard us] [--pollutant pm25] [--format csv|parquet] [--output DIR]
+#       [--chunk-rows 100000] [--jobs N]
+import csv
+import gzip
+import os
+import sys
+import time
+from itertools import islice
+
+from .aqi import DEFAULT_STANDARD, OUT_OF_RANGE, aqi_array, categories
+
+DEFAULT_COLUMN = 'pm25'
+CHUNK_ROWS = 100_000
+OUTPUT_COLUMNS = ('aqi', 'aqi_category')
+
+
+def convert_file(src, dst, column=DEFAULT_COLUMN, chunk_rows=CHUNK_ROWS, pollutant='pm25',
+                 standard=DEFAULT_STANDARD):
+    # Converts one file; the formats follow the extensions. Returns
+    # (rows, error).
+    if _is_parquet(src) or _is_parquet(dst):
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            return 0, f"{src}: Parquet files need pyarrow (pip install pyarrow)"
+    try:
+        source = _read_parquet(src, chunk_rows) if _is_parquet(src) else _read_csv(src, chunk_rows)
+        names = next(source)
+        if column not in names:
+            return 0, f"{src}: no column {column!r} (columns: {', '.join(names)})"
+        if any(name in names for name in OUTPUT_COLUMNS):
+            return 0, f"{src}: already has an {' or '.join(OUTPUT_COLUMNS)} column"
+        index = names.index(column)
+        # Same directory, so the rename is atomic; same extension, so the
+        # sink picks the same format
+        partial = os.path.join(os.path.dirname(dst), f".part-{os.getpid()}-{os.path.basename(dst)}")
+        sink = _ParquetSink(partial) if _is_parquet(dst) else _CsvSink(partial)
+        rows = 0
+        done = False
+        try:
+            try:
+                sink.header(names + list(OUTPUT_COLUMNS))
+                for chunk in source:
+                    aqi, category = _convert(chunk.values(index), pollutant, standard)
+                    sink.write(chunk, aqi, category)
+                    rows += len(aqi)
+            finally:
+                sink.close()
+            os.replace(partial, dst)
+            done = True
+        finally:
+            if not done and os.path.exists(partial):
+                os.unlink(partial)
+        return rows, None
+    except (OSError, ValueError, csv.Error) as e:
+        return 0, f"{src}: {e}"
+
+
+def output_path(src, output=None, fmt=None):
+    # export.csv.gz -> export.aqi.csv (or .parquet) next to the input, or
+    # in the output directory
+    name = os.path.basename(src)
+    for ext in ('.gz', '.csv', '.parquet'):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    if fmt is None:
+        fmt = 'parquet' if _is_parquet(src) else 'csv'
+    return os.path.join(output or os.path.dirname(src), f"{name}.aqi.{fmt}")
+
+
+def convert_files(jobs_list, column=DEFAULT_COLUMN, chunk_rows=CHUNK_ROWS, jobs=1, pollutant='pm25',
+                  standard=DEFAULT_STANDARD):
+    # [(src, dst), ...] -> yields (src, dst, rows, seconds, error) as each
+    # file finishes
+    options = (column, chunk_rows, pollutant, standard)
+    if jobs <= 1 or len(jobs_list) <= 1:
+        for src, dst in jobs_list:
+            yield _timed(src, dst, *options)
+        return
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(jobs_list))) as pool:
+        futures = [pool.submit(_timed, src, dst, *options) for src, dst in jobs_list]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _timed(src, dst, column, chunk_rows, pollutant, standard):
+    start = time.perf_counter()
+    rows, error = convert_file(src, dst, column, chunk_rows, pollutant, standard)
+    return src, dst, rows, time.perf_counter() - start, error
+
+
+_category_text = {}  # standard -> category names as an object array
+
+
+def _convert(values, pollutant='pm25', standard=DEFAULT_STANDARD):
+    # Concentrations (text, numbers or None) -> AQI and category columns as
+    # text
+    import numpy as np
+
+    names = _category_text.get(standard)
+    if names is None:
+        # Index -1 (out of range) picks the last entry
+        names = _category_text[standard] = np.array(categories(standard) + (OUT_OF_RANGE[1],), dtype=object)
+    if isinstance(values, np.ndarray):
+        pm = values
+    else:
+        try:
+            # NumPy parses a clean column of numbers itself
+            pm = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            pm = np.array([_float(v) for v in values], dtype=np.float64)
+    aqi, idx, _ = aqi_array(pm, pollutant, standard)
+    missing = np.isnan(pm)
+    aqi_text = aqi.astype(str).astype(object)
+    aqi_text[idx < 0] = ''
+    category = names[idx]
+    category[missing] = ''
+    return aqi_text, category
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _is_parquet(path):
+    return path.lower().endswith('.parquet')
+
+
+def _open_text(path, mode):
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, mode + 't', newline='', encoding='utf-8')
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+class _CsvChunk:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def values(self, index):
+        return [row[index] if index < len(row) else '' for row in self.rows]
+
+    def row_lists(self, width):
+        return [row if len(row) == width else (row + [''] * (width - len(row)))[:width] for row in self.rows]
+
+    def columns(self, width):
+        return [list(col) for col in zip(*(row + [''] * (width - len(row)) for row in self.rows))]
+
+
+class _ParquetChunk:
+    def __init__(self, batch):
+        self.batch = batch
+
+    def values(self, index):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        col = self.batch.column(index)
+        if pa.types.is_integer(col.type) or pa.types.is_floating(col.type) or pa.types.is_decimal(col.type):
+            return pc.fill_null(pc.cast(col, pa.float64()), float('nan')).to_numpy(zero_copy_only=False)
+        return col.to_pylist()
+
+    def row_lists(self, width):
+        return [list(row) for row in zip(*(col.to_pylist() for col in self.batch.columns))]
+
+    def columns(self, width):
+        return list(self.batch.columns)
+
+
+def _read_csv(path, chunk_rows):
+    # Yields the header, then _CsvChunks
+    with _open_text(path, 'r') as f:
+        reader = csv.reader(f)
+        names = next(reader, None)
+        if names is None:
+            raise ValueError("empty file")
+        yield names
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            yield _CsvChunk(rows)
+
+
+def _read_parquet(path, chunk_rows):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    yield list(parquet.schema_arrow.names)
+    for batch in parquet.iter_batches(batch_size=chunk_rows):
+        yield _ParquetChunk(batch)
+
+
+class _CsvSink:
+    def __init__(self, path):
+        self.file = _open_text(path, 'w')
+        self.writer = csv.writer(self.file)
+        self.width = 0
+
+    def header(self, names):
+        self.width = len(names) - len(OUTPUT_COLUMNS)
+        self.writer.writerow(names)
+
+    def write(self, chunk, aqi, category):
+        rows = chunk.row_lists(self.width)
+        self.writer.writerows(row + [a, c] for row, a, c in zip(rows, aqi, category))
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetSink:
+    # One row group per chunk
+    def __init__(self, path):
+        self.path = path
+        self.names = None
+        self.writer = None
+
+    def header(self, names):
+        self.names = names
+
+    def write(self, chunk, aqi, category):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        width = len(self.names) - len(OUTPUT_COLUMNS)
+        columns = [c if isinstance(c, (pa.Array, pa.ChunkedArray)) else pa.array(c, type=pa.string())
+                   for c in chunk.columns(width)]
+        aqi_column = pa.array([int(a) if a else None for a in aqi], type=pa.int16())
+        category_column = pa.array([c or None for c in category], type=pa.string())
+        batch = pa.RecordBatch.from_arrays(columns + [aqi_column, category_column], names=self.names)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, batch.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def main(argv=None):
+    import argparse
+
+    from .standards import POLLUTANT_LABELS, STANDARDS
+
+    parser = argparse.ArgumentParser(description="Add AQI and category columns to CSV or Parquet files of PM2.5 readings.")
+    parser.add_argument('inputs', nargs='+', help="CSV (.csv, .csv.gz) or Parquet files")
+    parser.add_argument('--column', default=None, help="concentration column name (default: the pollutant)")
+    parser.add_argument('--standard', choices=tuple(STANDARDS), default=DEFAULT_STANDARD,
+                        help="AQI standard (default: %(default)s)")
+    parser.add_argument('--pollutant', choices=tuple(POLLUTANT_LABELS), default='pm25',
+                        help="pollutant the column holds, in the standard's unit (default: %(default)s)")
+    parser.add_argument('--format', choices=('csv', 'parquet'), default=None,
+                        help="output format (default: same as each input)")
+    parser.add_argument('--output', default=None, help="directory for the output files (default: next to each input)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="rows held in memory at a time")
+    parser.add_argument('--jobs', type=int, default=1, help="files converted in parallel")
+    args = parser.parse_args(argv)
+    if args.pollutant not in STANDARDS[args.standard][5]:
+        parser.error(f"{args.standard} has no {args.pollutant} breakpoints")
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    pairs = [(src, output_path(src, args.output, args.format)) for src in args.inputs]
+    start = time.perf_counter()
+    total = failed = 0
+    results = convert_files(pairs, args.column or args.pollutant, args.chunk_rows, args.jobs, args.pollutant, args.standard)
+    for src, dst, rows, seconds, error in results:
+        if error:
+            failed += 1
+            print(error, file=sys.stderr)
+            continue
+        total += rows
+        print(f"{src} -> {dst}: {rows:,} rows in {seconds:.2f} s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+    elapsed = time.perf_counter() - start
+    if len(pairs) > 1:
+        print(f"{total:,} rows from {len(pairs) - failed} files in {elapsed:.2f} s "
+              f"({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
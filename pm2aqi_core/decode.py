@@ -0,0 +1,108 @@
+# Typed decoding of the /v1/devices payload.
+#
+# decode_devices(body) parses the response bytes with the fastest backend
+# installed, and readings_from_decoded() turns the result into the same
+# reading dicts as readings_from_devices():
+#
+#   msgspec  decodes straight into structs holding only the lastData keys a
+#            reading keeps (from the field registry); every other key in
+#            the payload is skipped without building a Python object
+#   orjson   a faster json.loads, then the usual reading_from_device
+#   json     the stdlib fallback
+#
+# Neither msgspec nor orjson is required. The backend is picked on first
+# use, so importing the core does not import either. PM2AQI_JSON names one
+# explicitly.
+import json
+import os
+
+from .reading import WEATHER_FIELDS, current_conditions, readings_from_devices
+
+BACKENDS = ('msgspec', 'orjson', 'json')
+# lastData keys decoded by the msgspec backend, in reading order; pm25 and
+# pm25_out are folded into 'pm25'
+DECODED_FIELDS = WEATHER_FIELDS + ('pm25', 'pm25_out')
+
+_decoders = {}
+_default = None
+_asdict = None  # msgspec.structs.asdict, once msgspec is loaded
+
+
+def available_backends():
+    names = []
+    for name in BACKENDS:
+        try:
+            _decoder(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def default_backend():
+    name = os.getenv('PM2AQI_JSON')
+    if name in BACKENDS:
+        return name
+    return available_backends()[0]
+
+
+def decode_devices(body, backend=None):
+    # Returns the device list: structs from msgspec, dicts otherwise.
+    # Raises ValueError (or the backend's decode error) on a bad body.
+    global _default
+    if backend is None:
+        backend = _default = _default or default_backend()
+    return _decoder(backend)(body)
+
+
+def readings_from_decoded(devices):
+    if devices and not isinstance(devices[0], dict):
+        return [_struct_reading(device) for device in devices]
+    return readings_from_devices(devices)
+
+
+def _decoder(name):
+    decoder = _decoders.get(name)
+    if decoder is not None:
+        return decoder
+    if name == 'msgspec':
+        decoder = _msgspec_decoder()
+    elif name == 'orjson':
+        import orjson
+        decoder = orjson.loads
+    elif name == 'json':
+        decoder = json.loads
+    else:
+        raise ValueError(f"unknown JSON backend: {name}")
+    _decoders[name] = decoder
+    return decoder
+
+
+def _msgspec_decoder():
+    import msgspec
+    from typing import Any, Optional
+
+    # Values are kept as sent (Any), as the dict path does
+    last_data = msgspec.defstruct('LastData', [(key, Any, None) for key in DECODED_FIELDS])
+    info = msgspec.defstruct('Info', [('name', Any, None)])
+    device = msgspec.defstruct('Device', [
+        ('macAddress', Any, None),
+        ('info', Optional[info], None),
+        ('lastData', last_data, msgspec.field(default_factory=last_data)),
+    ])
+    global _asdict
+    _asdict = msgspec.structs.asdict
+    return msgspec.json.Decoder(list[device]).decode
+
+
+def _struct_reading(device):
+    # reading_from_device for a msgspec Device
+    reading = _asdict(device.lastData)
+    pm25 = reading.pop('pm25')
+    pm25_out = reading.pop('pm25_out')
+    reading['mac'] = mac = device.macAddress
+    reading['name'] = (device.info.name if device.info is not None else None) or mac or 'Station'
+    reading['pm25'] = pm25_out if pm25 is None else pm25
+    # Every key current_conditions reads is in the reading
+    reading['weather'] = current_conditions(reading)
+    return reading
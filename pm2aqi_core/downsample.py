@@ -0,0 +1,41 @@
+# Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013) for the
+# trend charts. The series is split into equal buckets, and each bucket
+# keeps the point that forms the largest triangle with the point kept
+# before it and the mean of the next bucket. Peaks, dips and the overall
+# shape survive, unlike with plain decimation or bucket means. The first
+# and last points are always kept.
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    # Indices of at most threshold points of (x, y), in order. x must be
+    # increasing, and neither may contain NaN.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # Bucket i covers edges[i]:edges[i + 1]; the first and last points are
+    # buckets of their own
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    # The point after the last bucket stands in for its "next bucket" mean
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+    # The loop runs once per bucket, so it works on Python scalars and
+    # leaves only the per-bucket slices to NumPy
+    edges, mean_x, mean_y = edges.tolist(), mean_x.tolist(), mean_y.tolist()
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = float(x[a]), float(y[a])
+        # Twice the triangle area, up to sign
+        areas = np.abs((ax - mean_x[i]) * (y[lo:hi] - ay) - (mean_y[i] - ay) * (ax - x[lo:hi]))
+        a = lo + int(areas.argmax())
+        kept.append(a)
+    kept.append(n - 1)
+    return np.array(kept)
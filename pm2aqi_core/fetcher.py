@@ -0,0 +1,50 @@
+# Single-flight fetch coordination for the refresh timer, the fetch
+# button and auto-refresh, which can all fire at the same time.
+import asyncio
+
+
+class Fetcher:
+    # Wraps an async callable returning (data, error). Concurrent callers
+    # share one in-flight request; cancel() abandons it so the next call
+    # starts fresh. fetch() returns None to callers whose result is stale:
+    # the request was cancelled, or a newer result was already delivered.
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._task = None
+        self._generation = 0
+        self._delivered = 0
+        self.started = 0
+        self.coalesced = 0
+        self.stale = 0
+
+    @property
+    def in_flight(self):
+        return self._task is not None and not self._task.done()
+
+    async def fetch(self):
+        task = self._task
+        if task is None or task.done():
+            self._generation += 1
+            self.started += 1
+            task = self._task = asyncio.ensure_future(self._fetch())
+        else:
+            self.coalesced += 1
+        generation = self._generation
+        try:
+            # shield: one impatient caller must not cancel the shared request
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                self.stale += 1
+                return None
+            raise
+        if generation < self._delivered:
+            self.stale += 1
+            return None
+        self._delivered = generation
+        return result
+
+    def cancel(self):
+        if self.in_flight:
+            self._task.cancel()
+        self._task = None
@@ -0,0 +1,83 @@
+# Field registry: every reading field the front-ends know about, in
+# display order. The lastData keys a reading keeps (reading.py), the
+# "Show More" table and the rolling-statistics labels (formatting.py) and
+# the dashboard tiles are all generated from this one table.
+#
+# (key, label, unit, precision, parsed, shown)
+#   unit      appended to the value as is, so it carries its own spacing
+#   precision decimals to round to, or None to show the value as sent
+#   parsed    copied from lastData by reading_from_device
+#   shown     listed in the weather details table
+FIELDS = (
+    ('date', "Date", '', None, True, True),
+    ('dateutc', "Time (UTC ms)", '', None, True, False),
+    ('tempf', "Outdoor Temp", ' °F', None, True, True),
+    ('humidity', "Outdoor Humidity", '%', None, True, True),
+    ('baromrelin', "Barometer (rel)", ' inHg', None, True, True),
+    ('baromabsin', "Barometer (abs)", ' inHg', None, True, True),
+    ('windspeedmph', "Wind Speed", ' mph', None, True, True),
+    ('windgustmph', "Wind Gust", ' mph', None, True, True),
+    ('winddir', "Wind Dir", '°', None, True, True),
+    ('maxdailygust', "Max Daily Gust", ' mph', None, True, True),
+    ('hourlyrainin', "Rain (hour)", ' in', None, True, True),
+    ('dailyrainin', "Rain (day)", ' in', None, True, True),
+    ('weeklyrainin', "Rain (week)", ' in', None, True, True),
+    ('monthlyrainin', "Rain (month)", ' in', None, True, True),
+    ('yearlyrainin', "Rain (year)", ' in', None, True, True),
+    ('solarradiation', "Solar Radiation", ' W/m²', 0, True, True),
+    ('uv', "UV Index", '', None, True, True),
+    ('tempinf', "Indoor Temp", ' °F', None, True, True),
+    ('humidityin', "Indoor Humidity", '%', None, True, True),
+    # pm25 comes from pm25 or pm25_out; the other two are added by the
+    # NowCast tracker
+    ('pm25', "Outdoor PM2.5", ' μg/m³', None, False, False),
+    ('pm25_nowcast', "Outdoor PM2.5 NowCast", ' μg/m³', None, False, True),
+    ('pm25_avg24', "Outdoor PM2.5 (24h avg)", ' μg/m³', None, False, True),
+    ('pm25_in', "Indoor PM2.5", ' μg/m³', None, True, True),
+    ('pm25_in_24h', "Indoor PM2.5 (24h avg)", ' μg/m³', None, True, True),
+    ('feelsLike', "Outdoor Feels Like", ' °F', None, True, True),
+    ('dewPoint', "Outdoor Dew Point", ' °F', None, True, True),
+    ('feelsLikein', "Indoor Feels Like", ' °F', None, True, True),
+    ('dewPointin', "Indoor Dew Point", ' °F', None, True, True),
+)
+
+FIELD_INFO = {f[0]: f for f in FIELDS}
+PARSED_FIELDS = tuple(f[0] for f in FIELDS if f[4])
+SHOWN_FIELDS = tuple(f[0] for f in FIELDS if f[5])
+
+
+def label(key):
+    return FIELD_INFO[key][1] if key in FIELD_INFO else key
+
+
+def unit(key):
+    # The unit without its leading space, '' for unitless fields
+    return FIELD_INFO[key][2].strip() if key in FIELD_INFO else ''
+
+
+def compile_formatter(key, template=None, missing='--'):
+    # Builds data -> text for one field once, so rendering a reading is a
+    # table of single calls. template has one "{}" for the value and
+    # defaults to the value followed by the field's unit; the value is
+    # rounded to the field's precision.
+    info = FIELD_INFO.get(key, (key, key, '', None))
+    if template is None:
+        template = "{}" + info[2]
+    head, _, tail = template.partition("{}")
+    precision = info[3]
+    if precision is None:
+        def text(data):
+            value = data.get(key)
+            return f"{head}{missing if value is None else value}{tail}"
+    else:
+        def text(data):
+            value = data.get(key)
+            if value is None:
+                return f"{head}{missing}{tail}"
+            if not isinstance(value, (int, float)):
+                return f"{head}{value}{tail}"
+            # precision 0 shows whole numbers without the ".0"
+            if precision == 0:
+                return f"{head}{int(round(value))}{tail}"
+            return f"{head}{value:.{precision}f}{tail}"
+    return text
@@ -0,0 +1,282 @@
+# Headless fleet monitor: polls every station on many Ambient accounts from
+# one process and one event loop, without a window per key.
+#
+# Each key pair has its own poll loop, paced by its own RefreshScheduler
+# and started at a staggered offset, so the polls spread over the interval.
+# All of them share one pooled AsyncHTTPClient. At most `concurrency`
+# requests are in flight at once, and each API key is held to `rate`
+# requests per second (Ambient allows one), shared by the app keys used
+# with it. Readings come from the same decode and parse path as the
+# windows, get "aqi", "aqi_category" and "account" added, and are passed to
+# a sink. A reading is passed on only when its station reports a new
+# dateutc. The sink is a HistoryWriter or JSON lines on stdout.
+#
+# The keys file has one "api_key app_key [label]" per line, separated by
+# whitespace or commas; '#' starts a comment. The label (default: a hash
+# of the keys, as the shared poller uses) is the "account" of each reading.
+#
+# With --alerts, new readings also go through an AlertEngine (see
+# alerts.py), and its events are delivered in batches to --webhook or
+# --alert-command.
+#
+#   python -m pm2aqi_core.fleet KEYS_FILE [--history [PATH]] [--interval 60]
+#                               [--concurrency 32] [--rate 1] [--duration S] [--report 60]
+#                               [--alerts RULES_FILE (--webhook URL | --alert-command CMD)]
+import asyncio
+import json
+import os
+import sys
+import time
+
+from .aqi import OUT_OF_RANGE, aqi_from_pm25
+from .client import AmbientClient
+from .http import AsyncHTTPClient
+from .metrics import METRICS_PATH, Metrics
+from .poller import DEFAULT_INTERVAL, key_id
+from .ratelimit import TokenBucket
+from .scheduler import MIN_DELAY, RefreshScheduler
+
+DEFAULT_CONCURRENCY = 32
+# Requests per second per API key
+DEFAULT_RATE = 1.0
+# Seconds a key's bucket is drained for after a 429
+RATE_LIMIT_PENALTY = 1.0
+
+
+def read_keys(path):
+    # [(api_key, app_key, label)] from a keys file
+    keys = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            parts = line.split('#', 1)[0].replace(',', ' ').split()
+            if not parts:
+                continue
+            if len(parts) not in (2, 3):
+                raise ValueError(f"{path}:{number}: expected 'api_key app_key [label]'")
+            api_key, app_key = parts[:2]
+            keys.append((api_key, app_key, parts[2] if len(parts) == 3 else key_id(api_key, app_key)))
+    return keys
+
+
+class JSONLinesSink:
+    # One JSON object per reading, one per line
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.written = 0
+
+    def submit(self, readings):
+        self.stream.write(''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in readings))
+        self.written += len(readings)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class FleetMonitor:
+    def __init__(self, keys, sink, interval=DEFAULT_INTERVAL, concurrency=DEFAULT_CONCURRENCY,
+                 rate=DEFAULT_RATE, api_url=None, http=None, min_delay=MIN_DELAY, alerts=None, dispatcher=None):
+        self.keys = list(keys)
+        self.sink = sink
+        # Optional AlertEngine and the AlertDispatcher its events go to
+        self.alerts = alerts
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.concurrency = concurrency
+        # Every account is on the same host, so the pool allows as many
+        # connections there as requests may be in flight
+        self.http = http or AsyncHTTPClient(max_per_host=concurrency)
+        self.metrics = Metrics()
+        self.clients = [AmbientClient(api_key, app_key, http=self.http, api_url=api_url, metrics=self.metrics)
+                        for api_key, app_key, _ in self.keys]
+        self.schedulers = [RefreshScheduler(interval, min_delay=min(min_delay, interval)) for _ in self.keys]
+        self.buckets = {}  # api_key -> TokenBucket
+        for api_key, _, _ in self.keys:
+            if api_key not in self.buckets:
+                self.buckets[api_key] = TokenBucket(rate)
+        self.errors = {}  # label -> last error, cleared by a good poll
+        self.started = None
+        self.running = False
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def run(self, duration=None, report=0):
+        # Polls until cancelled, or for duration seconds. With report set,
+        # prints summary() to stderr (and rewrites PM2AQI_METRICS) that often.
+        self.started = time.monotonic()
+        self.running = True
+        count = len(self.keys)
+        tasks = [asyncio.ensure_future(self._watch(i, self.interval * i / count)) for i in range(count)]
+        if report:
+            tasks.append(asyncio.ensure_future(self._report(report)))
+        try:
+            if tasks:
+                done, _ = await asyncio.wait(tasks, timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            elif duration:
+                await asyncio.sleep(duration)
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _watch(self, i, delay):
+        await asyncio.sleep(delay)
+        # Checked as well as cancelled: before Python 3.12, wait_for can
+        # swallow a cancel that lands as the response arrives
+        while self.running:
+            await self.poll(i)
+            if self.running:
+                await asyncio.sleep(self.schedulers[i].next_delay())
+
+    async def poll(self, i):
+        # One request for key pair i; returns the readings passed to the sink
+        api_key, _, label = self.keys[i]
+        scheduler = self.schedulers[i]
+        bucket = self.buckets[api_key]
+        queued = time.perf_counter()
+        # The slot first: a token taken while queued for a slot could be
+        # spent late, right before the key's next one
+        await self._slots.acquire()
+        try:
+            await bucket.acquire()
+            self.metrics.observe('queue', time.perf_counter() - queued)
+            with self.metrics.span('fetch'):
+                readings, error = await self.clients[i].fetch_readings()
+            bucket.restart()
+        finally:
+            self._slots.release()
+        if error:
+            self.metrics.inc('fetch_errors')
+            self.errors[label] = error
+            if '429' in error:
+                self.metrics.inc('rate_limited')
+                bucket.penalize(RATE_LIMIT_PENALTY)
+            scheduler.observe(readings, error)
+            return []
+        self.metrics.inc('fetches')
+        self.errors.pop(label, None)
+        last = scheduler.last
+        new = [r for r in readings if r.get('dateutc') is None or r['dateutc'] > last.get(r.get('mac'), -1)]
+        scheduler.observe(readings, error)
+        if not new:
+            self.metrics.inc('skipped_polls')
+            return new
+        for reading in new:
+            # As the local service reports them
+            value = reading.get('pm25')
+            aqi, category, _ = aqi_from_pm25(value) if value is not None else (None, None, None)
+            reading['aqi'] = None if aqi == OUT_OF_RANGE[0] else aqi
+            reading['aqi_category'] = category
+            reading['account'] = label
+        self.sink.submit(new)
+        self.metrics.inc('devices', len(new))
+        if self.alerts is not None:
+            events = self.alerts.process(new)
+            if events:
+                self.metrics.inc('alerts', len(events))
+                if self.dispatcher is not None:
+                    self.dispatcher.submit(events)
+        return new
+
+    async def _report(self, every):
+        while True:
+            await asyncio.sleep(every)
+            print(self.summary(), file=sys.stderr)
+            if METRICS_PATH:
+                self.metrics.write(METRICS_PATH)
+
+    def devices_per_minute(self):
+        if self.started is None:
+            return 0.0
+        return self.metrics.counters.get('devices', 0) * 60 / max(time.monotonic() - self.started, 1e-9)
+
+    def summary(self):
+        counters = self.metrics.counters
+        return (f"{len(self.keys)} keys · {self.devices_per_minute():,.0f} readings/min · "
+                f"polls: {counters['fetches']:,} · no new data: {counters['skipped_polls']:,} · "
+                f"errors: {counters['fetch_errors']:,} (rate limited: {counters.get('rate_limited', 0):,}) · "
+                f"failing keys: {len(self.errors)}" +
+                (f" · alerts: {counters.get('alerts', 0):,} ({len(self.alerts.active()):,} firing)"
+                 if self.alerts is not None else ""))
+
+    def close(self):
+        self.http.close()
+
+
+def main(argv=None):
+    import argparse
+
+    from .alerts import AlertDispatcher, AlertEngine, CommandSink, WebhookSink, read_rules
+    from .history import DEFAULT_PATH, HistoryWriter
+
+    parser = argparse.ArgumentParser(description="Poll every Ambient Weather station on many accounts, headless.")
+    parser.add_argument('keys', help="file of 'api_key app_key [label]' lines")
+    parser.add_argument('--history', nargs='?', const=DEFAULT_PATH, default=None,
+                        help="write to the history database (default: %(const)s) instead of JSON lines on stdout")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between polls of a key")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="requests in flight at once (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help="requests per second per API key (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    parser.add_argument('--report', type=float, default=60.0, help="seconds between status lines on stderr (0: none)")
+    parser.add_argument('--alerts', metavar='RULES', help="file of alert rules to evaluate on every new reading")
+    delivery = parser.add_mutually_exclusive_group()
+    delivery.add_argument('--webhook', metavar='URL', help="POST alert batches to this URL as JSON arrays")
+    delivery.add_argument('--alert-command', metavar='CMD',
+                          help="run CMD per alert batch, with the JSON array on stdin")
+    args = parser.parse_args(argv)
+    if args.alerts and not (args.webhook or args.alert_command):
+        parser.error("--alerts needs --webhook or --alert-command")
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    try:
+        keys = read_keys(args.keys)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    if not keys:
+        print(f"{args.keys}: no keys", file=sys.stderr)
+        return 1
+    rules = []
+    if args.alerts:
+        try:
+            rules = read_rules(args.alerts)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 1
+    sink = HistoryWriter(args.history) if args.history else JSONLinesSink()
+
+    async def run():
+        engine = dispatcher = None
+        if rules:
+            engine = AlertEngine(rules)
+            dispatcher = AlertDispatcher(WebhookSink(args.webhook) if args.webhook else CommandSink(args.alert_command))
+        monitor = FleetMonitor(keys, sink, args.interval, args.concurrency, args.rate,
+                               api_url=os.getenv('AMBIENT_API_URL'), alerts=engine, dispatcher=dispatcher)
+        try:
+            await monitor.run(args.duration, args.report)
+        finally:
+            if dispatcher is not None:
+                await dispatcher.close()
+            monitor.close()
+            print(monitor.summary(), file=sys.stderr)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# Text formatting shared by the front-ends.
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from .fields import SHOWN_FIELDS, compile_formatter, label, unit
+
+try:
+    from zoneinfo import ZoneInfo  # Python 3.9+
+except ImportError:
+    from pytz import timezone as ZoneInfo
+
+# Time zone dates and the dashboard clock are shown in: an IANA name, or
+# "local" for the system zone
+DEFAULT_TZ = "America/Los_Angeles"
+TZ_NAME = os.getenv('PM2AQI_TZ', DEFAULT_TZ)
+
+
+@lru_cache(maxsize=None)
+def zone(name=None):
+    # tzinfo for name (default PM2AQI_TZ), looked up once per name. None
+    # means the system zone, which astimezone() takes as None too.
+    name = name or TZ_NAME
+    if name == 'local':
+        return None
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return ZoneInfo(DEFAULT_TZ)
+
+
+FORECAST_ICONS = {
+    'cloudy': '☁️',
+    'sunny': '☀️',
+    'rain': '🌧️',
+    'snow': '❄️',
+    'partlycloudy': '⛅',
+}
+
+
+@lru_cache(maxsize=256)
+def format_date(date_str, tz=None):
+    # ISO UTC timestamp from the API -> local time in tz (default PM2AQI_TZ).
+    # Cached: every refresh re-renders the same few timestamps.
+    if not date_str or date_str == 'N/A':
+        return 'N/A'
+    try:
+        dt_utc = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        return dt_utc.astimezone(zone(tz)).strftime('%Y-%m-%d %I:%M %p')
+    except Exception:
+        return date_str
+
+
+# (label, data -> text) for the "Show More" table, built once from the
+# field registry
+WEATHER_ITEMS = tuple(
+    (label(key), (lambda data: format_date(data.get('date'))) if key == 'date'
+     else compile_formatter(key, missing='N/A'))
+    for key in SHOWN_FIELDS
+)
+
+
+def format_weather(data):
+    return format_columns([(name, text(data)) for name, text in WEATHER_ITEMS])
+
+
+def format_range(stats, unit=''):
+    # (min, max, mean) -> "min–max (avg mean) unit"; "min–max (mean)" without a unit
+    if stats is None:
+        return '--'
+    lo, hi, mean = stats
+    if not unit:
+        return f"{lo:g}–{hi:g} ({mean:g})"
+    return f"{lo:g}–{hi:g} (avg {mean:g}) {unit}"
+
+
+def format_rolling(rolling):
+    # Table of rolling min/max/mean for every field with data, one column
+    # per window
+    if not rolling:
+        return ''
+    windows = list(next(iter(rolling.values())))
+    lines = [f"{'Rolling':<20}" + ''.join(f"{w:<30}" for w in windows)]
+    for field, by_window in rolling.items():
+        if all(v is None for v in by_window.values()):
+            continue
+        field_unit = unit(field)
+        lines.append(f"{label(field):<20}" + ''.join(f"{format_range(by_window[w], field_unit):<30}" for w in windows))
+    pad = 20
+    return "\n".join(f"{'':<{pad}}{line}" for line in lines) + "\n"
+
+
+def format_columns(items):
+    # Lay (label, value) pairs out in two padded columns
+    mid = (len(items) + 1) // 2
+    col1 = items[:mid]
+    col2 = items[mid:]
+    lines = []
+    for i in range(max(len(col1), len(col2))):
+        left = f"{col1[i][0]}: {col1[i][1]}" if i < len(col1) else ""
+        right = f"{col2[i][0]}: {col2[i][1]}" if i < len(col2) else ""
+        lines.append(f"{left:<40}    {right:<40}")
+    pad = 20
+    centered_block = "\n".join([f"{'':<{pad}}{line}" for line in lines])
+    return f"\n{centered_block}\n"
+
+
+def uv_level(uv):
+    # EPA UV index category, '--' if unknown
+    try:
+        uvi = float(uv)
+    except (TypeError, ValueError):
+        return "--"
+    if uvi < 3:
+        return "LOW"
+    elif uvi < 6:
+        return "MODERATE"
+    elif uvi < 8:
+        return "HIGH"
+    elif uvi < 11:
+        return "VERY HIGH"
+    return "EXTREME"
+
+
+def format_clock(now=None, tz=None):
+    # Compact dashboard clock, e.g. "1:57p Thu 05.22" (PM2AQI_TZ by default)
+    if now is None:
+        now = datetime.now(timezone.utc)
+    now = now.astimezone(zone(tz))
+    # Use platform-independent hour formatting (no leading zero, no '-')
+    hour = now.strftime('%I').lstrip('0') or '0'
+    minute = now.strftime('%M')
+    ampm = '' if now.strftime('%p') == 'AM' else 'p'
+    return f"{hour}:{minute}{ampm} {now.strftime('%a %m.%d')}"
+
+
+def display(value, missing='--'):
+    # Placeholder for fields the device did not report
+    return missing if value is None else value
@@ -0,0 +1,245 @@
+# Local reading history in SQLite (WAL mode).
+#
+# Each station gets its own table keyed by the reading's dateutc (epoch
+# milliseconds), so a range query for one device is a primary-key range
+# scan. Writes go through HistoryWriter, which batches them on a background
+# thread; readers open their own HistoryStore and are never blocked by it.
+# Every write also updates the station's rollup tables (rollup.py), which
+# series() reads for long ranges. The backfill table holds the history gaps
+# a Backfiller has not finished, so the next session can resume them.
+import os
+import queue
+import re
+import sqlite3
+import threading
+
+from .aqi import DEFAULT_STANDARD
+from .reading import WEATHER_FIELDS
+from .rollup import DEFAULT_MAX_POINTS, LEVELS, create_rollups, pick_level, series_query, update_rollups, with_aqi
+
+DEFAULT_PATH = os.getenv('PM2AQI_HISTORY', 'pm2aqi_history.db')
+# Numeric fields stored per reading (the ISO 'date' string is derived from ts)
+HISTORY_FIELDS = tuple(f for f in WEATHER_FIELDS if f not in ('date', 'dateutc')) + ('pm25',)
+
+
+def table_name(mac):
+    return 'readings_' + re.sub(r'[^0-9a-z]', '', (mac or 'unknown').lower())
+
+
+class HistoryStore:
+    # One SQLite connection; use it from a single thread.
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS devices (mac TEXT PRIMARY KEY, name TEXT, tbl TEXT NOT NULL)'
+        )
+        # floor: readings after it are wanted; end: the endDate to page on from
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS backfill (mac TEXT, floor INTEGER, end INTEGER, PRIMARY KEY (mac, floor))'
+        )
+        self.conn.commit()
+        self._tables = {}
+        with self.conn:
+            # The writer thread and every window open their own store at
+            # once; take the write lock before checking the schema
+            self.conn.execute('BEGIN IMMEDIATE')
+            if create_rollups(self.conn, HISTORY_FIELDS):
+                # New, or a field was added: build them from the readings
+                for (tbl,) in self.conn.execute('SELECT tbl FROM devices').fetchall():
+                    lo, hi = self.conn.execute(f'SELECT MIN(ts), MAX(ts) FROM {tbl}').fetchone()
+                    if lo is not None:
+                        update_rollups(self.conn, tbl, HISTORY_FIELDS, lo, hi)
+
+    def write(self, readings):
+        # Insert a batch of readings in one transaction. A reading already
+        # stored for the same device and timestamp is replaced.
+        by_table = {}
+        for reading in readings:
+            ts = reading.get('dateutc')
+            if ts is None:
+                continue
+            tbl = self._table(reading.get('mac'), reading.get('name'))
+            by_table.setdefault(tbl, []).append(
+                (int(ts),) + tuple(reading.get(f) for f in HISTORY_FIELDS)
+            )
+        if not by_table:
+            return 0
+        placeholders = ', '.join('?' * (len(HISTORY_FIELDS) + 1))
+        columns = ', '.join(('ts',) + HISTORY_FIELDS)
+        with self.conn:
+            for tbl, rows in by_table.items():
+                self.conn.executemany(
+                    f'INSERT OR REPLACE INTO {tbl} ({columns}) VALUES ({placeholders})', rows
+                )
+                update_rollups(self.conn, tbl, HISTORY_FIELDS, min(r[0] for r in rows), max(r[0] for r in rows))
+        return sum(len(rows) for rows in by_table.values())
+
+    def query(self, mac, start=None, end=None, fields=None):
+        # Rows of (ts, *fields) for one device with start <= ts < end,
+        # ordered by time. start/end are epoch milliseconds.
+        tbl = self._existing_table(mac)
+        if tbl is None:
+            return []
+        fields = tuple(fields or HISTORY_FIELDS)
+        for field in fields:
+            if field not in HISTORY_FIELDS:
+                raise ValueError(f"unknown history field: {field}")
+        sql = f"SELECT {', '.join(('ts',) + fields)} FROM {tbl} WHERE ts >= ? AND ts < ? ORDER BY ts"
+        return self.conn.execute(sql, (start or 0, end or 2**62)).fetchall()
+
+    def series(self, mac, start, end, fields=('pm25',), max_points=DEFAULT_MAX_POINTS, level=None,
+               standard=DEFAULT_STANDARD):
+        # (level, rows) for start <= ts < end from the finest level with at
+        # most about max_points rows, or from the level given: 'raw', '5m',
+        # '1h' or '1d'. Rows are (ts, n, then min, max, mean per field); a
+        # raw row has n = 1 and the value three times. 'aqi' may be given
+        # as a field and is derived from the PM2.5 columns under standard.
+        for field in fields:
+            if field not in HISTORY_FIELDS and field != 'aqi':
+                raise ValueError(f"unknown history field: {field}")
+        if level is None:
+            level, _ = pick_level(start, end, max_points)
+        elif level != 'raw' and level not in dict(LEVELS):
+            raise ValueError(f"unknown rollup level: {level}")
+        tbl = self._existing_table(mac)
+        if tbl is None:
+            return level, []
+        columns = tuple(dict.fromkeys('pm25' if f == 'aqi' else f for f in fields))
+        rows = self.conn.execute(*series_query(tbl, level, columns, start, end)).fetchall()
+        if 'aqi' not in fields:
+            return level, rows
+        rows = with_aqi(rows, 2 + 3 * columns.index('pm25'), standard)
+        # Columns in the order asked for, with aqi's after the others
+        order = columns + ('aqi',)
+        picks = [0, 1] + [2 + 3 * order.index(f) + k for f in fields for k in range(3)]
+        return level, [tuple(row[i] for i in picks) for row in rows]
+
+    def latest_timestamp(self, mac):
+        tbl = self._existing_table(mac)
+        if tbl is None:
+            return None
+        return self.conn.execute(f'SELECT MAX(ts) FROM {tbl}').fetchone()[0]
+
+    def devices(self):
+        return self.conn.execute('SELECT mac, name FROM devices ORDER BY mac').fetchall()
+
+    def pending_backfill(self, mac):
+        # Unfinished gaps as (floor, end), newest first
+        return self.conn.execute(
+            'SELECT floor, end FROM backfill WHERE mac = ? ORDER BY end DESC', (mac,)
+        ).fetchall()
+
+    def set_backfill(self, mac, floor, end):
+        # Record how far down a gap has been filled; end None (or at the
+        # floor) means it is done
+        with self.conn:
+            if end is None or end <= floor:
+                self.conn.execute('DELETE FROM backfill WHERE mac = ? AND floor = ?', (mac, floor))
+            else:
+                self.conn.execute('INSERT OR REPLACE INTO backfill (mac, floor, end) VALUES (?, ?, ?)',
+                                  (mac, floor, end))
+
+    def close(self):
+        self.conn.close()
+
+    def _existing_table(self, mac):
+        tbl = self._tables.get(mac)
+        if tbl is None:
+            row = self.conn.execute('SELECT tbl FROM devices WHERE mac = ?', (mac,)).fetchone()
+            if row is None:
+                return None
+            tbl = self._tables[mac] = row[0]
+        return tbl
+
+    def _table(self, mac, name=None):
+        tbl = self._tables.get(mac)
+        if tbl is not None:
+            return tbl
+        tbl = table_name(mac)
+        columns = ', '.join(f'{f} REAL' for f in HISTORY_FIELDS)
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {tbl} (ts INTEGER PRIMARY KEY, {columns})')
+            # Tables created by older versions may lack newer fields
+            existing = {row[1] for row in self.conn.execute(f'PRAGMA table_info({tbl})')}
+            for field in HISTORY_FIELDS:
+                if field not in existing:
+                    self.conn.execute(f'ALTER TABLE {tbl} ADD COLUMN {field} REAL')
+            self.conn.execute(
+                'INSERT OR REPLACE INTO devices (mac, name, tbl) VALUES (?, ?, ?)', (mac, name, tbl)
+            )
+        self._tables[mac] = tbl
+        return tbl
+
+
+class HistoryWriter:
+    # Accepts readings from any thread (typically the UI thread) and writes
+    # them from a background thread, coalescing whatever has queued up
+    # since the last write into one transaction.
+    def __init__(self, path=DEFAULT_PATH, max_batch=5000):
+        self.path = path
+        self.max_batch = max_batch
+        self.written = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def submit(self, readings):
+        self._queue.put(list(readings))
+
+    def set_backfill(self, mac, floor, end):
+        # HistoryStore.set_backfill, applied after the readings submitted
+        # before it are written
+        self._queue.put((mac, floor, end))
+
+    def flush(self):
+        # Block until everything submitted so far is on disk
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        store = HistoryStore(self.path)
+        self._ready.set()
+        try:
+            while True:
+                item = self._queue.get()
+                batch, marks, waiters, stop = [], [], [], False
+                while True:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif isinstance(item, tuple):
+                        marks.append(item)
+                    else:
+                        batch.extend(item)
+                    if stop or len(batch) >= self.max_batch:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                try:
+                    if batch:
+                        self.written += store.write(batch)
+                    # Only once the pages they cover are stored
+                    for mark in marks:
+                        store.set_backfill(*mark)
+                except sqlite3.Error:
+                    self.errors += 1
+                for done in waiters:
+                    done.set()
+                if stop:
+                    break
+        finally:
+            store.close()
@@ -0,0 +1,197 @@
+# Minimal asyncio HTTP/1.1 client with a keep-alive connection pool.
+# Stdlib only, so the core stays importable without extra dependencies.
+import asyncio
+import json
+import ssl
+import zlib
+from urllib.parse import urlsplit
+
+USER_AGENT = "pm2aqi/1.0"
+# Only these are sent again after a pooled connection fails mid-request: the
+# server may already have acted on a POST before the connection dropped
+IDEMPOTENT = ('GET', 'HEAD')
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, status, headers, body, wire_size=None):
+        self.status = status
+        self.status_code = status
+        self.headers = headers
+        self.body = body
+        self.content = body
+        # Bytes read for the body, before decompression
+        self.wire_size = len(body) if wire_size is None else wire_size
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class AsyncHTTPClient:
+    # Connections are pooled per (scheme, host, port) and reused for
+    # subsequent requests until the server closes them or they sit idle
+    # longer than keepalive_timeout seconds.
+    def __init__(self, max_per_host=4, keepalive_timeout=120.0):
+        self.max_per_host = max_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._idle = {}
+        self._limits = {}
+        self._ssl = None
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    async def get(self, url, headers=None):
+        return await self.request('GET', url, headers=headers)
+
+    async def post(self, url, body, headers=None, content_type='application/json'):
+        return await self.request('POST', url, body, dict(headers or {}, **{'Content-Type': content_type}))
+
+    async def request(self, method, url, body=None, headers=None):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {host}",
+            f"User-Agent: {USER_AGENT}",
+            "Accept: application/json",
+            "Accept-Encoding: gzip, deflate",
+            "Connection: keep-alive",
+        ]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (body or b'')
+
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.max_per_host)
+        async with limit:
+            conn, reused = await self._acquire(key)
+            while True:
+                try:
+                    response, keep = await self._roundtrip(conn, request, method)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn[1].close()
+                    if not reused or method not in IDEMPOTENT:
+                        raise
+                    # The server dropped an idle connection; retry once fresh
+                    conn, reused = await self._open(key), False
+                except BaseException:
+                    conn[1].close()
+                    raise
+            if keep:
+                self._release(key, conn)
+            else:
+                conn[1].close()
+            return response
+
+    def close(self):
+        for conns in self._idle.values():
+            for _, writer, _ in conns:
+                writer.close()
+        self._idle.clear()
+
+    async def _acquire(self, key):
+        loop = asyncio.get_running_loop()
+        conns = self._idle.get(key, [])
+        while conns:
+            reader, writer, idle_since = conns.pop()
+            if reader.at_eof() or writer.is_closing() or loop.time() - idle_since > self.keepalive_timeout:
+                writer.close()
+                continue
+            return (reader, writer), True
+        return await self._open(key), False
+
+    async def _open(self, key):
+        scheme, hostname, port = key
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            ssl_context = self._ssl
+        reader, writer = await asyncio.open_connection(hostname, port, ssl=ssl_context)
+        self.connections_opened += 1
+        return reader, writer
+
+    def _release(self, key, conn):
+        loop = asyncio.get_running_loop()
+        self._idle.setdefault(key, []).append((conn[0], conn[1], loop.time()))
+
+    async def _roundtrip(self, conn, request, method):
+        reader, writer = conn
+        writer.write(request)
+        await writer.drain()
+        self.requests_sent += 1
+
+        version, status, headers = await self._read_head(reader)
+        while 100 <= status < 200 and status != 101:
+            # Interim responses (100 Continue, 103 Early Hints) precede the real one
+            version, status, headers = await self._read_head(reader)
+
+        keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (101, 204, 304):
+            # No body whatever the headers say; reading to EOF would wait
+            # for the server to close a kept-alive connection
+            body = b''
+            keep = keep and status != 101
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked(reader)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep = False
+
+        wire_size = len(body)
+        encoding = headers.get('content-encoding', '').lower()
+        if encoding == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        return Response(status, headers, body, wire_size), keep
+
+    async def _read_head(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before response")
+        try:
+            version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise HTTPError(f"malformed status line: {status_line!r}")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return version, status, headers
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Skip trailers up to the terminating blank line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
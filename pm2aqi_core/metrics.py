@@ -0,0 +1,149 @@
+# Timings and counters for the fetch -> render cycle.
+#
+# Metrics keeps counters and one fixed-bucket histogram per stage. A span
+# is two perf_counter() calls and a bisect, so the windows leave it on.
+#
+# Stages, as the windows and AmbientClient record them:
+#   fetch    from asking the Fetcher to having a result (includes the three below)
+#   http     request and response on the wire
+#   decode   JSON body -> device list
+#   parse    device list -> readings
+#   render   show_readings: history, trackers and widgets (includes the two below)
+#   track    history submit, NowCast and rolling statistics
+#   widgets  view-model updates of the labels
+#   respond  one request to the local HTTP service
+#   queue    fleet monitor: waiting for a request slot and the key's rate limit
+#
+# render() is the Prometheus text format, write() saves it atomically for
+# a textfile collector, and summary() is the diagnostics panel table.
+import os
+import time
+from bisect import bisect_left
+
+PREFIX = 'pm2aqi'
+# The windows rewrite this file with render() after every poll when set
+METRICS_PATH = os.getenv('PM2AQI_METRICS')
+# Upper bounds in seconds; a final +Inf bucket is implied
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNTERS = {
+    'fetches': "Polls that returned a result",
+    'fetch_errors': "Polls that returned an error",
+    'skipped_polls': "Polls with nothing new since the last one",
+    'bytes_received': "Response bytes read from the API, before decompression",
+    'renders': "Readings applied to the window",
+}
+# Counters only some processes have
+EXTRA_COUNTERS = {
+    'requests': "HTTP requests answered by the local service",
+    'devices': "Readings passed on by the fleet monitor",
+    'rate_limited': "Polls the API answered with 429",
+    'alerts': "Alert events raised by the fleet monitor",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation (max for
+        # the overflow bucket)
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Span:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.stages = {}
+        self.started = time.time()
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def span(self, stage):
+        # with metrics.span('render'): ...
+        return Span(self, stage)
+
+    def render(self):
+        lines = []
+        for name, value in self.counters.items():
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name) or EXTRA_COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        metric = f"{PREFIX}_stage_seconds"
+        lines.append(f"# HELP {metric} Time spent in each stage of the fetch and render cycle")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, h in self.stages.items():
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {h.sum:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {h.count}')
+        lines.append(f"# TYPE {PREFIX}_start_time_seconds gauge")
+        lines.append(f"{PREFIX}_start_time_seconds {self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Atomic, so a collector never reads a half-written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def summary(self):
+        # Plain-text table: one row per stage, then the counters
+        lines = [f"{'stage':<9}{'count':>7}{'last':>10}{'p50':>10}{'p90':>10}{'max':>10}"]
+        for stage, h in self.stages.items():
+            lines.append(f"{stage:<9}{h.count:>7}" + "".join(
+                f"{_ms(v):>10}" for v in (h.last, h.quantile(0.5), h.quantile(0.9), h.max)))
+        lines.append("  ".join(f"{name.replace('_', ' ')}: {value:,}" for name, value in self.counters.items()))
+        return "\n".join(lines)
+
+
+def _ms(seconds):
+    return '--' if seconds is None else f"{seconds * 1000:.1f} ms"
@@ -0,0 +1,174 @@
+# EPA NowCast and 24-hour average for PM2.5.
+#
+# NowCast weights the last 12 hourly averages c1 (newest) .. c12 by
+# w**(i-1), where w = max(min/max, 0.5). It needs at least two of the
+# three most recent hours. The in-progress hour counts as c1 so the value
+# moves with each poll.
+import math
+from collections import deque
+
+from .aqi import DEFAULT_STANDARD, aqi_from_pm25
+
+HOUR_MS = 3_600_000
+NOWCAST_HOURS = 12
+# EPA 24-hour averages need 75% of hours present
+MIN_HOURS_24H = 18
+
+# Which PM2.5 concentration an AQI is computed from
+AQI_BASES = ('nowcast', 'instant', 'avg24')
+BASIS_LABELS = {'nowcast': 'NowCast', 'instant': 'Instant', 'avg24': '24-hour'}
+BASIS_KEYS = {'nowcast': 'pm25_nowcast', 'instant': 'pm25', 'avg24': 'pm25_avg24'}
+
+
+class NowCast:
+    # Incremental per-station state. add() is O(1) amortized and nowcast()
+    # and avg24() look at no more than 24 hourly values.
+    def __init__(self):
+        self.hours = deque()  # (hour, mean) of completed hours, oldest first
+        self.hour = None
+        self.sum = 0.0
+        self.count = 0
+        self.last_ts = None
+        self._sum24 = 0.0
+
+    def add_hour(self, ts_ms, mean):
+        # A completed hour's mean, e.g. from the hourly rollup. Hours come
+        # oldest first, before any add() for a later hour.
+        hour = ts_ms // HOUR_MS
+        if mean is None or self.count or (self.hours and hour <= self.hours[-1][0]):
+            return
+        self.hours.append((hour, mean))
+        self._sum24 += mean
+        self.last_ts = (hour + 1) * HOUR_MS - 1
+
+    def add(self, ts_ms, pm25):
+        # Polls repeat the same reading until the station reports again
+        if ts_ms is None or pm25 is None or (self.last_ts is not None and ts_ms <= self.last_ts):
+            return
+        self.last_ts = ts_ms
+        hour = ts_ms // HOUR_MS
+        if hour != self.hour:
+            if self.count:
+                self.hours.append((self.hour, self.sum / self.count))
+                self._sum24 += self.sum / self.count
+            self.hour, self.sum, self.count = hour, 0.0, 0
+            # Drop hours that fell out of the 24-hour window
+            while self.hours and self.hours[0][0] <= hour - 24:
+                self._sum24 -= self.hours.popleft()[1]
+        self.sum += pm25
+        self.count += 1
+
+    def nowcast(self):
+        if not self.count:
+            return None
+        entries = [(1, self.sum / self.count)]
+        for hour, mean in reversed(self.hours):
+            i = self.hour - hour + 1
+            if i > NOWCAST_HOURS:
+                break
+            entries.append((i, mean))
+        if sum(1 for i, _ in entries if i <= 3) < 2:
+            return None
+        return _weighted(entries)
+
+    def avg24(self):
+        if not self.count or len(self.hours) + 1 < MIN_HOURS_24H:
+            return None
+        return round((self._sum24 + self.sum / self.count) / (len(self.hours) + 1), 1)
+
+
+class NowCastTracker:
+    # One NowCast per station. New stations are seeded from the last day of
+    # stored history when a store is given: completed hours from the hourly
+    # rollup, the current hour from its readings.
+    def __init__(self, store=None):
+        self.store = store
+        self.engines = {}
+
+    def update(self, readings):
+        # Adds 'pm25_nowcast' and 'pm25_avg24' to each reading in place
+        for reading in readings:
+            mac = reading.get('mac')
+            engine = self.engines.get(mac)
+            if engine is None:
+                engine = self.engines[mac] = NowCast()
+                if self.store is not None and reading.get('dateutc') is not None:
+                    self._seed(engine, mac, reading['dateutc'])
+            engine.add(reading.get('dateutc'), reading.get('pm25'))
+            reading['pm25_nowcast'] = engine.nowcast()
+            reading['pm25_avg24'] = engine.avg24()
+        return readings
+
+    def _seed(self, engine, mac, end):
+        hour = end // HOUR_MS * HOUR_MS
+        for ts, _, _, _, mean in self.store.series(mac, hour - 23 * HOUR_MS, hour, ('pm25',), level='1h')[1]:
+            engine.add_hour(ts, mean)
+        for ts, _, _, _, pm25 in self.store.series(mac, hour, end, ('pm25',), level='raw')[1]:
+            engine.add(ts, pm25)
+
+
+def basis_pm25(reading, basis):
+    # (concentration, basis actually used); falls back to the instantaneous
+    # value while NowCast or the 24-hour average lack enough data
+    value = reading.get(BASIS_KEYS[basis])
+    if value is None and basis != 'instant':
+        return reading.get('pm25'), 'instant'
+    return value, basis
+
+
+def aqi_by_basis(reading, standard=DEFAULT_STANDARD):
+    # [(label, aqi)] for every basis, '--' where there is no value
+    result = []
+    for basis in AQI_BASES:
+        value = reading.get(BASIS_KEYS[basis])
+        aqi = '--' if value is None else aqi_from_pm25(value, standard)[0]
+        result.append((BASIS_LABELS[basis], aqi))
+    return result
+
+
+def nowcast_series(ts_ms, pm25):
+    # Vectorized NowCast over stored history. Returns (hour_start_ms,
+    # hourly_mean, nowcast) arrays with one entry per hour from the first
+    # to the last reading; NaN where there is no value.
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    ts = np.asarray(ts_ms, dtype=np.int64)
+    pm = np.asarray(pm25, dtype=np.float64)
+    keep = ~np.isnan(pm)
+    ts, pm = ts[keep], pm[keep]
+    if not len(ts):
+        empty = np.array([], dtype=np.float64)
+        return np.array([], dtype=np.int64), empty, empty
+    hour = ts // HOUR_MS
+    first = hour.min()
+    idx = hour - first
+    n = int(idx.max()) + 1
+    sums = np.bincount(idx, weights=pm, minlength=n)
+    counts = np.bincount(idx, minlength=n)
+    means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    padded = np.concatenate([np.full(NOWCAST_HOURS - 1, np.nan), means])
+    window = sliding_window_view(padded, NOWCAST_HOURS)[:, ::-1]  # column 0 = c1
+    valid = ~np.isnan(window)
+    cmin = np.where(valid, window, np.inf).min(axis=1)
+    cmax = np.where(valid, window, -np.inf).max(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(cmax > 0, np.maximum(cmin / cmax, 0.5), 1.0)
+        weights = np.where(valid, w[:, None] ** np.arange(NOWCAST_HOURS), 0.0)
+        values = np.where(valid, window, 0.0)
+        nowcast = (weights * values).sum(axis=1) / weights.sum(axis=1)
+    enough = valid[:, :3].sum(axis=1) >= 2
+    nowcast = np.where(enough, np.floor(nowcast * 10) / 10, np.nan)
+    hours_ms = (np.arange(n, dtype=np.int64) + first) * HOUR_MS
+    return hours_ms, means, nowcast
+
+
+def _weighted(entries):
+    values = [mean for _, mean in entries]
+    cmin, cmax = min(values), max(values)
+    w = max(cmin / cmax, 0.5) if cmax > 0 else 1.0
+    num = sum(w ** (i - 1) * mean for i, mean in entries)
+    den = sum(w ** (i - 1) for i, _ in entries)
+    # EPA truncates PM2.5 NowCast to one decimal place
+    return math.floor(num / den * 10) / 10
@@ -0,0 +1,282 @@
+# Shared poller: one process owns the fetch loop and publishes each result
+# to every local front-end, so N windows cost one upstream request per
+# interval instead of N.
+#
+# The channel is a Unix socket (localhost TCP where AF_UNIX is missing)
+# carrying newline-delimited JSON. Each message is
+#   {"key": ..., "readings": [...] or null, "error": ... or null, "polled": ms}
+# and a new subscriber immediately gets the latest one. "key" identifies the
+# API keys the daemon polls with, so a window using other keys can tell
+# and poll on its own. A subscriber may send "refresh\n" to ask for an
+# immediate poll; concurrent requests share one in-flight fetch.
+#
+# The daemon also records each new poll to the history database and
+# backfills stations it has not seen, so subscribed windows do neither:
+# one Backfiller, and one token bucket, per API key.
+#
+#   python -m pm2aqi_core.poller [--interval 60] [--address PATH|HOST:PORT] [--history PATH]
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from .ambient import API_URL
+from .backfill import Backfiller
+from .client import AmbientClient
+from .fetcher import Fetcher
+from .history import DEFAULT_PATH, HistoryStore, HistoryWriter
+from .http import AsyncHTTPClient
+from .scheduler import RefreshScheduler
+
+DEFAULT_INTERVAL = 60.0
+# Messages carry every device on the account; StreamReader's default line
+# limit (64 KiB) is too small for large accounts
+MAX_MESSAGE = 16 * 1024 * 1024
+# A subscriber that stops reading is dropped rather than buffered forever
+MAX_BUFFER = 4 * 1024 * 1024
+
+
+def default_address():
+    address = os.getenv('PM2AQI_POLLER')
+    if address:
+        return address
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(tempfile.gettempdir(), f"pm2aqi-{os.getuid()}.sock")
+    return '127.0.0.1:47251'
+
+
+def key_id(api_key, app_key):
+    # Lets subscribers compare keys without the daemon publishing them
+    return hashlib.sha256(f"{api_key}:{app_key}".encode()).hexdigest()[:16]
+
+
+def _tcp(address):
+    # "host:port" -> (host, port), or None for a socket path
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return None
+
+
+async def _open(address):
+    tcp = _tcp(address)
+    if tcp is None:
+        return await asyncio.open_unix_connection(address, limit=MAX_MESSAGE)
+    return await asyncio.open_connection(*tcp, limit=MAX_MESSAGE)
+
+
+class PollerDaemon:
+    # history: database path the windows read, or None to record nothing
+    def __init__(self, api_key, app_key, address=None, interval=DEFAULT_INTERVAL,
+                 api_url=None, http=None, history=DEFAULT_PATH):
+        self.address = address or default_address()
+        self.interval = interval
+        self.http = http or AsyncHTTPClient()
+        self.client = AmbientClient(api_key, app_key, http=self.http, api_url=api_url or API_URL)
+        self.history = self.history_store = self.backfill = None
+        if history is not None:
+            self.history = HistoryWriter(history)
+            self.history_store = HistoryStore(history)
+            self.backfill = Backfiller(self.http, api_key, app_key, self.history, self.history_store,
+                                       api_url=api_url or API_URL)
+        self.fetcher = Fetcher(self.client.fetch_readings)
+        self.scheduler = RefreshScheduler(interval)
+        self.key = key_id(api_key, app_key)
+        self.subscribers = set()
+        self.last = self._encode(None, None, None)
+        self.server = None
+        self.polls = 0
+        self.dropped = 0
+        self._last_result = None
+        self._tasks = set()
+
+    def _encode(self, readings, error, polled):
+        message = {'key': self.key, 'readings': readings, 'error': error, 'polled': polled}
+        return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+    async def start(self):
+        tcp = _tcp(self.address)
+        if tcp is not None:
+            self.server = await asyncio.start_server(self._handle, *tcp)
+            return
+        if os.path.exists(self.address):
+            try:
+                _, writer = await _open(self.address)
+            except OSError:
+                os.unlink(self.address)  # left behind by a daemon that died
+            else:
+                writer.close()
+                raise RuntimeError(f"a poller is already running at {self.address}")
+        self.server = await asyncio.start_unix_server(self._handle, self.address)
+        os.chmod(self.address, 0o600)
+
+    async def run(self):
+        await self.start()
+        try:
+            while True:
+                await self.poll()
+                await asyncio.sleep(self.scheduler.next_delay())
+        finally:
+            await self.close()
+
+    async def poll(self):
+        result = await self.fetcher.fetch()
+        # Callers that joined an in-flight fetch get the same result object;
+        # it is published once
+        if result is None or result is self._last_result:
+            return
+        self._last_result = result
+        readings, error = result
+        self.polls += 1
+        # Published even when nothing is new: "polled" tells subscribers
+        # the data was checked
+        if self.scheduler.observe(readings, error) and not error and self.history is not None:
+            # Before the readings are written, so the gap is measured from
+            # the previous session
+            self.backfill.watch(readings)
+            self.history.submit(readings)
+        self.publish(readings, error)
+
+    def publish(self, readings, error=None):
+        # Encoded once, whatever the number of subscribers
+        self.last = self._encode(readings, error, int(time.time() * 1000))
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                self.dropped += 1
+                self.subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(self.last)
+
+    async def _handle(self, reader, writer):
+        self.subscribers.add(writer)
+        writer.write(self.last)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip() == b'refresh':
+                    task = asyncio.ensure_future(self.poll())
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    async def close(self):
+        self.fetcher.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        if self.backfill is not None:
+            self.backfill.cancel()
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.subscribers):
+                writer.close()
+            self.subscribers.clear()
+            await self.server.wait_closed()
+            self.server = None
+            if _tcp(self.address) is None and os.path.exists(self.address):
+                os.unlink(self.address)
+        if self.history is not None:
+            self.history.close()
+            self.history_store.close()
+            self.history = None
+        self.http.close()
+
+
+class PollerSubscriber:
+    # Async iterator of (readings, error) pushed by a PollerDaemon
+    def __init__(self, address=None):
+        self.address = address or default_address()
+        self.key = None
+        self.reader = None
+        self.writer = None
+        self._pending = None
+
+    async def connect(self, key, timeout=2.0):
+        # True when a daemon polling with the same keys is listening
+        try:
+            self.reader, self.writer = await asyncio.wait_for(_open(self.address), timeout)
+            hello = await asyncio.wait_for(self._next(), timeout)
+        except (OSError, asyncio.TimeoutError, ValueError):
+            self.close()
+            return False
+        if hello is None or hello.get('key') != key:
+            self.close()
+            return False
+        self.key = key
+        if hello['readings'] is not None or hello['error'] is not None:
+            self._pending = hello
+        return True
+
+    async def _next(self):
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message, self._pending = self._pending, None
+        if message is None and self.reader is not None:
+            try:
+                message = await self._next()
+            except (ConnectionError, ValueError):
+                message = None
+        if message is None:
+            self.close()
+            raise StopAsyncIteration
+        return message['readings'], message['error']
+
+    def refresh(self):
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(b'refresh\n')
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Poll Ambient Weather once for every local PM2AQI window.")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between polls")
+    parser.add_argument('--address', default=None, help="socket path or host:port to listen on")
+    parser.add_argument('--history', default=DEFAULT_PATH, metavar='PATH',
+                        help="history database to record polls and backfill into (default: the windows')")
+    args = parser.parse_args(argv)
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    api_key = os.getenv('AMBIENT_API_KEY', '')
+    app_key = os.getenv('AMBIENT_APP_KEY', '')
+    if not api_key or not app_key:
+        print("AMBIENT_API_KEY and AMBIENT_APP_KEY must be set (environment or .env).", file=sys.stderr)
+        return 1
+    daemon = PollerDaemon(api_key, app_key, args.address, args.interval, api_url=os.getenv('AMBIENT_API_URL'),
+                          history=args.history)
+    print(f"Polling about every {args.interval:g} s, timed to station updates; windows subscribe at {daemon.address}")
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# asyncio token bucket for staying inside the Ambient API rate limits.
+import asyncio
+import math
+import time
+
+
+def retry_after(value, default=1.0):
+    # Seconds to wait from a Retry-After header: delay-seconds or an
+    # HTTP-date (RFC 9110). default when missing or unparseable.
+    if value is None:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return max(seconds, 0.0) if math.isfinite(seconds) else default
+    from email.utils import parsedate_to_datetime  # rare, and slow to import
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return default
+
+
+class TokenBucket:
+    # Allows `rate` acquisitions per second on average, with bursts of up
+    # to `capacity`. Waiters are served in arrival order.
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                self._refill(loop.time())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds):
+        # Drain the bucket after a 429 so every waiter backs off together
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def restart(self):
+        # Count the next token from now, as if the last one were taken now.
+        # Called when a response arrives, it keeps requests 1 / rate apart
+        # at the server however long they spent on the way.
+        self._refill(asyncio.get_running_loop().time())
+        self.tokens = min(self.tokens, 0)
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
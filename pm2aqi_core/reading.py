@@ -0,0 +1,54 @@
+# Reading model: flattens an Ambient Weather device record into the dict
+# both front-ends render from.
+
+from .fields import PARSED_FIELDS
+
+# lastData keys copied into every reading, in registry order
+WEATHER_FIELDS = PARSED_FIELDS
+
+
+def reading_from_device(device):
+    # Returns the selected lastData fields plus 'pm25' (outdoor PM2.5,
+    # None if the device has no sensor), the derived 'weather' icon key
+    # and the station's 'mac' and display 'name'
+    last_data = device.get('lastData', {})
+    reading = {key: last_data.get(key) for key in WEATHER_FIELDS}
+    reading['mac'] = device.get('macAddress')
+    reading['name'] = (device.get('info') or {}).get('name') or reading['mac'] or 'Station'
+    pm25 = last_data.get('pm25')
+    if pm25 is None:
+        pm25 = last_data.get('pm25_out')
+    reading['pm25'] = pm25
+    reading['weather'] = current_conditions(last_data)
+    return reading
+
+
+def readings_from_devices(devices):
+    # One reading per station on the account, in API order
+    return [reading_from_device(device) for device in devices]
+
+
+def current_conditions(last_data):
+    # Rough current-conditions guess for the forecast icon
+    tempf = _number(last_data, 'tempf', 40)
+    rain_rate = _number(last_data, 'hourlyrainin', 0)
+    daily_rain = _number(last_data, 'dailyrainin', 0)
+    solarrad = _number(last_data, 'solarradiation', 0)
+    # If it's raining (rain rate or daily rain just increased)
+    if rain_rate > 0.01:
+        # If cold enough, show snow
+        return 'snow' if tempf <= 34 else 'rain'
+    # If not raining, check for snow (below freezing, some rain)
+    if tempf <= 34 and (rain_rate > 0 or daily_rain > 0):
+        return 'snow'
+    # If not raining or snowing, check for sun/partly/cloudy
+    if solarrad > 600:
+        return 'sunny'
+    if solarrad > 200:
+        return 'partlycloudy'
+    return 'cloudy'
+
+
+def _number(last_data, key, default):
+    value = last_data.get(key)
+    return default if value is None else value
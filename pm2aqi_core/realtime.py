@@ -0,0 +1,145 @@
+# Ambient's realtime feed: a Socket.IO endpoint that pushes each device's
+# lastData as it arrives, instead of the app polling the device list.
+#
+# Socket.IO (Engine.IO v4) over a WebSocket:
+#   server "0{...}" open, with pingInterval/pingTimeout; client "40" to join
+#   client '42["subscribe",{"apiKeys":[...]}]'
+#   server '42["subscribed",{"devices":[...]}]' then '42["data",{lastData + macAddress}]'
+#   server "2" ping, client "3" pong
+#
+# RealtimeStream reconnects with exponential backoff and reports each
+# connect/disconnect, so callers can fall back to polling while it is down.
+# Nothing but cancel() stops it: an unexpected error ends the session and is
+# retried like a dropped connection, and a failing callback is logged and
+# skipped.
+import asyncio
+import json
+import os
+import random
+import sys
+from urllib.parse import urlsplit
+
+from .reading import reading_from_device
+from .websocket import WebSocketClosed, connect
+
+REALTIME_URL = os.getenv('AMBIENT_REALTIME_URL', "https://rt2.ambientweather.net")
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 60.0
+
+
+def realtime_url(app_key, base=None):
+    parts = urlsplit(base or REALTIME_URL)
+    scheme = 'wss' if parts.scheme in ('https', 'wss') else 'ws'
+    return f"{scheme}://{parts.netloc}/socket.io/?api=1&applicationKey={app_key}&EIO=4&transport=websocket"
+
+
+class RealtimeStream:
+    # on_readings(readings): called with every subscribed device on connect,
+    # then with the one device in each pushed update.
+    # on_state(connected): called when the stream comes up or goes down.
+    def __init__(self, api_key, app_key, on_readings, on_state=None, url=None,
+                 backoff_min=BACKOFF_MIN, backoff_max=BACKOFF_MAX):
+        self.api_key = api_key
+        self.app_key = app_key
+        self.on_readings = on_readings
+        self.on_state = on_state
+        self.url = realtime_url(app_key, url)
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.connected = False
+        self.info = {}  # mac -> device info from the subscribe reply
+        self.connects = 0
+        self.updates = 0
+        self.callback_errors = 0
+        self.last_error = None
+        self._task = None
+        self._ws = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def cancel(self):
+        # Stopping on purpose is not a dropped stream; no state callback
+        self.connected = False
+        if self._ws is not None:
+            self._ws.close()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        delay = self.backoff_min
+        while True:
+            try:
+                await self._session()
+            except (OSError, WebSocketClosed, asyncio.TimeoutError, ValueError) as e:
+                self.last_error = str(e) or type(e).__name__
+            except Exception as e:
+                # A bad packet or a bug; a dead task would leave callers
+                # waiting on a stream that never comes back
+                self.last_error = repr(e)
+                print(f"realtime: session failed: {e!r}", file=sys.stderr)
+            finally:
+                if self._ws is not None:
+                    self._ws.close()
+                    self._ws = None
+                if self.connected:
+                    delay = self.backoff_min  # it was up; start over
+                    self._set_state(False)
+            # Full jitter so many clients do not reconnect in lockstep
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, self.backoff_max)
+
+    async def _session(self):
+        ws = self._ws = await connect(self.url)
+        packet = await asyncio.wait_for(ws.recv(), 30)
+        if not packet.startswith('0'):
+            raise ValueError(f"unexpected Engine.IO open packet: {packet[:40]!r}")
+        handshake = json.loads(packet[1:])
+        # The server pings every pingInterval; silence past this means the
+        # connection is dead even if TCP has not noticed
+        silence = (handshake.get('pingInterval', 25000) + handshake.get('pingTimeout', 20000)) / 1000
+        await ws.send('40')
+        while True:
+            packet = await asyncio.wait_for(ws.recv(), silence)
+            if packet == '2':
+                await ws.send('3')
+            elif packet.startswith('40'):
+                await ws.send('42' + json.dumps(['subscribe', {'apiKeys': [self.api_key]}]))
+            elif packet.startswith('42'):
+                event, *args = json.loads(packet[2:])
+                self._event(event, args[0] if args else None)
+            elif packet.startswith(('41', '44', '1')):
+                raise WebSocketClosed(f"closed by server: {packet[:80]}")
+
+    def _event(self, event, payload):
+        if event == 'subscribed':
+            devices = (payload or {}).get('devices', [])
+            self.info = {d.get('macAddress'): d.get('info') or {} for d in devices}
+            self.connects += 1
+            self._set_state(True)
+            readings = [reading_from_device(d) for d in devices if d.get('lastData')]
+            if readings:
+                self._callback('on_readings', readings)
+        elif event == 'data' and payload:
+            mac = payload.get('macAddress')
+            device = {'macAddress': mac, 'lastData': payload, 'info': self.info.get(mac, {})}
+            self.updates += 1
+            self._callback('on_readings', [reading_from_device(device)])
+
+    def _set_state(self, connected):
+        if connected != self.connected:
+            self.connected = connected
+            if self.on_state is not None:
+                self._callback('on_state', connected)
+
+    def _callback(self, name, arg):
+        # The caller's error is not the stream's; keep the session up
+        try:
+            getattr(self, name)(arg)
+        except Exception as e:
+            self.callback_errors += 1
+            self.last_error = repr(e)
+            print(f"realtime: {name} failed: {e!r}", file=sys.stderr)
@@ -0,0 +1,137 @@
+# Fixed-capacity, array-backed buffer of recent readings for one station.
+#
+# Timestamps are one int64 column and the numeric fields share one float64
+# block stored column by column (Fortran order), so each field is a
+# contiguous column. Missing values are NaN. The buffer holds the newest
+# `capacity` samples. Appends write one row at the end. When the arrays
+# fill up, the retained samples are moved back to the front. That happens
+# once every `slack` appends, so an append is O(1) amortized, and every
+# window is a zero-copy slice of the arrays.
+#
+# Memory is (1 + len(fields)) * 8 bytes per sample, times
+# (capacity + slack) / capacity. For the 11 rolling-statistics fields at
+# one sample a minute that is 96 bytes, about 138 KB per device-day, or
+# 173 KB with the default slack. A day of reading dicts is about 2.4 MB.
+#
+# Samples are numbered by sequence (0 for the first append ever), so
+# callers can keep positions across appends: rows first_seq..end_seq - 1
+# are held.
+#
+# NumPy is imported when the first buffer is created, so importing this
+# module (and rolling.py) stays cheap.
+DAY_MS = 86_400_000
+
+
+def bytes_per_device_day(fields, interval_ms=60_000, slack=0.25):
+    return int((1 + len(fields)) * 8 * (1 + slack) * DAY_MS // interval_ms)
+
+
+class RingBuffer:
+    def __init__(self, fields, capacity, slack=None):
+        import numpy as np
+
+        self.fields = tuple(fields)
+        self.index = {field: i for i, field in enumerate(self.fields)}
+        self.capacity = capacity
+        self.slack = max(1, capacity // 4) if slack is None else max(1, slack)
+        size = capacity + self.slack
+        self.ts = np.zeros(size, dtype=np.int64)
+        self.values = np.full((size, len(self.fields)), np.nan, order='F')
+        self.start = 0  # array position of the oldest sample
+        self.end = 0  # array position after the newest sample
+        self.end_seq = 0  # sequence number after the newest sample
+
+    @property
+    def first_seq(self):
+        return self.end_seq - (self.end - self.start)
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def nbytes(self):
+        return self.ts.nbytes + self.values.nbytes
+
+    def append(self, ts_ms, reading):
+        # reading is a dict; values that are not numbers are stored as NaN
+        self.append_row(ts_ms, [_number(reading.get(field)) for field in self.fields])
+
+    def append_row(self, ts_ms, row):
+        # row is one float per field, in field order, NaN where missing
+        if self.end == len(self.ts):
+            self._compact()
+        end = self.end
+        self.ts[end] = ts_ms
+        self.values[end] = row
+        self.end = end + 1
+        self.end_seq += 1
+        if self.end - self.start > self.capacity:
+            self.start += 1
+
+    def extend(self, ts_ms, values):
+        # Bulk append: ts_ms is a sequence of timestamps, values a 2-D array
+        # with one column per field (NaN where missing)
+        import numpy as np
+
+        ts_ms = np.asarray(ts_ms, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(ts_ms), len(self.fields))
+        count = len(ts_ms)
+        self.end_seq += count
+        if count >= self.capacity:
+            # Only the newest capacity samples are kept
+            self.ts[:self.capacity] = ts_ms[count - self.capacity:]
+            self.values[:self.capacity] = values[count - self.capacity:]
+            self.start, self.end = 0, self.capacity
+            return
+        if self.end + count > len(self.ts):
+            self._compact(self.capacity - count)
+        self.ts[self.end:self.end + count] = ts_ms
+        self.values[self.end:self.end + count] = values
+        self.end += count
+        self.start = max(self.start, self.end - self.capacity)
+
+    def _compact(self, keep=None):
+        # Move the newest samples (at most keep) to the front
+        count = self.end - self.start if keep is None else min(keep, self.end - self.start)
+        first = self.end - count
+        self.ts[:count] = self.ts[first:self.end]
+        self.values[:count] = self.values[first:self.end]
+        self.start = 0
+        self.end = count
+
+    def timestamps(self):
+        return self.ts[self.start:self.end]
+
+    def column(self, field):
+        return self.values[self.start:self.end, self.index[field]]
+
+    def row(self, seq):
+        # Values of the sample with sequence number seq, as a list of
+        # floats in field order (NaN where missing)
+        return self.values[self.end - (self.end_seq - seq)].tolist()
+
+    def window(self, start_ms=None, end_ms=None):
+        # (timestamps, values) views of the samples with start_ms <= ts <
+        # end_ms; values has one column per field. Timestamps must have
+        # been appended in order.
+        ts = self.ts[self.start:self.end]
+        lo = 0 if start_ms is None else int(ts.searchsorted(start_ms, 'left'))
+        hi = len(ts) if end_ms is None else int(ts.searchsorted(end_ms, 'left'))
+        return ts[lo:hi], self.values[self.start + lo:self.start + hi]
+
+    def tail(self, count):
+        # (timestamps, values) views of the newest count samples
+        start = max(self.start, self.end - count)
+        return self.ts[start:self.end], self.values[start:self.end]
+
+    def latest_ts(self):
+        return int(self.ts[self.end - 1]) if self.end > self.start else None
+
+
+NAN = float('nan')
+
+
+def _number(value):
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return NAN
+    return value
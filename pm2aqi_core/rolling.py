@@ -0,0 +1,142 @@
+# Rolling min/max/mean over the last hour, day and week of live readings.
+#
+# Each station keeps its samples in a RingBuffer sized to the longest
+# window. Every window tracks the sequence number where it starts in that
+# buffer, plus a running sum and monotonic min/max deques per field.
+# Adding a reading and evicting old ones is amortized O(1), and nothing is
+# rescanned.
+from collections import deque
+
+from .history import HISTORY_FIELDS
+from .ringbuffer import NAN, RingBuffer
+
+HOUR_MS = 3_600_000
+WINDOWS = (('1h', HOUR_MS), ('24h', 24 * HOUR_MS), ('7d', 7 * 24 * HOUR_MS))
+# Readings closer together than this are skipped, so a station never holds
+# more than a week of one-minute samples
+MIN_INTERVAL_MS = 60_000
+DEFAULT_FIELDS = (
+    'pm25', 'pm25_in', 'tempf', 'tempinf', 'humidity', 'humidityin',
+    'windspeedmph', 'windgustmph', 'baromabsin', 'solarradiation', 'uv',
+)
+
+
+class _Window:
+    __slots__ = ('sum', 'count', 'mins', 'maxs')
+
+    def __init__(self):
+        self.sum = 0.0
+        self.count = 0
+        self.mins = deque()  # (seq, value), values increasing
+        self.maxs = deque()  # (seq, value), values decreasing
+
+    def push(self, seq, value):
+        self.sum += value
+        self.count += 1
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((seq, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((seq, value))
+
+    def drop(self, seq, value):
+        self.count -= 1
+        # Reset rather than let float error build up in an empty window
+        self.sum = self.sum - value if self.count else 0.0
+        if self.mins and self.mins[0][0] == seq:
+            self.mins.popleft()
+        if self.maxs and self.maxs[0][0] == seq:
+            self.maxs.popleft()
+
+    def stats(self):
+        if not self.count:
+            return None
+        return self.mins[0][1], self.maxs[0][1], round(self.sum / self.count, 2)
+
+
+class RollingStats:
+    # Rolling statistics for one station
+    def __init__(self, fields=DEFAULT_FIELDS, windows=WINDOWS):
+        self.fields = tuple(fields)
+        self.windows = tuple(windows)
+        # Readings are at least MIN_INTERVAL_MS apart, so this holds the
+        # longest window
+        self.buffer = RingBuffer(self.fields, max(span for _, span in self.windows) // MIN_INTERVAL_MS + 1)
+        self.heads = [0] * len(self.windows)  # sequence number where each window starts
+        self.state = [{f: _Window() for f in self.fields} for _ in self.windows]
+        self.last_ts = None
+
+    def add(self, ts_ms, reading):
+        if ts_ms is None or (self.last_ts is not None and ts_ms - self.last_ts < MIN_INTERVAL_MS):
+            return False
+        self.last_ts = ts_ms
+        seq = self.buffer.end_seq
+        row = []
+        for field in self.fields:
+            value = reading.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                row.append(NAN)
+                continue
+            row.append(value)
+            for state in self.state:
+                state[field].push(seq, value)
+        self.buffer.append_row(ts_ms, row)
+        self._evict(ts_ms)
+        return True
+
+    def _evict(self, now_ms):
+        buffer = self.buffer
+        ts = buffer.timestamps()
+        first = buffer.first_seq
+        for i, (_, span) in enumerate(self.windows):
+            # Samples at or before the cutoff leave the window
+            cutoff = now_ms - span
+            head, state = self.heads[i], self.state[i]
+            while ts[head - first] <= cutoff:
+                for field, value in zip(self.fields, buffer.row(head)):
+                    if value == value:  # NaN is missing
+                        state[field].drop(head, value)
+                head += 1
+            self.heads[i] = head
+
+    def stats(self):
+        # {field: {window: (min, max, mean) or None}}
+        return {
+            field: {label: state[field].stats() for (label, _), state in zip(self.windows, self.state)}
+            for field in self.fields
+        }
+
+    def __len__(self):
+        # Samples still in the longest window
+        return self.buffer.end_seq - min(self.heads)
+
+
+class RollingTracker:
+    # One RollingStats per station. New stations are seeded from the longest
+    # window of stored history when a store is given.
+    def __init__(self, store=None, fields=DEFAULT_FIELDS, windows=WINDOWS):
+        self.store = store
+        self.fields = tuple(fields)
+        self.windows = tuple(windows)
+        self.stations = {}
+
+    def update(self, readings):
+        # Adds 'rolling' ({field: {window: (min, max, mean)}}) to each reading
+        for reading in readings:
+            mac = reading.get('mac')
+            stats = self.stations.get(mac)
+            if stats is None:
+                stats = self.stations[mac] = RollingStats(self.fields, self.windows)
+                self._seed(stats, mac, reading.get('dateutc'))
+            stats.add(reading.get('dateutc'), reading)
+            reading['rolling'] = stats.stats()
+        return readings
+
+    def _seed(self, stats, mac, end):
+        if self.store is None or end is None:
+            return
+        fields = tuple(f for f in self.fields if f in HISTORY_FIELDS)
+        start = end - max(span for _, span in self.windows)
+        for row in self.store.query(mac, start, end, fields):
+            stats.add(row[0], dict(zip(fields, row[1:])))
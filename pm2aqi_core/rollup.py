@@ -0,0 +1,141 @@
+# Rollup pyramid for the history store: 5-minute, hourly and daily
+# aggregates of every history field, so long ranges are read from a few
+# hundred rows instead of every reading.
+#
+# Each level is one table shared by all stations (rollup_5m, rollup_1h,
+# rollup_1d), keyed by the station's readings table and the bucket start
+# (UTC-aligned epoch ms). A row holds the number of readings and min, max,
+# sum and count per field. Every HistoryStore.write recomputes only the
+# buckets its readings fall in: 5-minute buckets from the readings, hourly
+# from 5-minute and daily from hourly. A live poll touches one bucket per
+# level. Recomputing from the level below, rather than adding to a total,
+# keeps the rollups right when a reading is replaced.
+#
+# The statements are the same for every station, so SQLite keeps them
+# prepared however many stations there are. The 5-minute buckets are
+# summed in Python for the same reason: each station's readings table
+# needs its own statement, and a 48-aggregate GROUP BY per station takes
+# longer to prepare than the few readings take to add up.
+#
+# series() picks the finest level whose bucket count for the range fits
+# the point budget. For example, at 1,000 points half a day reads
+# readings, a day reads 5-minute rows, a month hourly rows and a year
+# daily rows.
+from itertools import groupby
+
+from .aqi import DEFAULT_STANDARD, OUT_OF_RANGE, aqi_from_pm25
+
+# (name, bucket ms), finest first
+LEVELS = (('5m', 300_000), ('1h', 3_600_000), ('1d', 86_400_000))
+# Readings arrive about once a minute; used to estimate raw point counts
+RAW_INTERVAL_MS = 60_000
+DEFAULT_MAX_POINTS = 1000
+
+
+def rollup_table(level):
+    return f'rollup_{level}'
+
+
+def rollup_columns(fields):
+    return [f'{f}_{stat}' for f in fields for stat in ('min', 'max', 'sum', 'n')]
+
+
+def create_rollups(conn, fields):
+    # Creates (or adds missing columns to) the rollup tables. Returns True
+    # if anything changed, so the caller can rebuild them from the readings.
+    # Call it inside BEGIN IMMEDIATE: other connections may be opening the
+    # same database, and only the one holding the write lock decides.
+    changed = False
+    for level, _ in LEVELS:
+        name = rollup_table(level)
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({name})')}
+        if not existing:
+            columns = ', '.join(f'{c} {_type(c)}' for c in rollup_columns(fields))
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {name} (station TEXT NOT NULL, ts INTEGER NOT NULL, n INTEGER, '
+                         f'{columns}, PRIMARY KEY (station, ts))')
+            changed = True
+            continue
+        for column in rollup_columns(fields):
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {name} ADD COLUMN {column} {_type(column)}')
+                changed = True
+    return changed
+
+
+def update_rollups(conn, tbl, fields, start, end):
+    # Recomputes every bucket, at every level, that overlaps the readings
+    # in tbl with start <= ts <= end
+    columns = ', '.join(['station', 'ts', 'n'] + rollup_columns(fields))
+    placeholders = ', '.join('?' * (3 + 4 * len(fields)))
+    level, size = LEVELS[0]
+    lo, hi = start // size * size, end // size * size + size
+    readings = conn.execute(
+        f'SELECT ts, {", ".join(fields)} FROM {tbl} WHERE ts >= ? AND ts < ? ORDER BY ts', (lo, hi)
+    ).fetchall()
+    conn.executemany(
+        f'INSERT OR REPLACE INTO {rollup_table(level)} ({columns}) VALUES ({placeholders})',
+        _buckets(tbl, readings, size),
+    )
+    aggregates = ', '.join(f'MIN({f}_min), MAX({f}_max), SUM({f}_sum), SUM({f}_n)' for f in fields)
+    for (level, size), (source, _) in zip(LEVELS[1:], LEVELS):
+        conn.execute(
+            f'INSERT OR REPLACE INTO {rollup_table(level)} ({columns}) '
+            f'SELECT station, ts / {size} * {size} AS bucket, SUM(n), {aggregates} FROM {rollup_table(source)} '
+            f'WHERE station = ? AND ts >= ? AND ts < ? GROUP BY bucket',
+            (tbl, start // size * size, end // size * size + size),
+        )
+
+
+def _buckets(station, readings, size):
+    # (station, bucket, n, then min, max, sum, count per field) rows from
+    # (ts, value per field) readings ordered by ts
+    rows = []
+    for bucket, group in groupby(readings, key=lambda r: r[0] // size):
+        columns = list(zip(*group))
+        row = [station, bucket * size, len(columns[0])]
+        for column in columns[1:]:
+            values = [v for v in column if v is not None]
+            row += (min(values), max(values), sum(values), len(values)) if values else (None, None, None, 0)
+        rows.append(row)
+    return rows
+
+
+def _type(column):
+    return 'INTEGER' if column.endswith('_n') else 'REAL'
+
+
+def pick_level(start, end, max_points=DEFAULT_MAX_POINTS):
+    # (name, bucket ms) of the finest level that fits max_points over
+    # start..end; ('raw', RAW_INTERVAL_MS) if the readings themselves fit
+    span = end - start
+    if span / RAW_INTERVAL_MS <= max_points:
+        return 'raw', RAW_INTERVAL_MS
+    for level, size in LEVELS:
+        if span / size <= max_points:
+            return level, size
+    return LEVELS[-1]
+
+
+def series_query(tbl, level, fields, start, end):
+    # (sql, params) for (ts, n, then min, max, mean per field) rows of one
+    # level with start <= ts < end
+    if level == 'raw':
+        values = ', '.join(f'{f}, {f}, {f}' for f in fields)
+        return f'SELECT ts, 1, {values} FROM {tbl} WHERE ts >= ? AND ts < ? ORDER BY ts', (start, end)
+    values = ', '.join(f'{f}_min, {f}_max, {f}_sum / {f}_n' for f in fields)
+    return (f'SELECT ts, n, {values} FROM {rollup_table(level)} '
+            f'WHERE station = ? AND ts >= ? AND ts < ? ORDER BY ts', (tbl, start, end))
+
+
+def with_aqi(rows, pm25_index, standard=DEFAULT_STANDARD):
+    # Appends (min, max, mean) AQI under standard to each row, from the
+    # PM2.5 (min, max, mean) at pm25_index. AQI rises with PM2.5 in every
+    # standard, so the AQI of the PM2.5 min and max are the AQI min and
+    # max. Out of range is None.
+    def aqi(value):
+        if value is None:
+            return None
+        result = aqi_from_pm25(value, standard)[0]
+        return None if result == OUT_OF_RANGE[0] else result
+
+    return [row + tuple(aqi(v) for v in row[pm25_index:pm25_index + 3]) for row in rows]
@@ -0,0 +1,166 @@
+# Adaptive refresh scheduling for the polling front-ends.
+#
+# Instead of a fixed 60 s timer, the next poll is aimed just after each
+# station's dateutc is expected to advance, as learned from the gaps
+# between its readings. Errors and 429s back off exponentially, and a
+# window that is minimized or covered polls slowly. Pure bookkeeping with
+# no Qt or asyncio, so the windows drive it from a single-shot QTimer.
+import math
+import time
+
+DEFAULT_INTERVAL = 60.0
+# Assumed delay from a reading's dateutc to it showing up in the API, until
+# it has been measured. The measurement also absorbs clock skew.
+PUBLISH_LAG = 8.0
+MIN_DELAY = 10.0
+# Stations reporting within this fraction of the interval are polled just
+# after each reading
+SLACK = 0.25
+MAX_BACKOFF = 900.0
+HIDDEN_INTERVAL = 300.0
+# Samples kept for the cadence and publish lag estimates
+SAMPLES = 5
+
+
+class RefreshScheduler:
+    def __init__(self, interval=DEFAULT_INTERVAL, min_delay=MIN_DELAY, max_backoff=MAX_BACKOFF,
+                 hidden_interval=HIDDEN_INTERVAL, lag=PUBLISH_LAG):
+        self.interval = interval
+        self.min_delay = min_delay
+        self.max_backoff = max_backoff
+        self.hidden_interval = hidden_interval
+        self.lag = lag
+        self.last = {}  # mac -> newest dateutc (ms)
+        self.gaps = {}  # mac -> recent gaps between readings (s)
+        # mac -> recent bounds on the publish lag: seconds from dateutc to
+        # polls that saw the reading (upper), and to polls that came too
+        # early to see it (lower)
+        self.seen_after = {}
+        self.early_by = {}
+        self.failures = 0
+        self.stale_streak = 0
+        self.started = None
+        self.polled = None
+        self.polls = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def observe(self, readings, error, now=None):
+        # Record a poll result. Returns False when no station reported
+        # anything new, so the caller can skip redrawing.
+        now = time.time() if now is None else now
+        if self.started is None:
+            self.started = now
+        self.polls += 1
+        self.polled = now
+        if error:
+            self.errors += 1
+            if '429' in error:
+                self.rate_limited += 1
+            self.failures += 1
+            return True
+        self.failures = 0
+        changed = False
+        for reading in readings or ():
+            mac, ts = reading.get('mac'), reading.get('dateutc')
+            if ts is None:
+                changed = True
+                continue
+            previous = self.last.get(mac)
+            if previous is None or ts > previous:
+                changed = True
+                self.last[mac] = ts
+                _push(self.seen_after.setdefault(mac, []), now - ts / 1000)
+                if previous is not None:
+                    _push(self.gaps.setdefault(mac, []), (ts - previous) / 1000)
+            if mac in self.gaps and self._aligned(mac):
+                # The reading after the newest one was not out yet. Most
+                # polls land well after it would have been, and bounds that
+                # loose would only push out the useful ones.
+                early = now - self.last[mac] / 1000 - self.cadence(mac)
+                bounds = self.early_by.setdefault(mac, [])
+                if not bounds or early > max(bounds) - self.cadence(mac) / 2:
+                    _push(bounds, early)
+        if changed:
+            self.stale_streak = 0
+        else:
+            self.unchanged += 1
+            self.stale_streak += 1
+        return changed
+
+    def cadence(self, mac):
+        # A missed poll doubles one gap, so the smallest recent gap is the
+        # best guess at the reporting interval
+        gaps = self.gaps.get(mac)
+        return min(gaps) if gaps else self.interval
+
+    def _aligned(self, mac):
+        # Stations reporting faster than the interval are sampled instead
+        return self.cadence(mac) >= self.interval * (1 - SLACK)
+
+    def _expected(self, mac):
+        # When the reading after the newest one should be out
+        return self.last[mac] / 1000 + self.cadence(mac) + self.publish_lag(mac)
+
+    def _overdue(self, now):
+        return any(self._aligned(mac) and self._expected(mac) <= now for mac in self.last)
+
+    def publish_lag(self, mac):
+        # Bisects between the bounds, so polls creep earlier until one is
+        # too early, then settle just after the reading appears. Negative
+        # when the station's clock runs ahead.
+        hi = min(self.seen_after.get(mac) or [self.lag])
+        lo = min(max(self.early_by.get(mac) or [-self.interval]), hi)
+        lag = hi + 1.0 if hi - lo <= 2.0 else (lo + hi) / 2
+        return min(max(lag, -self.interval), self.interval)
+
+    def next_delay(self, now=None, visible=True):
+        # Seconds until the next poll, counted from the last one so it can
+        # be asked again whenever visibility changes
+        now = time.time() if now is None else now
+        last = self.polled if self.polled is not None else now
+        if self.failures:
+            due = last + min(self.interval * 2 ** self.failures, self.max_backoff)
+        elif self.stale_streak and self._overdue(last):
+            # Due but nothing new yet: retry soon, backing off
+            due = last + min(self.min_delay * 2 ** (self.stale_streak - 1), self.interval)
+        elif self.last:
+            # Just after the next station's reading is expected to appear.
+            # Sampled stations gain nothing from alignment, and stations out
+            # of phase with each other cannot all be caught, so several
+            # stations are polled a whole interval apart.
+            due = None
+            for mac in self.last:
+                if self._aligned(mac):
+                    at = self._expected(mac)
+                    if at <= last:
+                        # Late already at the last poll; wait for the next
+                        cadence = self.cadence(mac)
+                        at += math.ceil((last - at) / cadence + 1e-9) * cadence
+                else:
+                    at = last + self.interval
+                due = at if due is None else min(due, at)
+            spacing = self.interval * (1 - SLACK) if len(self.last) == 1 else self.interval
+            due = max(due, last + spacing)
+        else:
+            due = last + self.interval
+        if not visible:
+            due = max(due, last + self.hidden_interval)
+        return max(due - now, 0.0)
+
+    def saved(self, now=None):
+        # Polls a fixed interval timer would have made, minus the polls made
+        if self.started is None:
+            return 0
+        now = time.time() if now is None else now
+        return max(0, int((now - self.started) / self.interval) + 1 - self.polls)
+
+    def summary(self, now=None):
+        return (f"Polls: {self.polls} · no new data: {self.unchanged} · "
+                f"errors: {self.errors} · saved vs fixed {self.interval:g} s: {self.saved(now)}")
+
+
+def _push(samples, value):
+    samples.append(value)
+    del samples[:-SAMPLES]
@@ -0,0 +1,319 @@
+# Local HTTP service: AQI conversion, health statements and the latest
+# readings for other programs on this machine, answered from memory.
+#
+#   GET  /aqi?pm25=12.3          {"pm25": 12.3, "aqi": 57, "category": "Moderate", "color": "#fbc02d"}
+#   GET  /aqi?pm25=12&pm10=160   the highest sub-index, with "pollutant" naming its pollutant
+#   POST /aqi                    body 12.3 -> one result; [12.3, 40, ...] -> array of results
+#   GET  /aqi/details?pm25=12.3  {"pm25": 12.3, "category": ..., "text": <EPA health statements>}
+#   GET  /readings               latest reading per device, each with "aqi" and "aqi_category"
+#   GET  /readings/<mac>         one device's latest reading
+#   GET  /status                 where readings come from and when they last changed
+#   GET  /metrics                fetch and request timings, Prometheus text format
+#
+# Readings come from the shared poller when one is running with the same
+# keys, otherwise from the service's own poll loop, paced by the same
+# RefreshScheduler. No request ever reaches Ambient: each update is encoded
+# once and every GET is served from those bytes. Out-of-range values have
+# "aqi": null. Without API keys only the conversion routes have data.
+#
+# The /aqi routes take "standard" (us, us-2012, cn, in or eu; default
+# --standard) and POST /aqi takes "pollutant" (pm25, pm10 or o3) in the
+# query string. Readings use --standard.
+#
+#   python -m pm2aqi_core.service [--host 127.0.0.1] [--port 8765] [--interval 60] [--standard us]
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .aqi import (DEFAULT_STANDARD, OUT_OF_RANGE, aqi_array, aqi_details_text, aqi_from_concentration, aqi_from_pm25,
+                  categories, overall_aqi, pollutants)
+from .ambient import API_URL
+from .client import AmbientClient
+from .http import AsyncHTTPClient
+from .metrics import Metrics
+from .poller import DEFAULT_INTERVAL, PollerSubscriber, key_id
+from .scheduler import RefreshScheduler
+from .standards import STANDARDS
+
+DEFAULT_PORT = 8765
+# Largest request body accepted (a batch of about a million values)
+MAX_BODY = 16 * 1024 * 1024
+METRICS_TYPE = 'text/plain; version=0.0.4'
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+def aqi_result(value, pollutant='pm25', standard=DEFAULT_STANDARD):
+    aqi, category, color = aqi_from_concentration(value, pollutant, standard)
+    return {pollutant: value, 'aqi': None if aqi == OUT_OF_RANGE[0] else aqi, 'category': category, 'color': color}
+
+
+def aqi_results(values, pollutant='pm25', standard=DEFAULT_STANDARD):
+    # aqi_result for a list of numbers, in one vectorized pass
+    aqi, idx, colors = aqi_array(values, pollutant, standard)
+    names = categories(standard)
+    return [
+        {pollutant: v, 'aqi': a if i >= 0 else None, 'category': names[i] if i >= 0 else OUT_OF_RANGE[1], 'color': c}
+        for v, a, i, c in zip(values, aqi.tolist(), idx.tolist(), colors.tolist())
+    ]
+
+
+def overall_result(values, standard=DEFAULT_STANDARD):
+    # values: {pollutant: number}
+    aqi, category, color, pollutant = overall_aqi(values, standard)
+    return dict(values, aqi=None if aqi == OUT_OF_RANGE[0] else aqi, category=category, color=color,
+                pollutant=pollutant)
+
+
+def _encode(payload):
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def _number(value):
+    # A finite int or float (not bool), or None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return value
+
+
+class AQIService:
+    def __init__(self, api_key='', app_key='', host='127.0.0.1', port=DEFAULT_PORT,
+                 interval=DEFAULT_INTERVAL, api_url=None, http=None, poller_address=None,
+                 standard=DEFAULT_STANDARD):
+        self.api_key = api_key
+        self.app_key = app_key
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.api_url = api_url or API_URL
+        self.http = http or AsyncHTTPClient()
+        self.poller_address = poller_address
+        # AQI standard for readings and the default for /aqi
+        self.standard = standard
+        self.source = None  # 'poller' or 'direct' once readings are being fed
+        self.readings = {}  # mac -> latest reading
+        self.error = None
+        self.updated = None  # ms of the last update
+        self.updates = 0
+        self.requests = 0
+        self.metrics = Metrics()
+        self.server = None
+        self._readings_body = b'[]'
+        self._reading_bodies = {}
+        self._feed_task = None
+        self._handlers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.api_key and self.app_key:
+            self._feed_task = asyncio.ensure_future(self._feed())
+
+    async def run(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    def update(self, readings, error=None):
+        # Keeps the last good readings through errors; each device's JSON
+        # is encoded here, not per request
+        self.updated = int(time.time() * 1000)
+        self.updates += 1
+        self.error = error
+        if readings is None:
+            return
+        for reading in readings:
+            reading = dict(reading)
+            value = _number(reading.get('pm25'))
+            aqi, category, _ = aqi_from_pm25(value, self.standard) if value is not None else (None, None, None)
+            reading['aqi'] = None if aqi == OUT_OF_RANGE[0] else aqi
+            reading['aqi_category'] = category
+            self.readings[reading['mac']] = reading
+            self._reading_bodies[reading['mac']] = _encode(reading)
+        self._readings_body = b'[' + b','.join(self._reading_bodies.values()) + b']'
+
+    async def _feed(self):
+        subscriber = PollerSubscriber(self.poller_address)
+        if await subscriber.connect(key_id(self.api_key, self.app_key)):
+            self.source = 'poller'
+            async for readings, error in subscriber:
+                self.update(readings, error)
+        # No poller, or it stopped: poll directly
+        self.source = 'direct'
+        client = AmbientClient(self.api_key, self.app_key, http=self.http, api_url=self.api_url,
+                               metrics=self.metrics)
+        scheduler = RefreshScheduler(self.interval)
+        while True:
+            with self.metrics.span('fetch'):
+                readings, error = await client.fetch_readings()
+            self.metrics.inc('fetch_errors' if error else 'fetches')
+            if not scheduler.observe(readings, error) and not error:
+                self.metrics.inc('skipped_polls')
+            self.update(readings, error)
+            await asyncio.sleep(scheduler.next_delay())
+
+    def respond(self, method, path, query, body):
+        # Returns (status, body bytes)
+        standard = query.get('standard', [self.standard])[0]
+        if standard not in STANDARDS:
+            return 400, _encode({'error': f"standard must be one of {', '.join(STANDARDS)}"})
+        if path == '/aqi':
+            if method == 'GET':
+                values = {p: _number(query[p][0]) for p in pollutants(standard) if p in query}
+                for pollutant in values or ('pm25',):
+                    if values.get(pollutant) is None:
+                        return 400, _encode({'error': f"{pollutant} must be a number"})
+                if len(values) > 1:
+                    return 200, _encode(overall_result(values, standard))
+                (pollutant, value), = values.items()
+                return 200, _encode(aqi_result(value, pollutant, standard))
+            if method == 'POST':
+                pollutant = query.get('pollutant', ['pm25'])[0]
+                if pollutant not in pollutants(standard):
+                    return 400, _encode({'error': f"pollutant must be one of {', '.join(pollutants(standard))}"})
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    return 400, _encode({'error': "body must be JSON"})
+                if isinstance(data, list):
+                    values = [_number(v) for v in data]
+                    if any(v is None for v in values):
+                        return 400, _encode({'error': f"every {pollutant} value must be a number"})
+                    return 200, _encode(aqi_results(values, pollutant, standard))
+                value = _number(data)
+                if value is None:
+                    return 400, _encode({'error': "body must be a number or an array of numbers"})
+                return 200, _encode(aqi_result(value, pollutant, standard))
+            return 405, _encode({'error': "use GET or POST"})
+        if method != 'GET':
+            return 405, _encode({'error': "use GET"})
+        if path == '/aqi/details':
+            value = _number(query.get('pm25', [''])[0])
+            if value is None:
+                return 400, _encode({'error': "pm25 must be a number"})
+            return 200, _encode({'pm25': value, 'category': aqi_from_pm25(value, standard)[1],
+                                 'text': aqi_details_text(value, standard)})
+        if path == '/readings':
+            return 200, self._readings_body
+        if path.startswith('/readings/'):
+            encoded = self._reading_bodies.get(unquote(path[len('/readings/'):]))
+            if encoded is None:
+                return 404, _encode({'error': "no reading for that device"})
+            return 200, encoded
+        if path == '/status':
+            return 200, _encode({
+                'source': self.source,
+                'devices': len(self.readings),
+                'updated': self.updated,
+                'updates': self.updates,
+                'error': self.error,
+                'requests': self.requests,
+            })
+        if path == '/metrics':
+            self.metrics.counters['requests'] = self.requests
+            return 200, self.metrics.render().encode()
+        return 404, _encode({'error': "not found"})
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    break
+                keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                self.requests += 1
+                if length > MAX_BODY:
+                    status, body, keep = 413, _encode({'error': "request body too large"}), False
+                else:
+                    payload = await reader.readexactly(length) if length else b''
+                    parts = urlsplit(target)
+                    with self.metrics.span('respond'):
+                        status, body = self.respond(method, parts.path, parse_qs(parts.query), payload)
+                content_type = METRICS_TYPE if status == 200 and target.startswith('/metrics') else 'application/json'
+                head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                        f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n")
+                writer.write(head.encode('latin-1') + body)
+                await writer.drain()
+                if not keep:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def close(self):
+        if self._feed_task is not None:
+            self._feed_task.cancel()
+            await asyncio.gather(self._feed_task, return_exceptions=True)
+            self._feed_task = None
+        if self.server is not None:
+            self.server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        self.http.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve AQI conversion and the latest Ambient Weather readings over local HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between polls")
+    parser.add_argument('--poller', default=None, help="shared poller address to subscribe to")
+    parser.add_argument('--standard', choices=tuple(STANDARDS), default=DEFAULT_STANDARD,
+                        help="AQI standard for readings and the default for /aqi (default: %(default)s)")
+    args = parser.parse_args(argv)
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    api_key = os.getenv('AMBIENT_API_KEY', '')
+    app_key = os.getenv('AMBIENT_APP_KEY', '')
+    service = AQIService(api_key, app_key, args.host, args.port, args.interval,
+                         api_url=os.getenv('AMBIENT_API_URL'), poller_address=args.poller, standard=args.standard)
+    if not api_key or not app_key:
+        print("AMBIENT_API_KEY and AMBIENT_APP_KEY are not set; serving AQI conversion only.", file=sys.stderr)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# AQI standards: category names, colors and breakpoint tables per
+# pollutant. aqi.py builds its lookup tables from these; nothing else
+# reads them directly.
+#
+# key -> (name, rounding, categories, colors, health statements, pollutants)
+#   rounding    how the interpolated index becomes an integer: 'round'
+#               (half up), 'ceil' or 'trunc'
+#   statements  (sensitive groups, health effects, cautionary statement)
+#               per category, or None
+#   pollutants  pollutant -> (unit, decimals, bands). Concentrations are
+#               truncated to `decimals` places before lookup.
+#   bands       (c_lo, c_hi, i_lo, i_hi, category index). Tables whose
+#               bands share endpoints put the endpoint in the lower band.
+#
+# Ozone is the 8-hour average everywhere. Where a standard leaves its top
+# band open ("250+"), the band continues the slope of the one below for
+# one more band, as the CPCB calculator does for India's particulates.
+
+US_CATEGORIES = (
+    "Good", "Moderate", "Unhealthy for Sensitive Groups", "Unhealthy", "Very Unhealthy", "Hazardous",
+)
+US_COLORS = ("#43a047", "#fbc02d", "#fb8c00", "#e53935", "#8e24aa", "#6d4c41")
+
+US_HEALTH_STATEMENTS = (
+    ("None", "No health implications.", "Everyone can continue their outdoor activities normally."),
+    ("Extremely sensitive individuals", "May cause mild respiratory symptoms in extremely sensitive people.", "Good air quality is expected."),
+    ("People with respiratory or heart disease, the elderly and children", "Increasing likelihood of respiratory symptoms in sensitive individuals, aggravation of heart or lung disease and premature mortality in persons with cardiopulmonary disease and the elderly.", "People with respiratory or heart disease, the elderly and children should limit prolonged exertion."),
+    ("Everyone may begin to experience health effects", "Increased respiratory symptom, reduced exercise tolerance in persons with heart or lung disease; increased likelihood of symptoms in sensitive individuals.", "People with heart or lung disease, children and older adults should limit prolonged outdoor exertion; everyone else should limit prolonged outdoor exertion."),
+    ("People with respiratory or heart disease, the elderly and children", "Significant increase in respiratory symptoms and reduced exercise tolerance in persons with heart or lung disease; increased likelihood of symptoms in sensitive individuals.", "People with heart or lung disease, elderly, children and people of lower socioeconomic status should avoid all outdoor exertion; everyone else should limit outdoor exertion."),
+    ("The entire population", "Health alert: The risk of health effects is increased for everyone.", "Everyone should avoid all outdoor exertion."),
+    ("The entire population", "Health warnings of emergency conditions. The entire population is more likely to be affected.", "Everyone should avoid all physical activity outdoors."),
+)
+
+US_O3 = ('ppm', 3, (
+    (0.000, 0.054, 0, 50, 0),
+    (0.055, 0.070, 51, 100, 1),
+    (0.071, 0.085, 101, 150, 2),
+    (0.086, 0.105, 151, 200, 3),
+    (0.106, 0.200, 201, 300, 4),
+))
+
+STANDARDS = {
+    # EPA's 2024 PM NAAQS revision: "Good" ends at 9.0 and Hazardous spans
+    # 301-500
+    'us': ("US EPA (2024)", 'round', US_CATEGORIES, US_COLORS, US_HEALTH_STATEMENTS[:6], {
+        'pm25': ('μg/m³', 1, (
+            (0.0, 9.0, 0, 50, 0),
+            (9.1, 35.4, 51, 100, 1),
+            (35.5, 55.4, 101, 150, 2),
+            (55.5, 125.4, 151, 200, 3),
+            (125.5, 225.4, 201, 300, 4),
+            (225.5, 325.4, 301, 500, 5),
+        )),
+        'pm10': ('μg/m³', 0, (
+            (0, 54, 0, 50, 0),
+            (55, 154, 51, 100, 1),
+            (155, 254, 101, 150, 2),
+            (255, 354, 151, 200, 3),
+            (355, 424, 201, 300, 4),
+            (425, 604, 301, 500, 5),
+        )),
+        'o3': US_O3,
+    }),
+    # The table before 2024, truncated to an integer as earlier releases of
+    # this app did, for comparing with old exports
+    'us-2012': ("US EPA (before 2024)", 'trunc', US_CATEGORIES + ("Beyond AQI",), US_COLORS + ("#212121",),
+                US_HEALTH_STATEMENTS, {
+        'pm25': ('μg/m³', 1, (
+            (0.0, 12.0, 0, 50, 0),
+            (12.1, 35.4, 51, 100, 1),
+            (35.5, 55.4, 101, 150, 2),
+            (55.5, 150.4, 151, 200, 3),
+            (150.5, 250.4, 201, 300, 4),
+            (250.5, 350.4, 301, 400, 5),
+            (350.5, 500.4, 401, 500, 6),
+        )),
+        'pm10': ('μg/m³', 0, (
+            (0, 54, 0, 50, 0),
+            (55, 154, 51, 100, 1),
+            (155, 254, 101, 150, 2),
+            (255, 354, 151, 200, 3),
+            (355, 424, 201, 300, 4),
+            (425, 504, 301, 400, 5),
+            (505, 604, 401, 500, 6),
+        )),
+        'o3': US_O3,
+    }),
+    # HJ 633-2012. Sub-indices are rounded up.
+    'cn': ("China AQI (HJ 633-2012)", 'ceil',
+           ("Excellent", "Good", "Lightly Polluted", "Moderately Polluted", "Heavily Polluted", "Severely Polluted"),
+           US_COLORS, None, {
+        'pm25': ('μg/m³', 0, (
+            (0, 35, 0, 50, 0),
+            (35, 75, 50, 100, 1),
+            (75, 115, 100, 150, 2),
+            (115, 150, 150, 200, 3),
+            (150, 250, 200, 300, 4),
+            (250, 350, 300, 400, 5),
+            (350, 500, 400, 500, 5),
+        )),
+        'pm10': ('μg/m³', 0, (
+            (0, 50, 0, 50, 0),
+            (50, 150, 50, 100, 1),
+            (150, 250, 100, 150, 2),
+            (250, 350, 150, 200, 3),
+            (350, 420, 200, 300, 4),
+            (420, 500, 300, 400, 5),
+            (500, 600, 400, 500, 5),
+        )),
+        'o3': ('μg/m³', 0, (
+            (0, 100, 0, 50, 0),
+            (100, 160, 50, 100, 1),
+            (160, 215, 100, 150, 2),
+            (215, 265, 150, 200, 3),
+            (265, 800, 200, 300, 4),
+        )),
+    }),
+    # CPCB National AQI
+    'in': ("India NAQI", 'round', ("Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"),
+           ("#2e7d32", "#9ccc65", "#fdd835", "#fb8c00", "#e53935", "#b71c1c"), None, {
+        'pm25': ('μg/m³', 0, (
+            (0, 30, 0, 50, 0),
+            (31, 60, 51, 100, 1),
+            (61, 90, 101, 200, 2),
+            (91, 120, 201, 300, 3),
+            (121, 250, 301, 400, 4),
+            (251, 380, 401, 500, 5),
+        )),
+        'pm10': ('μg/m³', 0, (
+            (0, 50, 0, 50, 0),
+            (51, 100, 51, 100, 1),
+            (101, 250, 101, 200, 2),
+            (251, 350, 201, 300, 3),
+            (351, 430, 301, 400, 4),
+            (431, 510, 401, 500, 5),
+        )),
+        'o3': ('μg/m³', 0, (
+            (0, 50, 0, 50, 0),
+            (51, 100, 51, 100, 1),
+            (101, 168, 101, 200, 2),
+            (169, 208, 201, 300, 3),
+            (209, 748, 301, 400, 4),
+            (749, 1288, 401, 500, 5),
+        )),
+    }),
+    # Common Air Quality Index, hourly background grid
+    'eu': ("EU CAQI", 'round', ("Very Low", "Low", "Medium", "High", "Very High"),
+           ("#79bc6a", "#bbcf4c", "#eec20b", "#f29305", "#e8416f"), None, {
+        'pm25': ('μg/m³', 0, (
+            (0, 15, 0, 25, 0),
+            (15, 30, 25, 50, 1),
+            (30, 55, 50, 75, 2),
+            (55, 110, 75, 100, 3),
+            (110, 165, 100, 125, 4),
+        )),
+        'pm10': ('μg/m³', 0, (
+            (0, 25, 0, 25, 0),
+            (25, 50, 25, 50, 1),
+            (50, 90, 50, 75, 2),
+            (90, 180, 75, 100, 3),
+            (180, 270, 100, 125, 4),
+        )),
+        'o3': ('μg/m³', 0, (
+            (0, 60, 0, 25, 0),
+            (60, 120, 25, 50, 1),
+            (120, 180, 50, 75, 2),
+            (180, 240, 75, 100, 3),
+            (240, 300, 100, 125, 4),
+        )),
+    }),
+}
+
+POLLUTANT_LABELS = {'pm25': "PM2.5", 'pm10': "PM10", 'o3': "O3 (8-hour)"}
@@ -0,0 +1,71 @@
+# Recent PM2.5 and temperature per station for the trend charts: one
+# RingBuffer of up to 30 days of one-minute samples each. A station is
+# seeded from stored history the first time it is seen, then each poll
+# appends one sample. The seed reads history at the resolution the charts
+# can show: the last day of readings, 5-minute rollup means for the rest of
+# the week and hourly means before that, about 3,700 rows for 30 days
+# instead of 43,200.
+from .ringbuffer import DAY_MS, RingBuffer
+from .rolling import MIN_INTERVAL_MS
+from .rollup import LEVELS
+
+TREND_FIELDS = ('pm25', 'tempf')
+DEFAULT_DAYS = 30
+# (level, how far back from the newest sample it is used), finest first
+SEED_LEVELS = (('raw', DAY_MS), ('5m', 7 * DAY_MS), ('1h', None))
+
+
+class TrendTracker:
+    def __init__(self, store=None, days=DEFAULT_DAYS, fields=TREND_FIELDS):
+        self.store = store
+        self.span_ms = days * DAY_MS
+        self.fields = tuple(fields)
+        self.buffers = {}  # mac -> RingBuffer
+
+    def update(self, readings):
+        for reading in readings:
+            ts = reading.get('dateutc')
+            if ts is None:
+                continue
+            buffer = self.buffer(reading.get('mac'), ts)
+            last = buffer.latest_ts()
+            # Realtime pushes can come faster than once a minute
+            if last is None or ts - last >= MIN_INTERVAL_MS:
+                buffer.append(ts, reading)
+        return readings
+
+    def buffer(self, mac, end=None):
+        # The station's RingBuffer, created and seeded with the history
+        # before end on first use
+        buffer = self.buffers.get(mac)
+        if buffer is None:
+            buffer = self.buffers[mac] = RingBuffer(self.fields, self.span_ms // MIN_INTERVAL_MS + 1)
+            self._seed(buffer, mac, end)
+        return buffer
+
+    def _seed(self, buffer, mac, end):
+        if self.store is None or end is None:
+            return
+        start = end - self.span_ms
+        sizes = dict(LEVELS)
+        chunks = []
+        hi = end
+        for (level, age), (coarser, _) in zip(SEED_LEVELS, SEED_LEVELS[1:] + ((None, None),)):
+            # Each level starts where the next coarser one's whole buckets end
+            lo = start if coarser is None else max(start, (end - age) // sizes[coarser] * sizes[coarser])
+            if hi > lo:
+                _, series = self.store.series(mac, lo, hi, self.fields, level=level)
+                # (ts, mean per field) from (ts, n, min, max, mean per field)
+                chunks.append([(row[0],) + row[4::3] for row in series])
+            hi = lo
+        rows = [row for chunk in reversed(chunks) for row in chunk]
+        if not rows:
+            return
+        import numpy as np
+
+        # None becomes NaN
+        data = np.array(rows, dtype=np.float64)
+        ts = data[:, 0].astype(np.int64)
+        # Keep history at most one sample a minute, as live updates are
+        keep = np.concatenate(([True], np.diff(ts // MIN_INTERVAL_MS) > 0))
+        buffer.extend(ts[keep], data[keep, 1:])
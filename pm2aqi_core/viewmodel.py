@@ -0,0 +1,50 @@
+# Differential widget updates for the front-ends.
+#
+# A view is a plain dict {(widget_name, prop): value} computed from a
+# reading. ViewModel remembers what it last rendered and calls only the
+# setters whose value changed, so a refresh where nothing moved touches no
+# widget, and a stylesheet is only re-parsed when the color really changes.
+# Qt already coalesces the resulting repaints into one pass per event-loop
+# iteration. Widgets are duck-typed: nothing here imports Qt.
+
+SETTERS = {
+    'text': 'setText',
+    'style': 'setStyleSheet',
+    'tooltip': 'setToolTip',
+    'visible': 'setVisible',
+}
+
+
+class ViewModel:
+    # widgets: {name: widget}
+    def __init__(self, widgets):
+        self.widgets = widgets
+        self.rendered = {}
+        self.applied = 0
+        self.skipped = 0
+
+    def diff(self, view):
+        # The (name, prop, value) entries of view that differ from what is shown
+        rendered = self.rendered
+        return [(name, prop, value) for (name, prop), value in view.items()
+                if rendered.get((name, prop), _UNSET) != value]
+
+    def apply(self, view):
+        changes = self.diff(view)
+        self.skipped += len(view) - len(changes)
+        for name, prop, value in changes:
+            getattr(self.widgets[name], SETTERS[prop])(value)
+            self.rendered[(name, prop)] = value
+        self.applied += len(changes)
+        return len(changes)
+
+    def reset(self, *keys):
+        # Forget what was rendered, for all properties or the given
+        # (name, prop) keys, after something else has changed the widgets
+        if not keys:
+            self.rendered.clear()
+        for key in keys:
+            self.rendered.pop(key, None)
+
+
+_UNSET = object()
@@ -0,0 +1,132 @@
+# Minimal asyncio WebSocket client (RFC 6455) for the realtime feed.
+# Stdlib only, like http.py. Text messages only; pings are answered and
+# fragmented messages reassembled.
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+from .http import USER_AGENT
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE = 16 * 1024 * 1024
+
+OP_CONTINUATION, OP_TEXT, OP_BINARY = 0x0, 0x1, 0x2
+OP_CLOSE, OP_PING, OP_PONG = 0x8, 0x9, 0xA
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+async def connect(url, headers=None):
+    parts = urlsplit(url)
+    secure = parts.scheme in ('wss', 'https')
+    port = parts.port or (443 if secure else 80)
+    ssl_context = ssl.create_default_context() if secure else None
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=ssl_context, limit=MAX_MESSAGE)
+    target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    key = base64.b64encode(os.urandom(16)).decode()
+    lines = [
+        f"GET {target} HTTP/1.1",
+        f"Host: {host}",
+        f"User-Agent: {USER_AGENT}",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Key: {key}",
+        "Sec-WebSocket-Version: 13",
+    ]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+    try:
+        status_line = await reader.readline()
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        status = status_line.decode('latin-1').split(' ', 2)[1:2]
+        if status != ['101']:
+            raise WebSocketClosed(f"handshake failed: {status_line.decode('latin-1').strip()}")
+        expected = base64.b64encode(hashlib.sha1(key.encode() + _GUID).digest()).decode()
+        if response_headers.get('sec-websocket-accept') != expected:
+            raise WebSocketClosed("handshake failed: bad Sec-WebSocket-Accept")
+    except BaseException:
+        writer.close()
+        raise
+    return WebSocket(reader, writer)
+
+
+class WebSocket:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def recv(self):
+        # Next complete text message; raises WebSocketClosed at the end
+        parts = []
+        while True:
+            try:
+                head = await self.reader.readexactly(2)
+                fin, opcode = head[0] & 0x80, head[0] & 0x0F
+                length = head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+                if length > MAX_MESSAGE:
+                    raise WebSocketClosed(f"frame too large: {length} bytes")
+                mask = await self.reader.readexactly(4) if head[1] & 0x80 else None
+                payload = await self.reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                raise WebSocketClosed(str(e) or "connection lost") from e
+            if mask:
+                payload = _mask(payload, mask)
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+            elif opcode == OP_CLOSE:
+                raise WebSocketClosed("closed by server")
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                parts.append(payload)
+                if fin:
+                    return b''.join(parts).decode('utf-8')
+
+    async def send(self, text):
+        self._send_frame(OP_TEXT, text.encode('utf-8'))
+        await self.writer.drain()
+
+    def _send_frame(self, opcode, payload):
+        # Client frames are always masked
+        length = len(payload)
+        if length < 126:
+            head = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            head = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        self.writer.write(head + mask + _mask(payload, mask))
+
+    def close(self):
+        if not self.writer.is_closing():
+            try:
+                self._send_frame(OP_CLOSE, b'')
+            except Exception:
+                pass
+            self.writer.close()
+
+
+def _mask(payload, mask):
+    # XOR the whole payload at once as one big integer
+    n = len(payload)
+    if not n:
+        return payload
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
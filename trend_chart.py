@@ -0,0 +1,188 @@
+# Trend chart for the calculator: PM2.5, AQI or outdoor temperature of one
+# station over the last day, week or 30 days, painted from a TrendTracker
+# buffer with QPainter.
+#
+# The series is rendered once into a pixmap. The window's samples are
+# reduced with LTTB to about two points per horizontal pixel and drawn as
+# one polyline. The time axis runs a little past the newest sample, so each
+# later sample is drawn onto the pixmap as one segment and only those few
+# pixels are repainted. The pixmap is rebuilt when the source, series, span
+# or size changes, or when a new sample falls outside the axes. NumPy and
+# the downsampler are imported on the first paint, not at startup.
+from datetime import datetime
+
+from PyQt6.QtCore import QPointF, QRectF, Qt
+from PyQt6.QtGui import QColor, QFont, QPainter, QPen, QPixmap, QPolygonF
+from PyQt6.QtWidgets import QSizePolicy, QWidget
+
+from pm2aqi_core.aqi import DEFAULT_STANDARD, aqi_from_pm25_array
+from pm2aqi_core.formatting import zone
+from pm2aqi_core.ringbuffer import DAY_MS
+
+SERIES = (('pm25', "PM2.5 (μg/m³)"), ('aqi', "AQI"), ('tempf', "Outdoor Temp (°F)"))
+SPANS = (("24 hours", DAY_MS), ("7 days", 7 * DAY_MS), ("30 days", 30 * DAY_MS))
+# Share of the span left free after the newest sample for later ones
+HEADROOM = 0.05
+# Points kept per horizontal pixel after downsampling
+POINTS_PER_PIXEL = 2
+# left, top, right, bottom
+MARGINS = (40, 8, 10, 18)
+LINE_COLOR = "#1976d2"
+# Qt strokes antialiased lines up to 1 px wide on a fast path; a 1.5 px
+# polyline of 1,600 points takes about 60 times as long
+LINE_WIDTH = 1.0
+GRID_COLOR = "#e0e0e0"
+TEXT_COLOR = "#555"
+
+
+def series_points(ts, values, fields, series, standard=DEFAULT_STANDARD):
+    # (x, y) float arrays for series from buffer rows, without missing values
+    import numpy as np
+
+    if series == 'aqi':
+        aqi, idx, _ = aqi_from_pm25_array(values[:, fields.index('pm25')], standard)
+        y = np.where(idx >= 0, aqi, np.nan)
+    else:
+        y = values[:, fields.index(series)]
+    present = ~np.isnan(y)
+    return ts[present].astype(np.float64), np.asarray(y[present], dtype=np.float64)
+
+
+class TrendChart(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(180)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.label_font = QFont("Arial", 8)
+        self.buffer = None
+        self.series = SERIES[0][0]
+        self.span_ms = SPANS[0][1]
+        self.standard = DEFAULT_STANDARD
+        self.pixmap = None
+        self.axes = None  # (x0, x1, y0, y1) of the pixmap
+        self.drawn_seq = 0  # buffer.end_seq when the pixmap was last drawn
+        self.last_point = None
+        # Counts for the benchmark
+        self.rebuilds = 0
+        self.appends = 0
+
+    def set_source(self, buffer, series=None, span_ms=None, standard=None):
+        # Redraws only if something changed; otherwise adds new samples
+        series = series or self.series
+        span_ms = span_ms or self.span_ms
+        standard = standard or self.standard
+        if (buffer, series, span_ms, standard) != (self.buffer, self.series, self.span_ms, self.standard):
+            self.buffer, self.series, self.span_ms, self.standard = buffer, series, span_ms, standard
+            self.invalidate()
+        else:
+            self.refresh()
+
+    def invalidate(self):
+        self.pixmap = None
+        self.update()
+
+    def refresh(self):
+        # Draws the samples appended to the buffer since the last paint
+        buffer = self.buffer
+        if self.pixmap is None or buffer is None or buffer.end_seq == self.drawn_seq:
+            return
+        new = buffer.end_seq - self.drawn_seq
+        if new > len(buffer) or self.axes is None:
+            self.invalidate()
+            return
+        x, y = series_points(*buffer.tail(new), buffer.fields, self.series, self.standard)
+        self.drawn_seq = buffer.end_seq
+        if not len(x):
+            return
+        x0, x1, y0, y1 = self.axes
+        if x[-1] > x1 or y.min() < y0 or y.max() > y1:
+            self.invalidate()
+            return
+        points = self.map_points(x, y)
+        if self.last_point is not None:
+            points.insert(0, self.last_point)
+        painter = QPainter(self.pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(QPen(QColor(LINE_COLOR), LINE_WIDTH))
+        painter.drawPolyline(QPolygonF(points))
+        painter.end()
+        self.last_point = points[-1]
+        self.appends += 1
+        self.update(QPolygonF(points).boundingRect().adjusted(-2, -2, 2, 2).toAlignedRect())
+
+    def plot_rect(self):
+        left, top, right, bottom = MARGINS
+        return QRectF(left, top, max(1, self.width() - left - right), max(1, self.height() - top - bottom))
+
+    def map_points(self, x, y):
+        x0, x1, y0, y1 = self.axes
+        plot = self.plot_rect()
+        px = plot.left() + (x - x0) * (plot.width() / (x1 - x0))
+        py = plot.bottom() - (y - y0) * (plot.height() / (y1 - y0))
+        return [QPointF(a, b) for a, b in zip(px.tolist(), py.tolist())]
+
+    def rebuild(self):
+        self.rebuilds += 1
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QColor("#fff"))
+        self.pixmap = pixmap
+        self.axes = None
+        self.last_point = None
+        buffer = self.buffer
+        self.drawn_seq = buffer.end_seq if buffer is not None else 0
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setFont(self.label_font)
+        x = y = ()
+        if buffer is not None and len(buffer):
+            newest = buffer.latest_ts()
+            ts, values = buffer.window(newest - self.span_ms + 1)
+            x, y = series_points(ts, values, buffer.fields, self.series, self.standard)
+        if not len(x):
+            painter.setPen(QColor(TEXT_COLOR))
+            painter.drawText(QRectF(self.rect()), Qt.AlignmentFlag.AlignCenter, "No trend data yet")
+            painter.end()
+            return
+        lo, hi = float(y.min()), float(y.max())
+        pad = (hi - lo) * 0.1 or 1.0
+        x1 = newest + self.span_ms * HEADROOM
+        self.axes = (x1 - self.span_ms * (1 + HEADROOM), x1, lo - pad, hi + pad)
+        self.draw_axes(painter)
+        from pm2aqi_core.downsample import lttb
+
+        keep = lttb(x, y, int(self.plot_rect().width() * POINTS_PER_PIXEL))
+        points = self.map_points(x[keep], y[keep])
+        painter.setPen(QPen(QColor(LINE_COLOR), LINE_WIDTH))
+        painter.drawPolyline(QPolygonF(points))
+        painter.end()
+        self.last_point = points[-1]
+
+    def draw_axes(self, painter):
+        x0, x1, y0, y1 = self.axes
+        plot = self.plot_rect()
+        decimals = 1 if y1 - y0 < 10 else 0
+        for i in range(3):
+            value = y0 + (y1 - y0) * i / 2
+            py = plot.bottom() - plot.height() * i / 2
+            painter.setPen(QColor(GRID_COLOR))
+            painter.drawLine(QPointF(plot.left(), py), QPointF(plot.right(), py))
+            painter.setPen(QColor(TEXT_COLOR))
+            painter.drawText(QRectF(0, py - 8, plot.left() - 4, 16),
+                             Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, f"{value:.{decimals}f}")
+        fmt = '%H:%M' if self.span_ms <= DAY_MS else '%b %d'
+        for ms, align in ((x0, Qt.AlignmentFlag.AlignLeft), (x1, Qt.AlignmentFlag.AlignRight)):
+            text = datetime.fromtimestamp(ms / 1000, zone()).strftime(fmt)
+            painter.drawText(QRectF(plot.left(), plot.bottom() + 2, plot.width(), 16), align, text)
+
+    def resizeEvent(self, event):
+        self.pixmap = None
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        if self.pixmap is None:
+            self.rebuild()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.pixmap)
+        painter.end()